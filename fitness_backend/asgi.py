@@ -9,8 +9,29 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.views.static import serve
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fitness_backend.settings")
 
-application = get_asgi_application()
+
+class CollectedStaticFilesHandler(ASGIStaticFilesHandler):
+    """
+    Serves STATIC_URL from STATIC_ROOT. WhiteNoise's middleware is sync-only and
+    left out in ASGI mode; the files are read from the collectstatic output rather
+    than the finders, so the manifest's hashed names resolve.
+    """
+
+    def serve(self, request):
+        try:
+            return serve(request, self.file_path(request.path), document_root=settings.STATIC_ROOT)
+        except SuspiciousFileOperation:
+            # A path escaping STATIC_ROOT; only Http404 is turned into a response here
+            raise Http404
+
+
+application = CollectedStaticFilesHandler(get_asgi_application())
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'whatsapp_bot.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,6 +64,13 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
 ]
 
+# Under ASGI every sync-only middleware pins a thread per request, which defeats
+# the async webhook. WhiteNoise 6.6 is sync-only, so it is left out in ASGI mode
+# and asgi.py serves the static files instead.
+ASGI_MODE = env.bool('ASGI_MODE', default=False)
+if ASGI_MODE:
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'fitness_backend.urls'
 
 TEMPLATES = [
@@ -171,6 +179,8 @@ LOGGING = {
 # Django Cron Settings
 CRON_CLASSES = [
     'whatsapp_bot.cron.ProcessPendingWorkoutMessagesCronJob',
+    'whatsapp_bot.cron.DispatchOutboxCronJob',
+    'whatsapp_bot.cron.PurgeLLMCacheCronJob',
     # 'whatsapp_bot.cron.SendEODWorkoutSummariesCronJob',
     # 'whatsapp_bot.cron.SendEOWWorkoutSummariesCronJob',  
 ]
@@ -12,7 +12,32 @@ python manage.py migrate
 echo "Starting cron daemon..."
 cron
 
+# Start the outbox dispatcher that sends template messages
+echo "Starting outbox dispatcher..."
+python manage.py dispatch_outbox &
+
+# Start the message queue workers when the webhook runs in queue mode
+if [ "${WEBHOOK_QUEUE_MODE,,}" = "true" ]; then
+    echo "Starting message queue workers..."
+    python manage.py process_message_queue &
+fi
+
 # Start Gunicorn with optimized settings
+if [ "${ASGI_MODE,,}" = "true" ]; then
+    echo "Starting Gunicorn with ASGI workers..."
+    exec gunicorn fitness_backend.asgi:application \
+        --bind 0.0.0.0:8000 \
+        --workers 2 \
+        --worker-class=uvicorn.workers.UvicornWorker \
+        --worker-tmp-dir /dev/shm \
+        --max-requests 500 \
+        --max-requests-jitter 50 \
+        --timeout 180 \
+        --log-level=info \
+        --backlog=2048 \
+        --keep-alive=5
+fi
+
 echo "Starting Gunicorn..."
 exec gunicorn fitness_backend.wsgi:application \
     --bind 0.0.0.0:8000 \
@@ -1,9 +1,9 @@
 from django.contrib import admin
-from .models import WhatsAppUser, RawMessage, BodyHistory, WorkoutSession, Exercise, ProgressPhoto
+from .models import WhatsAppUser, RawMessage, BodyHistory, WorkoutSession, Exercise, ProgressPhoto, MessageJob
 
 @admin.register(WhatsAppUser)
 class WhatsAppUserAdmin(admin.ModelAdmin):
-    list_display = ('phone_number', 'name', 'created_at', 'last_interaction')
+    list_display = ('phone_number', 'name', 'onboarding_state', 'created_at', 'last_interaction')
     search_fields = ('phone_number', 'name')
 
 @admin.register(RawMessage)
@@ -35,3 +35,9 @@ class ProgressPhotoAdmin(admin.ModelAdmin):
     list_display = ('user', 'created_at', 'media_id')
     list_filter = ('created_at',)
     search_fields = ('user__phone_number', 'user__name')
+
+@admin.register(MessageJob)
+class MessageJobAdmin(admin.ModelAdmin):
+    list_display = ('raw_message', 'status', 'attempts', 'messages_sent', 'created_at', 'processed_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('raw_message__user__phone_number',)
@@ -0,0 +1,166 @@
+import importlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List
+from ..services import logger_service
+from ..utils.config import LLAMA_MODEL_PATH, LLAMA_N_CTX, LLAMA_N_THREADS, LLAMA_PROMPT_LOOKUP_TOKENS, LLAMA_CACHE_BYTES
+from ..utils.config import LLM_TIMEOUT_SECONDS
+
+# LLM client libraries and clients, created on first use instead of at import.
+# Importing litellm, google.generativeai and ollama costs every web worker and
+# every `manage.py runcrons` run time and memory, even when it never calls an LLM.
+# Instances are dropped in a forked child, so a pre-forking server never shares
+# its parent's connections or background threads.
+
+logger = logger_service.get_logger()
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, factory: Callable[[], Any]) -> None:
+    """Register a factory creating the backend `name` on first use"""
+    _factories[name] = factory
+
+
+def get(name: str) -> Any:
+    """
+    The backend `name`, created by its factory the first time it is asked for
+    Raises:
+        KeyError: If no backend is registered under `name`
+    """
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        instance = _instances.get(name)
+        if instance is None:
+            started = time.perf_counter()
+            instance = _factories[name]()
+            _instances[name] = instance
+            logger.info(f"Loaded LLM backend {name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return instance
+
+
+def loaded() -> list:
+    """Names of the backends created in this process"""
+    return list(_instances)
+
+
+def load_all() -> None:
+    """Create every registered backend, for warming up a process or benchmarking"""
+    for name in list(_factories):
+        get(name)
+
+
+def reset() -> None:
+    """Drop the created backends; they are created again on next use"""
+    with _lock:
+        _instances.clear()
+
+
+def _after_fork() -> None:
+    global _lock
+    # The parent's lock may have been held by another thread at fork time
+    _lock = threading.Lock()
+    _instances.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _ollama_host() -> str:
+    return f"http://{os.getenv('OLLAMA_HOST', 'localhost')}:{os.getenv('OLLAMA_PORT', '11434')}"
+
+
+def _genai():
+    genai = importlib.import_module('google.generativeai')
+    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    return genai
+
+
+def _ollama_client():
+    from ollama import Client
+    # The router stops waiting at a request's deadline; this bounds the call itself
+    return Client(host=_ollama_host(), timeout=LLM_TIMEOUT_SECONDS)
+
+
+def _ollama_async_client():
+    from ollama import AsyncClient
+    return AsyncClient(host=_ollama_host(), timeout=LLM_TIMEOUT_SECONDS)
+
+
+class LlamaClassifier:
+    """
+    A llama.cpp model in this process. The GGUF file is memory-mapped, so every
+    worker on the host shares one copy of the weights through the page cache.
+    A Llama context runs one completion at a time, hence the lock.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.lock = threading.Lock()
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """
+        Greedy chat completion. The KV state of the previous call is kept, so a
+        prompt starting with the same system prompt only evaluates the new tokens.
+        """
+        with self.lock:
+            response = self.llm.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=0)
+        return response['choices'][0]['message']['content']
+
+
+def _llama_classifier():
+    from llama_cpp import Llama, LlamaRAMCache
+    from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+    llm = Llama(
+        model_path=LLAMA_MODEL_PATH,
+        n_ctx=LLAMA_N_CTX,
+        n_threads=LLAMA_N_THREADS,
+        use_mmap=True,
+        # Labels are copied from the prompt, so lookup drafts are usually accepted
+        draft_model=LlamaPromptLookupDecoding(num_pred_tokens=LLAMA_PROMPT_LOOKUP_TOKENS),
+        verbose=False,
+    )
+    # Saved KV states by prompt prefix, for prompts that don't extend the last one
+    llm.set_cache(LlamaRAMCache(capacity_bytes=LLAMA_CACHE_BYTES))
+    return LlamaClassifier(llm)
+
+
+register('litellm', lambda: importlib.import_module('litellm'))
+register('genai', _genai)
+register('ollama', _ollama_client)
+register('ollama_async', _ollama_async_client)
+register('llama_classifier', _llama_classifier)
+# Imported on use: the module is also what the pool's spawned processes import
+register('llama_extraction_pool', lambda: importlib.import_module(f"{__package__}.local_extraction").create_pool())
+
+
+def litellm():
+    """The litellm module"""
+    return get('litellm')
+
+
+def genai():
+    """google.generativeai, configured with GEMINI_API_KEY"""
+    return get('genai')
+
+
+def ollama_client():
+    return get('ollama')
+
+
+def ollama_async_client():
+    return get('ollama_async')
+
+
+def llama_classifier() -> LlamaClassifier:
+    return get('llama_classifier')
+
+
+def llama_extraction_pool():
+    """Process pool running workout extraction on the local GGUF model"""
+    return get('llama_extraction_pool')
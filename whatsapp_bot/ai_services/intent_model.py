@@ -0,0 +1,224 @@
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .intents import MessageIntent
+from ..services import logger_service
+from ..utils.config import INTENT_MODEL_PATH
+
+logger = logger_service.get_logger()
+
+LABELS = [intent.value for intent in MessageIntent]
+LABEL_INDEX = {label: i for i, label in enumerate(LABELS)}
+
+NGRAM_SIZES = (1, 2, 3, 4)
+DEFAULT_BUCKETS = 1 << 14
+MAX_CHARS = 300
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, map every number to 0 and collapse whitespace, so '3x10' and '4x8' share features"""
+    text = _DIGITS.sub('0', (text or '')[:MAX_CHARS].lower())
+    return _SPACES.sub(' ', text).strip()
+
+
+def featurize(text: str, buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash the character n-grams of a message into `buckets` features
+    Returns:
+        (indices, values) of the L2-normalised n-gram counts
+    """
+    padded = f" {normalize(text)} "
+    counts: Dict[int, int] = {}
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            # crc32 rather than hash(), which is salted per process
+            bucket = zlib.crc32(padded[i:i + n].encode()) % buckets
+            counts[bucket] = counts.get(bucket, 0) + 1
+    indices = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    values /= np.sqrt(np.dot(values, values))
+    return indices, values
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentModel:
+    """Linear softmax classifier over hashed character n-grams"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, buckets: int, trained_on: int = 0):
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.buckets = buckets
+        self.trained_on = trained_on
+
+    def predict(self, text: str) -> Tuple[MessageIntent, float]:
+        """
+        Classify a message
+        Returns:
+            (intent, confidence) where confidence is the softmax probability
+        """
+        indices, values = featurize(text, self.buckets)
+        probs = _softmax(values @ self.weights[indices] + self.bias)
+        best = int(probs.argmax())
+        return MessageIntent(LABELS[best]), float(probs[best])
+
+    def save(self, path: str) -> None:
+        """Write the artifact atomically, so running processes never load a partial file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f, weights=self.weights, bias=self.bias, labels=np.array(LABELS),
+                buckets=self.buckets, trained_on=self.trained_on
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IntentModel':
+        with np.load(path) as data:
+            if list(data['labels']) != LABELS:
+                raise ValueError(f"Intent model {path} was trained for labels {list(data['labels'])}")
+            return cls(data['weights'], data['bias'], int(data['buckets']), int(data['trained_on']))
+
+
+def train(texts: List[str], labels: List[str], buckets: int = DEFAULT_BUCKETS, epochs: int = 20,
+          learning_rate: float = 0.5, l2: float = 1e-6, batch_size: int = 64, seed: int = 0) -> IntentModel:
+    """
+    Fit the classifier with mini-batch AdaGrad on class-balanced softmax loss
+    Args:
+        texts: Message texts
+        labels: MessageIntent values, one per text
+    Returns:
+        Trained IntentModel
+    """
+    rows = [featurize(text, buckets) for text in texts]
+    y = np.array([LABEL_INDEX[label] for label in labels])
+    classes = len(LABELS)
+
+    # Weight each class inversely to its frequency, so rare intents still count
+    counts = np.bincount(y, minlength=classes).astype(np.float32)
+    class_weight = np.where(counts > 0, len(y) / (classes * np.maximum(counts, 1)), 0).astype(np.float32)
+
+    weights = np.zeros((buckets, classes), dtype=np.float32)
+    bias = np.zeros(classes, dtype=np.float32)
+    weights_g2 = np.full((buckets, classes), 1e-8, dtype=np.float32)
+    bias_g2 = np.full(classes, 1e-8, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+
+    for _ in range(epochs):
+        order = rng.permutation(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            indices = np.concatenate([rows[i][0] for i in batch])
+            values = np.concatenate([rows[i][1] for i in batch])
+            doc = np.repeat(np.arange(len(batch)), [len(rows[i][0]) for i in batch])
+
+            logits = np.zeros((len(batch), classes), dtype=np.float32)
+            np.add.at(logits, doc, values[:, None] * weights[indices])
+            delta = _softmax(logits + bias)
+            delta[np.arange(len(batch)), y[batch]] -= 1
+            delta *= (class_weight[y[batch]] / len(batch))[:, None]
+
+            touched, inverse = np.unique(indices, return_inverse=True)
+            grad = np.zeros((len(touched), classes), dtype=np.float32)
+            np.add.at(grad, inverse, values[:, None] * delta[doc])
+            grad += l2 * weights[touched]
+            weights_g2[touched] += grad ** 2
+            weights[touched] -= learning_rate * grad / np.sqrt(weights_g2[touched])
+
+            bias_grad = delta.sum(axis=0)
+            bias_g2 += bias_grad ** 2
+            bias -= learning_rate * bias_grad / np.sqrt(bias_g2)
+
+    return IntentModel(weights, bias, buckets, trained_on=len(rows))
+
+
+def evaluate(model: IntentModel, texts: List[str], labels: List[str], threshold: float) -> dict:
+    """
+    Score a model against reference labels
+    Returns:
+        dict with overall accuracy, the share of messages at or above `threshold`
+        (which skip the LLM) and their accuracy, per-class precision/recall and
+        mean inference time in microseconds
+    """
+    started = time.perf_counter()
+    predictions = [model.predict(text) for text in texts]
+    elapsed = time.perf_counter() - started
+
+    correct = [intent.value == label for (intent, _), label in zip(predictions, labels)]
+    confident = [confidence >= threshold for _, confidence in predictions]
+    per_class = {}
+    for label in LABELS:
+        predicted = [intent.value == label for intent, _ in predictions]
+        actual = [gold == label for gold in labels]
+        hits = sum(p and a for p, a in zip(predicted, actual))
+        per_class[label] = {
+            'support': sum(actual),
+            'precision': round(hits / sum(predicted), 3) if sum(predicted) else None,
+            'recall': round(hits / sum(actual), 3) if sum(actual) else None,
+        }
+    confident_correct = [c for c, keep in zip(correct, confident) if keep]
+    return {
+        'messages': len(texts),
+        'accuracy': round(sum(correct) / len(texts), 3) if texts else None,
+        'coverage': round(sum(confident) / len(texts), 3) if texts else None,
+        'accuracy_above_threshold': round(sum(confident_correct) / len(confident_correct), 3) if confident_correct else None,
+        'per_class': per_class,
+        'mean_inference_us': round(elapsed / len(texts) * 1e6, 1) if texts else None,
+    }
+
+
+# Seconds between checks for a retrained artifact on disk
+RELOAD_CHECK_SECONDS = 60
+
+_model = None
+_model_mtime = None
+_next_check = 0.0
+_model_lock = threading.Lock()
+
+
+def get_model() -> Optional[IntentModel]:
+    """
+    The trained model at INTENT_MODEL_PATH, or None if there isn't one.
+    Loaded once per process and reloaded when train_intent_model writes a new artifact.
+    """
+    global _model, _model_mtime, _next_check
+    if time.monotonic() < _next_check:
+        return _model
+    with _model_lock:
+        if time.monotonic() < _next_check:
+            return _model
+        _next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        try:
+            mtime = os.path.getmtime(INTENT_MODEL_PATH)
+        except OSError:
+            _model, _model_mtime = None, None
+            return None
+        if mtime != _model_mtime:
+            try:
+                _model = IntentModel.load(INTENT_MODEL_PATH)
+                logger.info(f"Loaded intent model from {INTENT_MODEL_PATH} ({_model.trained_on} messages)")
+            except Exception as e:
+                logger.error(f"Failed to load intent model from {INTENT_MODEL_PATH}: {str(e)}")
+                _model = None
+            _model_mtime = mtime
+    return _model
+
+
+def reload_model() -> Optional[IntentModel]:
+    """Check for a new artifact on the next classification instead of waiting for the interval"""
+    global _next_check
+    with _model_lock:
+        _next_check = 0.0
+    return get_model()
@@ -0,0 +1,122 @@
+import re
+from typing import Optional, Tuple
+from .intents import MessageIntent
+
+# Set/rep notation: "3x10", "4 X 8", "3*12", "3 sets of 10", "12 reps"
+SETS_REPS = re.compile(
+    r"\b\d+\s*[x×*]\s*\d+\b"
+    r"|\b\d+\s*sets?\b"
+    r"|\b\d+\s*reps?\b",
+    re.IGNORECASE
+)
+# Load on a lift: "@ 60kg", "@60", "with 20 lbs"
+LIFT_LOAD = re.compile(r"@\s*\d+(?:\.\d+)?|\b(?:with|using)\s+\d+(?:\.\d+)?\s*(?:kg|kgs|lb|lbs|pounds)\b", re.IGNORECASE)
+# Cardio: an activity word together with a duration or distance. Only a logged activity
+# (past tense or a workout noun) or a distance is a strong signal: "running late, there
+# in 5 min" has an activity word and a duration too.
+CARDIO_LOGGED = re.compile(
+    r"\b(?:cardio|ran|jogged|walked|cycled|biked|swam|rowed|treadmill|elliptical|hiit|yoga"
+    r"|workout|worked out|trained)\b",
+    re.IGNORECASE
+)
+CARDIO_ACTIVITY = re.compile(
+    r"\b(?:run|running|jog|jogging|walk|walking|cycling|biking|swimming|rowing)\b",
+    re.IGNORECASE
+)
+CARDIO_DISTANCE = re.compile(r"\b\d+(?:\.\d+)?\s*(?:km|kms|mi|miles?|k)\b", re.IGNORECASE)
+CARDIO_DURATION = re.compile(r"\b\d+(?:\.\d+)?\s*(?:min|mins|minutes?|hrs?|hours?)\b", re.IGNORECASE)
+# Time phrases of someone on their way, not of a workout
+RUNNING_LATE = re.compile(
+    r"\b(?:late|there in|here in|on my way|omw|be there|in (?:a|\d+)\s*(?:min|mins|minutes?|hrs?|hours?))\b",
+    re.IGNORECASE
+)
+
+# Heights: "170cm", "1.75 m", "5'8\"", "5 ft 8 in", "5 feet"
+HEIGHT = re.compile(
+    r"\b\d{2,3}(?:\.\d+)?\s*(?:cm|cms|centimet(?:er|re)s?)\b"
+    r"|\b[12](?:\.\d{1,2})?\s*(?:m|mtrs?|met(?:er|re)s?)\b"
+    r"|\b[3-7]\s*(?:'|’|ft\b|feet\b|foot\b)\s*(?:\d{1,2}(?:\.\d+)?\s*(?:\"|”|''|in\b|inch(?:es)?\b)?)?",
+    re.IGNORECASE
+)
+# Body weights: "70kg", "150 pounds", "11 stone"
+WEIGHT = re.compile(r"\b\d{2,3}(?:\.\d+)?\s*(?:kg|kgs|kilos?|kilograms?|lb|lbs|pounds?|st|stones?)\b", re.IGNORECASE)
+WEIGH_WORDS = re.compile(r"\b(?:weigh|weighs|weight|height|tall)\b", re.IGNORECASE)
+
+# Name phrases, most explicit first
+EXPLICIT_NAME = re.compile(
+    r"^(?:(?:hi|hello|hey)\b[\s,!.]*)?(?:my name is|my name's|name:|call me|people call me)\s+"
+    r"(?P<name>[a-z][a-z'\-]+(?:\s+[a-z][a-z'\-]+){0,2})\s*[.!]?\s*$",
+    re.IGNORECASE
+)
+SELF_INTRO = re.compile(
+    r"^(?:(?:[Hh]i|[Hh]ello|[Hh]ey)\b[\s,!.]*)?(?:[Ii] am|[Ii]'m|[Ii]’m|[Ii]m)\s+"
+    r"(?P<name>[A-Z][A-Za-z'\-]+(?:\s+[A-Z][A-Za-z'\-]+){0,2})\s*[.!]?\s*$"
+)
+# Words that follow "I'm" or "call me" without being a name
+NOT_NAMES = {
+    'good', 'fine', 'great', 'ok', 'okay', 'tired', 'done', 'back', 'here', 'ready', 'sorry',
+    'new', 'not', 'sore', 'busy', 'out', 'going', 'trying', 'confused', 'interested',
+    'later', 'now', 'tomorrow', 'today', 'when', 'please', 'maybe', 'also', 'just', 'very',
+    'still', 'so', 'a', 'an', 'the', 'living', 'based', 'originally', 'currently', 'working',
+    'looking', 'feeling',
+    # "I am from Delhi", "I'm into lifting"
+    'from', 'in', 'at', 'on', 'into', 'with', 'to', 'for', 'of', 'by', 'near', 'about', 'around',
+}
+
+GREETING = re.compile(
+    r"^(?:hi+|hello+|hey+|hiya|yo|namaste|hola|good\s+(?:morning|afternoon|evening|night)"
+    r"|thanks|thank\s+you|thx|ok|okay|cool|bye)(?:\s+there)?[\s!.,]*$",
+    re.IGNORECASE
+)
+
+
+def classify_by_rules(message: str) -> Optional[Tuple[MessageIntent, float]]:
+    """
+    Classify obvious messages without calling the LLM.
+    Args:
+        message: The user's message text
+    Returns:
+        (intent, confidence) or None when no rule is sure enough to decide
+    """
+    text = (message or '').strip()
+    if not text or len(text) > 500:
+        return None
+
+    sets_reps = SETS_REPS.search(text)
+    height = HEIGHT.search(text)
+    weight = WEIGHT.search(text)
+
+    if sets_reps:
+        # "bench 3x10 60kg" is a lift; a set count next to a height is ambiguous
+        if height:
+            return None
+        return MessageIntent.EXERCISE, 0.97 if (weight or LIFT_LOAD.search(text)) else 0.95
+
+    if height and weight:
+        return MessageIntent.HEIGHT_WEIGHT, 0.97
+    if height or (weight and WEIGH_WORDS.search(text)):
+        return MessageIntent.HEIGHT_WEIGHT, 0.92
+
+    logged, activity = CARDIO_LOGGED.search(text), CARDIO_ACTIVITY.search(text)
+    if (logged or activity) and not RUNNING_LATE.search(text):
+        distance, duration = CARDIO_DISTANCE.search(text), CARDIO_DURATION.search(text)
+        if distance or (logged and duration):
+            return MessageIntent.EXERCISE, 0.92
+        if duration:
+            # "walking 30 mins" could be a plan as well as a log
+            return MessageIntent.EXERCISE, 0.8
+    if weight or LIFT_LOAD.search(text):
+        # A bare "60kg" could be a body weight or a lift
+        return MessageIntent.HEIGHT_WEIGHT, 0.6
+
+    for pattern, confidence in ((EXPLICIT_NAME, 0.95), (SELF_INTRO, 0.92)):
+        named = pattern.match(text)
+        if named:
+            if named.group('name').split()[0].lower() in NOT_NAMES:
+                return None
+            return MessageIntent.NAME, confidence
+
+    if GREETING.match(text):
+        return MessageIntent.UNKNOWN, 0.95
+
+    return None
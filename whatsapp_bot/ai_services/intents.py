@@ -0,0 +1,35 @@
+import contextvars
+from enum import Enum
+from typing import Optional, Tuple
+
+class MessageIntent(Enum):
+    NAME = 'name'
+    EXERCISE = 'exercise'
+    HEIGHT_WEIGHT = 'height_weight'
+    UNKNOWN = 'unknown'
+
+# Where a classification came from, stored on RawMessage.intent_source
+SOURCE_RULES = 'rules'
+SOURCE_MODEL = 'model'
+SOURCE_LLM = 'llm'
+
+_last_classification = contextvars.ContextVar('last_classification', default=None)
+
+
+def record_classification(message: str, intent: MessageIntent, source: str) -> MessageIntent:
+    """Remember the latest classification so the handler can store it on the RawMessage"""
+    _last_classification.set((message, intent, source))
+    return intent
+
+
+def pop_classification(message: str) -> Optional[Tuple[MessageIntent, str]]:
+    """
+    Take the classification recorded for `message`, if any.
+    Returns:
+        (intent, source) or None when this message wasn't classified
+    """
+    recorded = _last_classification.get()
+    _last_classification.set(None)
+    if recorded and recorded[0] == message:
+        return recorded[1], recorded[2]
+    return None
@@ -67,6 +67,28 @@ GEMINI_EXERCISE_RESPONSE_SCHEMA = {
     "type": "object"
 }
 
+# Several sessions' workout logs in one request, answered per session_id
+GEMINI_BATCH_EXERCISE_RESPONSE_SCHEMA = {
+    "properties": {
+        "sessions": {
+            "items": {
+                "properties": {
+                    "session_id": {
+                        "description": "session_id of the workout log these exercises were parsed from",
+                        "type": "integer"
+                    },
+                    "exercises": GEMINI_EXERCISE_RESPONSE_SCHEMA["properties"]["exercises"]
+                },
+                "required": ["session_id", "exercises"],
+                "type": "object"
+            },
+            "type": "array"
+        }
+    },
+    "required": ["sessions"],
+    "type": "object"
+}
+
 GEMINI_NAME_RESPONSE_SCHEMA = {
     "type": "object",
     "properties": {
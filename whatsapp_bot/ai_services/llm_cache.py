@@ -0,0 +1,210 @@
+import contextvars
+import functools
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db import transaction
+from ..dao.llm_cache_dao import LLMCacheDAO
+from ..services import logger_service
+from ..utils.config import LLM_CACHE_ENABLED, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES
+
+# Two-tier cache for LLM results: a per-process LRU in front of the LLMCacheEntry table.
+# Keys hash the task, model, prompt and normalized input, so changing a prompt or model
+# starts from an empty cache instead of serving answers to the old prompt.
+
+logger = logger_service.get_logger()
+
+# Lookups between hit-rate log lines
+STATS_LOG_EVERY = 1000
+
+_SPACES = re.compile(r"\s+")
+
+
+class _LRU:
+    """Thread-safe LRU of encoded results with a per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_memory = _LRU(LLM_CACHE_MAX_ENTRIES)
+
+# Set when a cached call is answered from the cache, so a caller timing the call
+# (see llm_router) can tell it apart from a call the LLM answered
+served_from_cache = contextvars.ContextVar('llm_cache_served', default=False)
+_stats: Dict[str, Counter] = {}
+_stats_lock = threading.Lock()
+
+
+def _count(namespace: str, outcome: str) -> None:
+    with _stats_lock:
+        counts = _stats.setdefault(namespace, Counter())
+        counts[outcome] += 1
+        lookups = counts['memory_hits'] + counts['db_hits'] + counts['misses']
+    if lookups % STATS_LOG_EVERY == 0:
+        logger.info(f"LLM cache {namespace}: {cache_stats()[namespace]}")
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Lookups, hits per tier and hit rate for each cached task in this process"""
+    with _stats_lock:
+        stats = {}
+        for namespace, counts in _stats.items():
+            lookups = counts['memory_hits'] + counts['db_hits'] + counts['misses']
+            stats[namespace] = {
+                'lookups': lookups,
+                'memory_hits': counts['memory_hits'],
+                'db_hits': counts['db_hits'],
+                'misses': counts['misses'],
+                'hit_rate': round((lookups - counts['misses']) / lookups, 3) if lookups else None,
+            }
+        return stats
+
+
+def normalize_input(value: Any, lowercase: bool = False) -> str:
+    """Canonical text of an LLM input: NFKC, trimmed, single spaces; dicts as sorted JSON"""
+    if not isinstance(value, str):
+        return json.dumps(value, sort_keys=True, default=str)
+    text = _SPACES.sub(' ', unicodedata.normalize('NFKC', value)).strip()
+    return text.lower() if lowercase else text
+
+
+def cache_key(namespace: str, model: str, prompt_version: str, normalized: str) -> str:
+    return hashlib.sha256(f"{namespace}|{model}|{prompt_version}|{normalized}".encode()).hexdigest()
+
+
+def _db_get(key: str) -> Optional[str]:
+    try:
+        # Savepoint, so a cache failure can't break the caller's transaction
+        with transaction.atomic():
+            return LLMCacheDAO.get(key)
+    except Exception as e:
+        logger.error(f"Error reading LLM cache: {str(e)}")
+        return None
+
+
+def _db_set(key: str, namespace: str, value: str, ttl_seconds: int) -> None:
+    try:
+        with transaction.atomic():
+            LLMCacheDAO.set(key, namespace, value, ttl_seconds)
+    except Exception as e:
+        logger.error(f"Error writing LLM cache: {str(e)}")
+
+
+def cached(namespace: str, model: str, *prompt_parts: str, lowercase: bool = False,
+           encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None,
+           ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+    """
+    Decorator caching a sync or async single-input LLM call.
+    Only returned results are cached: an exception propagates and the next call retries.
+    Args:
+        namespace: Name of the task, shared by its sync and async variants
+        model: Model name, part of the key
+        prompt_parts: System prompt and response schema, hashed into the key
+        lowercase: Ignore case when matching inputs (only where case can't change the answer)
+        encode/decode: Convert the result to and from a JSON-serialisable value
+    """
+    prompt_version = hashlib.sha256('\n'.join(prompt_parts).encode()).hexdigest()[:16]
+    encode = encode or (lambda result: result)
+    decode = decode or (lambda value: value)
+
+    def lookup(args, kwargs) -> tuple:
+        if len(args) != 1 or kwargs:
+            return None, None
+        key = cache_key(namespace, model, prompt_version, normalize_input(args[0], lowercase))
+        return key, _memory.get(key)
+
+    def remember(key: str, result: Any) -> Optional[str]:
+        if result is None:
+            return None
+        value = json.dumps(encode(result))
+        _memory.set(key, value, ttl_seconds)
+        return value
+
+    def decorator(func):
+        if not LLM_CACHE_ENABLED:
+            return func
+
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key, value = lookup(args, kwargs)
+                if key is None:
+                    return await func(*args, **kwargs)
+                if value is not None:
+                    _count(namespace, 'memory_hits')
+                    served_from_cache.set(True)
+                    return decode(json.loads(value))
+                value = await sync_to_async(_db_get)(key)
+                if value is not None:
+                    _count(namespace, 'db_hits')
+                    served_from_cache.set(True)
+                    _memory.set(key, value, ttl_seconds)
+                    return decode(json.loads(value))
+                _count(namespace, 'misses')
+                result = await func(*args, **kwargs)
+                value = remember(key, result)
+                if value is not None:
+                    await sync_to_async(_db_set)(key, namespace, value, ttl_seconds)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key, value = lookup(args, kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+            if value is not None:
+                _count(namespace, 'memory_hits')
+                served_from_cache.set(True)
+                return decode(json.loads(value))
+            value = _db_get(key)
+            if value is not None:
+                _count(namespace, 'db_hits')
+                served_from_cache.set(True)
+                _memory.set(key, value, ttl_seconds)
+                return decode(json.loads(value))
+            _count(namespace, 'misses')
+            result = func(*args, **kwargs)
+            value = remember(key, result)
+            if value is not None:
+                _db_set(key, namespace, value, ttl_seconds)
+            return result
+        return wrapper
+    return decorator
+
+
+def clear_memory() -> None:
+    """Drop this process's cached entries; the table is left alone"""
+    _memory.clear()
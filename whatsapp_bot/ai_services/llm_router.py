@@ -0,0 +1,474 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from . import llm_cache
+from ..services import logger_service, deadline
+from ..services.deadline import DeadlineExceeded
+from ..utils.config import (
+    LLM_ROUTER_WINDOW, LLM_ROUTER_MIN_CALLS, LLM_ROUTER_MAX_ERROR_RATE, LLM_ROUTER_COOLDOWN_SECONDS,
+    LLM_HEDGING_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY_SECONDS, LLM_ROUTER_WORKERS,
+)
+
+# Routes each LLM task to the first healthy backend of its configured list.
+# Every backend keeps a rolling window of its recent calls; when its error rate
+# or median latency goes over the limits its circuit opens and calls go to the
+# next backend instead, until a probe call after LLM_ROUTER_COOLDOWN_SECONDS
+# succeeds. A task whose backends are all open fails at once, so a slow or
+# unreachable provider costs a webhook nothing instead of a timeout each time.
+# Routes created with hedge=True also send a duplicate of a call that is slower
+# than usual for its backend, and answer with whichever returns first.
+# During a request with a deadline (services/deadline.py) no backend is tried
+# once it has passed, and the caller stops waiting on a call when it does.
+
+logger = logger_service.get_logger()
+
+# Hedged calls between hedging stats log lines
+STATS_LOG_EVERY = 1000
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class NoBackendAvailable(RuntimeError):
+    """Every backend of a route failed or has its circuit open"""
+
+
+def _deadline_passed() -> bool:
+    current = deadline.current()
+    return current is not None and current.expired()
+
+
+def _until_deadline(cap: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait: `cap`, cut to the current deadline's remaining budget (None: no limit)"""
+    current = deadline.current()
+    if current is None:
+        return cap
+    return min(cap, current.remaining()) if cap is not None else current.remaining()
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Backend:
+    """One backend of a route: its callables, recent calls and circuit"""
+
+    def __init__(self, route: str, name: str, func: Callable, afunc: Optional[Callable] = None):
+        self.route = route
+        self.name = name
+        self.func = func
+        self.afunc = afunc
+        self.calls: deque = deque(maxlen=LLM_ROUTER_WINDOW)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self.opened_at >= LLM_ROUTER_COOLDOWN_SECONDS
+
+    def available(self) -> bool:
+        """Whether acquire() would let a call through now"""
+        return self.state == CLOSED or self._cooled_down()
+
+    def acquire(self) -> bool:
+        """
+        Whether a call may go to this backend now. After the cooldown a single
+        probe is let through, and another one if it hasn't finished a cooldown later.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self._cooled_down():
+                self.state = HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, latency: Optional[float], ok: bool, slow_seconds: Optional[float]) -> None:
+        """
+        Record a call's outcome and open or close the circuit
+        Args:
+            latency: Seconds the call took; None when it returned from the cache
+            ok: Whether it returned
+            slow_seconds: Median latency over which the backend counts as degraded
+        """
+        with self.lock:
+            if latency is None:
+                # Answered from the cache, which says nothing about the backend
+                if self.state == HALF_OPEN:
+                    self.opened_at = 0.0
+                return
+            self.calls.append((latency, ok))
+            if self.state == HALF_OPEN:
+                if ok and (slow_seconds is None or latency <= slow_seconds):
+                    self.state = CLOSED
+                    self.calls.clear()
+                    logger.info(f"LLM circuit {self.route}/{self.name} closed")
+                else:
+                    self._open('probe failed')
+                return
+            if self.state != CLOSED or len(self.calls) < LLM_ROUTER_MIN_CALLS:
+                return
+            error_rate = self._error_rate()
+            p50 = _percentile([latency for latency, _ in self.calls], 0.5)
+            if error_rate >= LLM_ROUTER_MAX_ERROR_RATE:
+                self._open(f"error rate {error_rate:.0%}")
+            elif slow_seconds is not None and p50 > slow_seconds:
+                self._open(f"p50 {p50:.2f}s over {slow_seconds}s")
+
+    def record_abandoned(self, latency: float) -> None:
+        """Record a call cancelled after `latency` seconds, which would have taken at least as long"""
+        with self.lock:
+            self.calls.append((latency, True))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait for a call before hedging it; None until enough calls are known"""
+        with self.lock:
+            latencies = [latency for latency, ok in self.calls if ok]
+        if len(latencies) < LLM_ROUTER_MIN_CALLS:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY_SECONDS, _percentile(latencies, LLM_HEDGE_PERCENTILE))
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        logger.warning(f"LLM circuit {self.route}/{self.name} opened for {LLM_ROUTER_COOLDOWN_SECONDS}s: {reason}")
+
+    def _error_rate(self) -> float:
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls) if self.calls else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = [latency for latency, _ in self.calls]
+            return {
+                'state': self.state,
+                'calls': len(self.calls),
+                'error_rate': round(self._error_rate(), 3),
+                'p50_ms': round(_percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+                'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+            }
+
+
+class Route:
+    """An LLM task and the backends able to run it, in order of preference"""
+
+    def __init__(self, name: str, slow_seconds: Optional[float] = None, hedge: bool = False):
+        self.name = name
+        self.slow_seconds = slow_seconds
+        self.hedge = hedge
+        self.backends: Dict[str, Backend] = {}
+        self.order: List[str] = []
+        self.hedge_counts = Counter()
+        self.hedge_lock = threading.Lock()
+
+    def add(self, name: str, func: Callable, afunc: Optional[Callable] = None) -> 'Route':
+        """
+        Make backend `name` available to the route
+        Args:
+            func: Sync implementation, called with the route's arguments
+            afunc: Async implementation; without one, func runs through sync_to_async
+        """
+        self.backends[name] = Backend(self.name, name, func, afunc)
+        return self
+
+    def use(self, names: List[str]) -> 'Route':
+        """Set the backends tried, in order; unknown names are logged and left out"""
+        unknown = [name for name in names if name not in self.backends]
+        if unknown:
+            logger.error(f"Unknown backends for LLM route {self.name}: {', '.join(unknown)}")
+        self.order = [name for name in dict.fromkeys(names) if name in self.backends]
+        return self
+
+    def preferred(self) -> Optional[str]:
+        """The backend the next call goes to first, if any is available"""
+        for name in self.order:
+            if self.backends[name].available():
+                return name
+        return None
+
+    def _record_failure(self, backend: Backend, latency: float, error: Exception) -> None:
+        """Record a failed call and raise its error, or DeadlineExceeded when the deadline cut it short"""
+        if _deadline_passed():
+            # Its timeout was cut to the deadline: no sign of the backend being unhealthy
+            backend.record_abandoned(latency)
+            raise DeadlineExceeded(f"Deadline exceeded calling {self.name} on {backend.name}") from error
+        backend.record(latency, False, self.slow_seconds)
+        raise error
+
+    def _call_timed(self, backend: Backend, args, kwargs) -> Any:
+        # Runs in the calling thread, or in sync_to_async's, so the cache flag is read where it is set
+        token = llm_cache.served_from_cache.set(False)
+        started = time.perf_counter()
+        try:
+            result = backend.func(*args, **kwargs)
+        except Exception as e:
+            self._record_failure(backend, time.perf_counter() - started, e)
+        finally:
+            hit = llm_cache.served_from_cache.get()
+            llm_cache.served_from_cache.reset(token)
+        backend.record(None if hit else time.perf_counter() - started, True, self.slow_seconds)
+        return result
+
+    def _call_in_thread(self, backend: Backend, args, kwargs) -> Any:
+        # On a thread other than the caller's: its connection for the LLM cache is its own
+        close_old_connections()
+        try:
+            return self._call_timed(backend, args, kwargs)
+        finally:
+            close_old_connections()
+
+    async def _acall_timed(self, backend: Backend, args, kwargs) -> Any:
+        if backend.afunc is None:
+            # Not thread-sensitive, so a hedge doesn't queue behind the call it duplicates
+            return await sync_to_async(self._call_in_thread, thread_sensitive=False)(backend, args, kwargs)
+        token = llm_cache.served_from_cache.set(False)
+        started = time.perf_counter()
+        try:
+            result = await backend.afunc(*args, **kwargs)
+        except asyncio.CancelledError:
+            backend.record_abandoned(time.perf_counter() - started)
+            raise
+        except Exception as e:
+            self._record_failure(backend, time.perf_counter() - started, e)
+        finally:
+            hit = llm_cache.served_from_cache.get()
+            llm_cache.served_from_cache.reset(token)
+        backend.record(None if hit else time.perf_counter() - started, True, self.slow_seconds)
+        return result
+
+    def _hedge_target(self, primary: Backend, tried: set) -> Backend:
+        """The next backend not tried yet that takes calls, or else the primary again"""
+        for name in self.order:
+            if name not in tried and self.backends[name].acquire():
+                tried.add(name)
+                return self.backends[name]
+        return primary
+
+    def _count_hedge(self, hedged: bool, hedge_won: bool) -> None:
+        with self.hedge_lock:
+            self.hedge_counts['calls'] += 1
+            self.hedge_counts['hedged'] += hedged
+            self.hedge_counts['hedge_wins'] += hedge_won
+            calls = self.hedge_counts['calls']
+        if calls % STATS_LOG_EVERY == 0:
+            logger.info(f"LLM hedging {self.name}: {self.hedge_stats()}")
+
+    def _call_pooled(self, primary: Backend, tried: set, args, kwargs) -> Any:
+        """
+        Run a call on the router's threads, so the caller stops waiting at the
+        deadline, and hedge it when it takes longer than usual for its backend
+        """
+        delay = primary.hedge_delay() if self._hedging() else None
+        if delay is None and deadline.current() is None:
+            return self._call_timed(primary, args, kwargs)
+        executor = _router_executor()
+
+        def submit(backend: Backend):
+            # Copied contexts, so request metrics and the deadline still apply
+            return executor.submit(contextvars.copy_context().run, self._call_in_thread, backend, args, kwargs)
+
+        futures = {submit(primary)}
+        hedge_future = None
+        if delay is not None:
+            done, _ = wait(futures, timeout=_until_deadline(delay))
+            if not done and not _deadline_passed():
+                target = self._hedge_target(primary, tried)
+                logger.info(f"LLM route {self.name}: hedging {primary.name} after {delay:.2f}s on {target.name}")
+                hedge_future = submit(target)
+                futures.add(hedge_future)
+
+        error = None
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=_until_deadline(), return_when=FIRST_COMPLETED)
+            if not done:
+                # A call already running can't be stopped; it finishes on its
+                # thread, bounded by its own timeout, and only its latency is kept
+                for future in pending:
+                    future.cancel()
+                raise DeadlineExceeded(f"Deadline exceeded waiting on {self.name}")
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if delay is not None:
+                        self._count_hedge(hedge_future is not None, future is hedge_future)
+                    return future.result()
+                error = future.exception()
+        if delay is not None:
+            self._count_hedge(hedge_future is not None, False)
+        raise error
+
+    async def _acall_bounded(self, backend: Backend, args, kwargs) -> Any:
+        timeout = _until_deadline()
+        if timeout is None:
+            return await self._acall_timed(backend, args, kwargs)
+        try:
+            return await asyncio.wait_for(self._acall_timed(backend, args, kwargs), timeout)
+        except TimeoutError:
+            if _deadline_passed():
+                raise DeadlineExceeded(f"Deadline exceeded waiting on {self.name}")
+            raise
+
+    async def _acall_pooled(self, primary: Backend, tried: set, args, kwargs) -> Any:
+        """Async variant of _call_pooled: the loser of a hedge and calls past the deadline are cancelled"""
+        delay = primary.hedge_delay() if self._hedging() else None
+        if delay is None:
+            return await self._acall_bounded(primary, args, kwargs)
+        primary_task = asyncio.ensure_future(self._acall_timed(primary, args, kwargs))
+        tasks = {primary_task}
+        hedge_task = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=_until_deadline(delay))
+            if not done and not _deadline_passed():
+                target = self._hedge_target(primary, tried)
+                logger.info(f"LLM route {self.name}: hedging {primary.name} after {delay:.2f}s on {target.name}")
+                hedge_task = asyncio.ensure_future(self._acall_timed(target, args, kwargs))
+                tasks.add(hedge_task)
+
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=_until_deadline(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(f"Deadline exceeded waiting on {self.name}")
+                for task in done:
+                    if task.exception() is None:
+                        self._count_hedge(hedge_task is not None, task is hedge_task)
+                        return task.result()
+                    error = task.exception()
+            self._count_hedge(hedge_task is not None, False)
+            raise error
+        finally:
+            # Cancel the loser, and anything still running at the deadline
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _check_deadline(self) -> None:
+        if _deadline_passed():
+            raise DeadlineExceeded(f"Deadline exceeded before calling {self.name}")
+
+    def _hedging(self) -> bool:
+        return self.hedge and LLM_HEDGING_ENABLED
+
+    def __call__(self, *args, **kwargs) -> Any:
+        """
+        Run the task on the first backend that is available and succeeds
+        Raises:
+            NoBackendAvailable: If every backend failed or is open
+            DeadlineExceeded: If the current deadline passed before a backend answered
+        """
+        errors = []
+        tried = set()
+        for name in self.order:
+            self._check_deadline()
+            backend = self.backends[name]
+            if name in tried or not backend.acquire():
+                continue
+            tried.add(name)
+            try:
+                return self._call_pooled(backend, tried, args, kwargs)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"LLM route {self.name}: backend {backend.name} failed: {str(e)}")
+                errors.append(f"{backend.name}: {str(e)}")
+        raise NoBackendAvailable(f"No backend available for {self.name}" + (f" ({'; '.join(errors)})" if errors else ''))
+
+    async def acall(self, *args, **kwargs) -> Any:
+        """Async variant of calling the route"""
+        errors = []
+        tried = set()
+        for name in self.order:
+            self._check_deadline()
+            backend = self.backends[name]
+            if name in tried or not backend.acquire():
+                continue
+            tried.add(name)
+            try:
+                return await self._acall_pooled(backend, tried, args, kwargs)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"LLM route {self.name}: backend {backend.name} failed: {str(e)}")
+                errors.append(f"{backend.name}: {str(e)}")
+        raise NoBackendAvailable(f"No backend available for {self.name}" + (f" ({'; '.join(errors)})" if errors else ''))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: self.backends[name].stats() for name in self.order}
+
+    def hedge_stats(self) -> Dict[str, Any]:
+        """Hedged calls, the share of calls hedged and the share of hedges that answered first"""
+        with self.hedge_lock:
+            counts = dict(self.hedge_counts)
+        calls, hedged, wins = counts.get('calls', 0), counts.get('hedged', 0), counts.get('hedge_wins', 0)
+        return {
+            'calls': calls,
+            'hedged': hedged,
+            'hedge_wins': wins,
+            'hedge_rate': round(hedged / calls, 3) if calls else None,
+            'hedge_win_rate': round(wins / hedged, 3) if hedged else None,
+        }
+
+
+_routes: Dict[str, Route] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _router_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_ROUTER_WORKERS, thread_name_prefix='llm-router')
+    return _executor
+
+
+def route(name: str, slow_seconds: Optional[float] = None, hedge: bool = False) -> Route:
+    """
+    The route of task `name`, created on first use
+    Args:
+        slow_seconds: Median latency over which a backend's circuit opens (None: errors only)
+        hedge: Hedge slow calls when LLM_HEDGING_ENABLED
+    """
+    if name not in _routes:
+        _routes[name] = Route(name, slow_seconds, hedge)
+    return _routes[name]
+
+
+def router_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Circuit state, error rate and p50/p99 latency of every backend of every route in this process"""
+    return {name: route.stats() for name, route in _routes.items()}
+
+
+def hedge_stats() -> Dict[str, Dict[str, Any]]:
+    """Hedge rate and wins of every hedged route in this process"""
+    return {name: route.hedge_stats() for name, route in _routes.items() if route.hedge}
+
+
+def _after_fork() -> None:
+    global _executor, _executor_lock
+    # A lock held by another thread at fork time would never be released in the child,
+    # and the parent's router threads don't exist in it
+    _executor = None
+    _executor_lock = threading.Lock()
+    for route in _routes.values():
+        route.hedge_lock = threading.Lock()
+        for backend in route.backends.values():
+            backend.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,81 @@
+import atexit
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+from .prompts import GEMINI_EXERCISE_SYSTEM_PROMPT, LOCAL_EXTRACTION_INSTRUCTIONS
+from .json_response_schema import GEMINI_EXERCISE_RESPONSE_SCHEMA
+from ..services import logger_service
+from ..utils.config import (
+    LLAMA_EXTRACTION_MODEL_PATH, LLAMA_EXTRACTION_N_CTX, LLAMA_EXTRACTION_THREADS,
+    LLAMA_EXTRACTION_MAX_TOKENS, WORKOUT_EXTRACTION_PROCESSES,
+)
+
+# Workout extraction with a local GGUF model, constrained by a GBNF grammar built from
+# GEMINI_EXERCISE_RESPONSE_SCHEMA so every answer parses and matches the schema.
+# Generation runs in a pool of spawned processes, one model per process: llama.cpp
+# keeps cores busy for a whole completion, and the cron's threads only wait on it.
+# This module is imported by the pool's processes, so it must not need Django.
+
+logger = logger_service.get_logger()
+
+SYSTEM_PROMPT = GEMINI_EXERCISE_SYSTEM_PROMPT + LOCAL_EXTRACTION_INSTRUCTIONS + json.dumps(GEMINI_EXERCISE_RESPONSE_SCHEMA)
+
+# Set in each pool process by _init_worker
+_llm = None
+_grammar = None
+
+
+def _init_worker() -> None:
+    global _llm, _grammar
+    from llama_cpp import Llama, LlamaGrammar
+    _llm = Llama(
+        model_path=LLAMA_EXTRACTION_MODEL_PATH,
+        n_ctx=LLAMA_EXTRACTION_N_CTX,
+        n_threads=LLAMA_EXTRACTION_THREADS,
+        use_mmap=True,
+        verbose=False,
+    )
+    _grammar = LlamaGrammar.from_json_schema(json.dumps(GEMINI_EXERCISE_RESPONSE_SCHEMA), verbose=False)
+    logger.info(f"Loaded local extraction model {LLAMA_EXTRACTION_MODEL_PATH}")
+
+
+def _extract(message: str) -> Dict[str, Any]:
+    """Runs in a pool process"""
+    response = _llm.create_chat_completion(
+        messages=[
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': message},
+        ],
+        grammar=_grammar,
+        max_tokens=LLAMA_EXTRACTION_MAX_TOKENS,
+        temperature=0,
+    )
+    return json.loads(response['choices'][0]['message']['content'])
+
+
+def create_pool() -> ProcessPoolExecutor:
+    """
+    Pool of WORKOUT_EXTRACTION_PROCESSES processes, each loading the model once.
+    Spawned rather than forked: the cron forks from a process running threads.
+    """
+    pool = ProcessPoolExecutor(
+        max_workers=WORKOUT_EXTRACTION_PROCESSES,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+    )
+    atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+    return pool
+
+
+def extract(pool: ProcessPoolExecutor, message: str, timeout: float = None) -> Dict[str, Any]:
+    """
+    Extract workout details on the pool
+    Args:
+        pool: Pool from create_pool
+        message: Workout log text
+        timeout: Seconds to wait for the answer
+    Returns:
+        dict matching GEMINI_EXERCISE_RESPONSE_SCHEMA
+    """
+    return pool.submit(_extract, message).result(timeout=timeout)
@@ -0,0 +1,128 @@
+import re
+from typing import Any, Dict, Optional
+from .intent_rules import SETS_REPS
+
+# Parses height/weight replies ("height: 170, weight: 70", "5'11\" 165 lbs", "1.8m 80kg")
+# into the extract_height_weight format, so convert_height_weight can use it directly.
+# Every number in the message has to be accounted for, otherwise the parser abstains
+# and the message goes to the LLM.
+
+_NUMBER = r"\d+(?:\.\d+)?"
+
+FEET_INCHES = re.compile(
+    r"\b(?P<feet>[3-7])\s*(?:'|’|ft\b\.?|feet\b|foot\b)\s*"
+    # Not the weight that follows: "6 ft 90 kg"
+    r"(?:(?P<inches>\d{1,2}(?:\.\d+)?)(?![\d.]|\s*(?:kgs?|kilos?|kilograms?|lbs?|pounds?)\b)"
+    r"\s*(?:\"|”|''|’’|in\b\.?|inch(?:es)?\b)?)?",
+    re.IGNORECASE
+)
+HEIGHT = re.compile(
+    rf"\b(?P<value>{_NUMBER})\s*(?P<unit>cm|cms|centimet(?:er|re)s?|m|mtrs?|met(?:er|re)s?|in|inch(?:es)?)\b",
+    re.IGNORECASE
+)
+WEIGHT = re.compile(
+    rf"\b(?P<value>{_NUMBER})\s*(?P<unit>kg|kgs|kilos?|kilograms?|lb|lbs|pounds?|g|gms?|grams?)\b",
+    re.IGNORECASE
+)
+# "height: 170", "weight - 70", "I weigh 70": unitless, read in the units we prompt for
+LABELLED = re.compile(
+    rf"\b(?P<label>height|ht|weight|wt|weigh|weighs)\b\s*(?:is|of|:|=|-|around|about)?\s*(?P<value>{_NUMBER})"
+    r"(?![\d.]|\s*(?:'|’|\"|st\b|stones?\b|ft\b|feet\b|foot\b|yrs?\b|years?\b))",
+    re.IGNORECASE
+)
+# Two bare numbers in the order we ask for them: "170, 70"
+BARE_PAIR = re.compile(rf"^\s*(?P<height>{_NUMBER})\s*(?:,|/|&|and|\s)\s*(?P<weight>{_NUMBER})\s*$", re.IGNORECASE)
+
+HEIGHT_UNITS = {
+    'cm': 'cm', 'cms': 'cm', 'centimeter': 'cm', 'centimeters': 'cm', 'centimetre': 'cm', 'centimetres': 'cm',
+    'm': 'm', 'mtr': 'm', 'mtrs': 'm', 'meter': 'm', 'meters': 'm', 'metre': 'm', 'metres': 'm',
+    'in': 'in', 'inch': 'in', 'inches': 'in',
+}
+WEIGHT_UNITS = {
+    'kg': 'kg', 'kgs': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'lb': 'lbs', 'lbs': 'lbs', 'pound': 'lbs', 'pounds': 'lbs',
+    'g': 'g', 'gm': 'g', 'gms': 'g', 'gram': 'g', 'grams': 'g',
+}
+
+
+def _unitless_height(value: float) -> Optional[Dict[str, Any]]:
+    """Read a height given without a unit: centimetres as prompted, or metres"""
+    if 100 <= value <= 250:
+        return {'value': value, 'unit': 'cm'}
+    if 1 <= value <= 2.5:
+        return {'value': value, 'unit': 'm'}
+    return None
+
+
+def _unitless_weight(value: float) -> Optional[Dict[str, Any]]:
+    """Read a weight given without a unit: kilograms as prompted"""
+    if 20 <= value <= 350:
+        return {'value': value, 'unit': 'kg'}
+    return None
+
+
+def parse_height_weight(message: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract height and weight without calling the LLM.
+    Args:
+        message: The user's message text
+    Returns:
+        dict in the extract_height_weight format ({'height': {'value', 'unit'},
+        'weight': {'value', 'unit'}}, None for a missing value), or None when no
+        value was found or the message can't be read completely
+    """
+    text = (message or '').strip()
+    if not text or len(text) > 200 or SETS_REPS.search(text):
+        return None
+
+    bare = BARE_PAIR.match(text)
+    if bare:
+        height = _unitless_height(float(bare.group('height')))
+        weight = _unitless_weight(float(bare.group('weight')))
+        if not (height and weight):
+            return None
+        return {'height': height, 'weight': weight}
+
+    heights = []
+    weights = []
+
+    def consume(match: re.Match) -> str:
+        return ' ' * len(match.group(0))
+
+    def feet_inches(match: re.Match) -> str:
+        inches = float(match.group('inches') or 0)
+        if inches >= 12:
+            return match.group(0)
+        heights.append({'value': int(match.group('feet')) * 12 + inches, 'unit': 'in'})
+        return consume(match)
+
+    def with_unit(found: list, units: Dict[str, str]):
+        def replace(match: re.Match) -> str:
+            found.append({'value': float(match.group('value')), 'unit': units[match.group('unit').lower()]})
+            return consume(match)
+        return replace
+
+    def labelled(match: re.Match) -> str:
+        value = float(match.group('value'))
+        if match.group('label').lower() in ('height', 'ht'):
+            reading, found = _unitless_height(value), heights
+        else:
+            reading, found = _unitless_weight(value), weights
+        if not reading:
+            return match.group(0)
+        found.append(reading)
+        return match.group(0)[:match.start('value') - match.start()] + ' ' * len(match.group('value'))
+
+    text = FEET_INCHES.sub(feet_inches, text)
+    text = HEIGHT.sub(with_unit(heights, HEIGHT_UNITS), text)
+    text = WEIGHT.sub(with_unit(weights, WEIGHT_UNITS), text)
+    text = LABELLED.sub(labelled, text)
+
+    # A number left over ("I'm 25, 180cm") or two heights or weights mean the message needs the LLM
+    if re.search(r"\d", text) or len(heights) > 1 or len(weights) > 1:
+        return None
+    if not heights and not weights:
+        return None
+
+    empty = {'value': None, 'unit': None}
+    return {'height': heights[0] if heights else empty, 'weight': weights[0] if weights else empty}
@@ -2,35 +2,38 @@ from typing import Dict, List, Optional, Tuple,Any
 import typing
 from ..models import WhatsAppUser
 from .prompts import LLAMA_SYSTEM_PROMPT, GEMINI_EXERCISE_SYSTEM_PROMPT, GEMINI_NAME_SYSTEM_PROMPT, GEMINI_MEASUREMENTS_SYSTEM_PROMPT, GEMINI_MATCH_EXERCISE_SYSTEM_PROMPT
-from .json_response_schema import GEMINI_EXERCISE_RESPONSE_SCHEMA,GEMINI_NAME_RESPONSE_SCHEMA,Measurements
+from .prompts import GEMINI_BATCH_EXERCISE_INSTRUCTIONS, LOCAL_EXTRACTION_INSTRUCTIONS
+from .json_response_schema import GEMINI_EXERCISE_RESPONSE_SCHEMA,GEMINI_NAME_RESPONSE_SCHEMA,GEMINI_BATCH_EXERCISE_RESPONSE_SCHEMA,Measurements
+from .intents import MessageIntent, record_classification, SOURCE_RULES, SOURCE_MODEL, SOURCE_LLM
+from .intent_rules import classify_by_rules
+from .intent_model import get_model as get_intent_model
+from .llm_cache import cached
+from . import llm_router
 import os
-from litellm import completion,JSONSchemaValidationError
+from . import backends
 from dotenv import load_dotenv
 from ..services import logger_service
+from ..services.request_metrics import timed
+from ..services.deadline import DeadlineExceeded, timeout_for
+from ..utils.config import INTENT_RULES_MIN_CONFIDENCE, INTENT_MODEL_MIN_CONFIDENCE
+from ..utils.config import INTENT_CLASSIFIER_BACKEND, LLAMA_MODEL_PATH
+from ..utils.config import LLAMA_EXTRACTION_MODEL_PATH, LLAMA_EXTRACTION_TIMEOUT_SECONDS
+from ..utils.config import WORKOUT_EXTRACTION_BACKEND, WORKOUT_EXTRACTION_FALLBACKS, INTENT_CLASSIFIER_FALLBACKS, LLM_ROUTER_SLOW_SECONDS
+from ..utils.config import LLM_TIMEOUT_SECONDS
 import json
-from llama_cpp import Llama
-from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
-from enum import Enum
-from ollama import chat
-from ollama import ChatResponse
-import google.generativeai as genai
-from ollama import Client
+
+# The LLM client libraries are loaded on first use, see backends.py
+if typing.TYPE_CHECKING:
+    import google.generativeai as genai
+    from ollama import ChatResponse
 
 load_dotenv()
 
 logger = logger_service.get_logger()
-os.environ['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
-ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
-ollama_port = os.getenv('OLLAMA_PORT', '11434')
-client = Client(host=f"http://{ollama_host}:{ollama_port}")
+OLLAMA_CLASSIFIER_MODEL = 'hf.co/bartowski/Llama-3.2-1B-Instruct-GGUF:Q4_K_L'
+GEMINI_MODEL = "gemini-2.0-flash-exp"
 
-class MessageIntent(Enum):
-    NAME = 'name'
-    EXERCISE = 'exercise'
-    HEIGHT_WEIGHT = 'height_weight'
-    UNKNOWN = 'unknown'
 
 class ExerciseMatch(typing.TypedDict, total=True):  # total=True makes all fields required
     matched_exercise: str
@@ -39,13 +42,18 @@ class ExerciseMatch(typing.TypedDict, total=True):  # total=True makes all field
 class ExerciseMatchResponse(typing.TypedDict, total=True):
     matched_exercises: list[ExerciseMatch]
 
-def extract_workout_details(message: str) -> Dict[str, Any]:
+@cached('workout', GEMINI_MODEL, GEMINI_EXERCISE_SYSTEM_PROMPT, json.dumps(GEMINI_EXERCISE_RESPONSE_SCHEMA))
+@timed('llm')
+def _gemini_extract_workout_details(message: str) -> Dict[str, Any]:
     if os.getenv('DEBUG') is True:
         os.environ['LITELLM_LOG'] = 'DEBUG'
     os.environ['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
+    timeout = timeout_for(LLM_TIMEOUT_SECONDS)
+    litellm = backends.litellm()
     try:
-        response = completion(
-            model="gemini/gemini-2.0-flash-exp", 
+        response = litellm.completion(
+            model=f"gemini/{GEMINI_MODEL}", 
+            timeout=timeout,
             messages=[{
                         "role": "system",
                         "content": [
@@ -73,110 +81,367 @@ def extract_workout_details(message: str) -> Dict[str, Any]:
         )
 
         json_response = json.loads(response.choices[0].message.content)
-    except JSONSchemaValidationError as e:
+    except litellm.JSONSchemaValidationError as e:
         logger.error(f"Schema validation error in Gemini response: {e}")
         raise ValueError("Failed to parse workout details - invalid response format")
     except Exception as e:
         logger.error(f"Error in parsing Gemini response: {e}")
         raise RuntimeError(f"Failed to process workout details: {str(e)}")
-    
+    # The model echoes the message under the schema; store it verbatim like the other backends
+    json_response['parsed_from'] = message
     return json_response
 
 
-def classify_message_intent(message:str)->str:
+@timed('llm')
+def _gemini_extract_workout_details_batch(logs: Dict[int, str]) -> Dict[int, Dict[str, Any]]:
+    """
+    Extract the workout details of several sessions in one request
+    Args:
+        logs: Message text per session id
+    Returns:
+        Workout details per session id, in the extract_workout_details format.
+        Sessions the response leaves out are missing from the result.
+    Raises:
+        ValueError: If the response doesn't match the batch schema
+    """
+    batch_input = json.dumps([{'session_id': session_id, 'messages': text} for session_id, text in logs.items()])
+    timeout = timeout_for(LLM_TIMEOUT_SECONDS)
+    litellm = backends.litellm()
     try:
-        response: ChatResponse = client.chat(
-            model='hf.co/bartowski/Llama-3.2-1B-Instruct-GGUF:Q4_K_L',
-            messages=[
-                {
-                    'role': 'system',
-                    'content': LLAMA_SYSTEM_PROMPT
-                },
-                {
-                    'role': 'user',
-                    'content': message,
-                },
-            ]
+        response = litellm.completion(
+            model=f"gemini/{GEMINI_MODEL}",
+            timeout=timeout,
+            messages=[{
+                        "role": "system",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": GEMINI_EXERCISE_SYSTEM_PROMPT + GEMINI_BATCH_EXERCISE_INSTRUCTIONS,
+                            }
+                        ],
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": batch_input,
+                            }
+                        ],
+                    }
+                    ],
+            response_format={
+                "type": "json_object",
+                "response_schema": GEMINI_BATCH_EXERCISE_RESPONSE_SCHEMA,
+                "enforce_validation": True
+            }
         )
-        classification = response['message']['content']
-        logger.info(f"Classification Response: {response}")
-        logger.info(f"Predicted message intent {classification}")
-        if 'name' in classification:
-            return MessageIntent.NAME
-        elif 'exercise' in classification:
-            return MessageIntent.EXERCISE
-        elif 'height_weight' in classification:
-            return MessageIntent.HEIGHT_WEIGHT
-        else:
-            return MessageIntent.UNKNOWN
+        json_response = json.loads(response.choices[0].message.content)
+        sessions = json_response['sessions']
+    except litellm.JSONSchemaValidationError as e:
+        logger.error(f"Schema validation error in Gemini batch response: {e}")
+        raise ValueError("Failed to parse batched workout details - invalid response format")
+    except Exception as e:
+        logger.error(f"Error in parsing Gemini batch response: {e}")
+        raise RuntimeError(f"Failed to process batched workout details: {str(e)}")
+
+    results = {}
+    for entry in sessions:
+        session_id = entry.get('session_id')
+        # Ignore ids that weren't asked for, and keep the first answer for each
+        if session_id in logs and session_id not in results and isinstance(entry.get('exercises'), list):
+            results[session_id] = {'exercises': entry['exercises'], 'parsed_from': logs[session_id]}
+    return results
+
+
+@cached('workout', f"llama_cpp/{os.path.basename(LLAMA_EXTRACTION_MODEL_PATH)}", GEMINI_EXERCISE_SYSTEM_PROMPT,
+        LOCAL_EXTRACTION_INSTRUCTIONS, json.dumps(GEMINI_EXERCISE_RESPONSE_SCHEMA))
+@timed('llm')
+def extract_workout_details_local(message: str) -> Dict[str, Any]:
+    """
+    Extract workout details with the local GGUF model, in the extract_workout_details format.
+    Generation is constrained by a grammar compiled from GEMINI_EXERCISE_RESPONSE_SCHEMA,
+    so the answer always parses and needs no retry.
+    Raises:
+        RuntimeError: If the model fails or doesn't answer within LLAMA_EXTRACTION_TIMEOUT_SECONDS
+    """
+    from . import local_extraction
+    try:
+        json_response = local_extraction.extract(backends.llama_extraction_pool(), message,
+                                                 timeout=LLAMA_EXTRACTION_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f"Error in local workout extraction: {e!r}")
+        raise RuntimeError(f"Failed to process workout details: {e!r}")
+    json_response['parsed_from'] = message
+    return json_response
+
+
+# Each task runs on the first healthy backend of its route (see llm_router)
+_workout_route = (llm_router.route('workout')
+                  .add('gemini', _gemini_extract_workout_details)
+                  .add('llama_cpp', extract_workout_details_local)
+                  .use([WORKOUT_EXTRACTION_BACKEND] + WORKOUT_EXTRACTION_FALLBACKS))
+_workout_batch_route = llm_router.route('workout_batch').add('gemini', _gemini_extract_workout_details_batch).use(['gemini'])
+
+
+def extract_workout_details(message: str) -> Dict[str, Any]:
+    """
+    Extract workout details with WORKOUT_EXTRACTION_BACKEND, or its fallbacks while it is failing
+    Returns:
+        dict matching GEMINI_EXERCISE_RESPONSE_SCHEMA, with 'parsed_from' set to the message on every backend
+    """
+    return _workout_route(message)
+
+
+def extract_workout_details_batch(logs: Dict[int, str]) -> Dict[int, Dict[str, Any]]:
+    """Extract the workout details of several sessions in one Gemini request (see _gemini_extract_workout_details_batch)"""
+    return _workout_batch_route(logs)
+
+
+def workout_backend() -> Optional[str]:
+    """The backend the next workout extraction goes to"""
+    return _workout_route.preferred()
+
+
+def _classification_messages(message: str) -> List[Dict[str, str]]:
+    return [
+        {
+            'role': 'system',
+            'content': LLAMA_SYSTEM_PROMPT
+        },
+        {
+            'role': 'user',
+            'content': message,
+        },
+    ]
+
+
+def _parse_classification(response: 'ChatResponse') -> MessageIntent:
+    classification = response['message']['content']
+    logger.info(f"Classification Response: {response}")
+    logger.info(f"Predicted message intent {classification}")
+    if 'name' in classification:
+        return MessageIntent.NAME
+    elif 'exercise' in classification:
+        return MessageIntent.EXERCISE
+    elif 'height_weight' in classification:
+        return MessageIntent.HEIGHT_WEIGHT
+    else:
+        return MessageIntent.UNKNOWN
+
+
+def _classify_locally(message: str) -> Optional[MessageIntent]:
+    """
+    Classify without the LLM: the rule-based pre-classifier first, then the
+    trained n-gram model. None when neither is confident enough.
+    """
+    ruled = classify_by_rules(message)
+    if ruled and ruled[1] >= INTENT_RULES_MIN_CONFIDENCE:
+        logger.info(f"Rule-based message intent {ruled[0].value} ({ruled[1]})")
+        return record_classification(message, ruled[0], SOURCE_RULES)
+
+    model = get_intent_model()
+    if model is not None:
+        intent, confidence = model.predict(message)
+        if confidence >= INTENT_MODEL_MIN_CONFIDENCE:
+            logger.info(f"Model message intent {intent.value} ({confidence:.3f})")
+            return record_classification(message, intent, SOURCE_MODEL)
+    return None
+
+
+def classify_message_intent(message:str)->str:
+    return _classify_locally(message) or _llm_classify(message)
+
+
+async def aclassify_message_intent(message: str) -> MessageIntent:
+    """Async variant of classify_message_intent using the async Ollama client"""
+    return _classify_locally(message) or await _allm_classify(message)
+
+
+def _llm_classify(message: str) -> MessageIntent:
+    try:
+        return record_classification(message, _intent_route(message), SOURCE_LLM)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error in classify_message_intent: {str(e)}")
         return MessageIntent.UNKNOWN
 
 
-def extract_height_weight(message: str) -> Dict[str,Any]:
-    model = genai.GenerativeModel("gemini-2.0-flash-exp",
-                                  system_instruction=GEMINI_MEASUREMENTS_SYSTEM_PROMPT)
+async def _allm_classify(message: str) -> MessageIntent:
+    try:
+        return record_classification(message, await _intent_route.acall(message), SOURCE_LLM)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error in aclassify_message_intent: {str(e)}")
+        return MessageIntent.UNKNOWN
+
+
+# Failed calls raise instead of returning UNKNOWN, so they aren't cached
+_classification_cache = cached('intent', OLLAMA_CLASSIFIER_MODEL, LLAMA_SYSTEM_PROMPT, lowercase=True,
+                               encode=lambda intent: intent.value, decode=MessageIntent)
+
+
+@_classification_cache
+@timed('llm')
+def _ollama_classify(message: str) -> MessageIntent:
+    response: 'ChatResponse' = backends.ollama_client().chat(
+        model=OLLAMA_CLASSIFIER_MODEL,
+        messages=_classification_messages(message)
+    )
+    return _parse_classification(response)
+
+
+@_classification_cache
+@timed('llm')
+async def _aollama_classify(message: str) -> MessageIntent:
+    response: 'ChatResponse' = await backends.ollama_async_client().chat(
+        model=OLLAMA_CLASSIFIER_MODEL,
+        messages=_classification_messages(message)
+    )
+    return _parse_classification(response)
+
+
+# Longest label ("height_weight") plus room for stray punctuation
+LLAMA_CLASSIFIER_MAX_TOKENS = 8
+
+
+@cached('intent', f"llama_cpp/{os.path.basename(LLAMA_MODEL_PATH)}", LLAMA_SYSTEM_PROMPT, lowercase=True,
+        encode=lambda intent: intent.value, decode=MessageIntent)
+@timed('llm')
+def _llama_classify(message: str) -> MessageIntent:
+    """Classify with the in-process llama.cpp model instead of the Ollama server"""
+    content = backends.llama_classifier().complete(_classification_messages(message), LLAMA_CLASSIFIER_MAX_TOKENS)
+    return _parse_classification({'message': {'content': content}})
+
+
+_intent_route = (llm_router.route('intent', LLM_ROUTER_SLOW_SECONDS, hedge=True)
+                 .add('ollama', _ollama_classify, _aollama_classify)
+                 .add('llama_cpp', _llama_classify)
+                 .use([INTENT_CLASSIFIER_BACKEND] + INTENT_CLASSIFIER_FALLBACKS))
+
+
+def _measurements_model() -> 'genai.GenerativeModel':
+    return backends.genai().GenerativeModel(GEMINI_MODEL,
+                                 system_instruction=GEMINI_MEASUREMENTS_SYSTEM_PROMPT)
+
+
+def _measurements_generation_config() -> 'genai.GenerationConfig':
+    return backends.genai().GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=Measurements
+    )
+
+
+_measurements_cache = cached('measurements', GEMINI_MODEL, GEMINI_MEASUREMENTS_SYSTEM_PROMPT, str(Measurements.__annotations__))
+
+
+@_measurements_cache
+@timed('llm')
+def _gemini_extract_height_weight(message: str) -> Dict[str,Any]:
+    model = _measurements_model()
+    timeout = timeout_for(LLM_TIMEOUT_SECONDS)
     try:
         result = model.generate_content(
             message,
-            generation_config=genai.GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=Measurements
-            ),
+            generation_config=_measurements_generation_config(),
+            request_options={'timeout': timeout},
         )
         json_response = json.loads(result.text)
         
         # Return in the format expected by the handler
         return json_response
         
-    except JSONSchemaValidationError as e:
-        logger.error(f"Schema validation error in Gemini response: {e}")
-        raise ValueError("Failed to parse workout details - invalid response format")
     except Exception as e:
         logger.error(f"Error in parsing Gemini response: {e}")
         raise RuntimeError(f"Failed to process workout details: {str(e)}")
 
     return None
 
-def extract_name_response(message: str) -> str:
+
+@_measurements_cache
+@timed('llm')
+async def _agemini_extract_height_weight(message: str) -> Dict[str, Any]:
+    """Async variant of _gemini_extract_height_weight"""
+    model = _measurements_model()
+    timeout = timeout_for(LLM_TIMEOUT_SECONDS)
+    try:
+        result = await model.generate_content_async(
+            message,
+            generation_config=_measurements_generation_config(),
+            request_options={'timeout': timeout},
+        )
+        return json.loads(result.text)
+    except Exception as e:
+        logger.error(f"Error in parsing Gemini response: {e}")
+        raise RuntimeError(f"Failed to process workout details: {str(e)}")
+
+
+_measurements_route = (llm_router.route('measurements', hedge=True)
+                       .add('gemini', _gemini_extract_height_weight, _agemini_extract_height_weight)
+                       .use(['gemini']))
+
+
+def extract_height_weight(message: str) -> Dict[str, Any]:
+    return _measurements_route(message)
+
+
+async def aextract_height_weight(message: str) -> Dict[str, Any]:
+    """Async variant of extract_height_weight"""
+    return await _measurements_route.acall(message)
+
+
+def _name_request(message: str, timeout: float) -> Dict[str, Any]:
+    return dict(
+        model=f"gemini/{GEMINI_MODEL}",
+        timeout=timeout,
+        messages=[{
+                    "role": "system",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": GEMINI_NAME_SYSTEM_PROMPT,
+                        }
+                    ],
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": message,
+                        }
+                    ],
+                }
+                ],
+        response_format={
+            "type": "json_object", 
+            "response_schema": GEMINI_NAME_RESPONSE_SCHEMA,
+            "enforce_validation": True 
+        }
+    )
+
+
+_name_cache = cached('name', GEMINI_MODEL, GEMINI_NAME_SYSTEM_PROMPT, json.dumps(GEMINI_NAME_RESPONSE_SCHEMA))
+
+
+@_name_cache
+@timed('llm')
+def _gemini_extract_name(message: str) -> str:
     """
     Extract Name from a message
     Args:
         message: The message text
         user: WhatsAppUser object
     """
+    request = _name_request(message, timeout_for(LLM_TIMEOUT_SECONDS))
+    litellm = backends.litellm()
     try:
-        response = completion(
-            model="gemini/gemini-2.0-flash-exp", 
-            messages=[{
-                        "role": "system",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": GEMINI_NAME_SYSTEM_PROMPT,
-                            }
-                        ],
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": message,
-                            }
-                        ],
-                    }
-                    ],
-            response_format={
-                "type": "json_object", 
-                "response_schema": GEMINI_NAME_RESPONSE_SCHEMA,
-                "enforce_validation": True 
-            }
-        )
+        response = litellm.completion(**request)
         json_response = json.loads(response.choices[0].message.content)
 
-    except JSONSchemaValidationError as e:
+    except litellm.JSONSchemaValidationError as e:
         logger.error(f"Schema validation error in Gemini response: {e}")
         raise ValueError("Failed to parse name details - invalid response format")
     except Exception as e:
@@ -185,25 +450,70 @@ def extract_name_response(message: str) -> str:
     
     return json_response['name']
 
-def match_exercise_name(exercise_dict:Dict) -> Dict[str,Any]:
-    model = genai.GenerativeModel("gemini-2.0-flash-exp",
+
+@_name_cache
+@timed('llm')
+async def _agemini_extract_name(message: str) -> str:
+    """Async variant of _gemini_extract_name using litellm's acompletion"""
+    request = _name_request(message, timeout_for(LLM_TIMEOUT_SECONDS))
+    litellm = backends.litellm()
+    try:
+        response = await litellm.acompletion(**request)
+        json_response = json.loads(response.choices[0].message.content)
+    except litellm.JSONSchemaValidationError as e:
+        logger.error(f"Schema validation error in Gemini response: {e}")
+        raise ValueError("Failed to parse name details - invalid response format")
+    except Exception as e:
+        logger.error(f"Error in parsing Gemini response: {e}")
+        raise RuntimeError(f"Failed to process name details: {str(e)}")
+
+    return json_response['name']
+
+
+_name_route = llm_router.route('name', hedge=True).add('gemini', _gemini_extract_name, _agemini_extract_name).use(['gemini'])
+
+
+def extract_name_response(message: str) -> str:
+    """
+    Extract Name from a message
+    Args:
+        message: The message text
+    """
+    return _name_route(message)
+
+
+async def aextract_name_response(message: str) -> str:
+    """Async variant of extract_name_response"""
+    return await _name_route.acall(message)
+
+@cached('exercise_match', GEMINI_MODEL, GEMINI_MATCH_EXERCISE_SYSTEM_PROMPT, str(ExerciseMatchResponse.__annotations__))
+@timed('llm')
+def _gemini_match_exercise_name(exercise_dict:Dict) -> Dict[str,Any]:
+    model = backends.genai().GenerativeModel(GEMINI_MODEL,
                                   system_instruction=GEMINI_MATCH_EXERCISE_SYSTEM_PROMPT)
+    timeout = timeout_for(LLM_TIMEOUT_SECONDS)
     try:
         result = model.generate_content(
             json.dumps(exercise_dict),
-            generation_config=genai.GenerationConfig(
+            generation_config=backends.genai().GenerationConfig(
                 response_mime_type="application/json",
                 response_schema=ExerciseMatchResponse
             ),
+            request_options={'timeout': timeout},
         )
         matched_exercise_json = json.loads(result.text)
         
-    except JSONSchemaValidationError as e:
-        logger.error(f"Schema validation error in Gemini response: {e}")
-        raise ValueError("Failed to parse workout details - invalid response format")
     except Exception as e:
         logger.error(f"Error in parsing Gemini response: {e}")
         raise RuntimeError(f"Failed to process workout details: {str(e)}")
 
     return matched_exercise_json
 
+
+_exercise_match_route = (llm_router.route('exercise_match')
+                         .add('gemini', _gemini_match_exercise_name)
+                         .use(['gemini']))
+
+
+def match_exercise_name(exercise_dict: Dict) -> Dict[str, Any]:
+    return _exercise_match_route(exercise_dict)
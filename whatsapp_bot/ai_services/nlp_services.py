@@ -1,5 +1,9 @@
 from ..services import logger_service
 from .nlp_processor import extract_height_weight, classify_message_intent, MessageIntent, extract_name_response
+from .nlp_processor import aextract_height_weight, aclassify_message_intent, aextract_name_response
+from .intents import record_classification, SOURCE_RULES
+from .measurement_parser import parse_height_weight
+from ..services.deadline import DeadlineExceeded
 
 logger = logger_service.get_logger()
 
@@ -13,16 +17,32 @@ def is_name_response(message: str) -> tuple[bool, str]:
     """
     if classify_message_intent(message) == MessageIntent.NAME:
         try:
-            name = extract_name_response(message)
-            if name and name not in ['', 'null', 'None', 'none', 'NULL', 'NONE']:
-                return True, name
-            else:
-                return False, None
+            return _validate_name(extract_name_response(message))
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error in extracting name: {e}")
     return False, None
 
 
+async def ais_name_response(message: str) -> tuple[bool, str]:
+    """Async variant of is_name_response"""
+    if await aclassify_message_intent(message) == MessageIntent.NAME:
+        try:
+            return _validate_name(await aextract_name_response(message))
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error in extracting name: {e}")
+    return False, None
+
+
+def _validate_name(name: str) -> tuple[bool, str]:
+    if name and name not in ['', 'null', 'None', 'none', 'NULL', 'NONE']:
+        return True, name
+    return False, None
+
+
 def is_measurement_response(message: str) -> tuple[bool, float, float]:
     """
     Check if message is a measurement response and extract measurement
@@ -31,19 +51,53 @@ def is_measurement_response(message: str) -> tuple[bool, float, float]:
     Returns:
         True or False
     """
+    parsed = _parse_measurements(message)
+    if parsed:
+        return _measurement_result(convert_height_weight(parsed))
+
     classification = classify_message_intent(message)
     if classification == MessageIntent.HEIGHT_WEIGHT:
         try:
-            extracted_data = get_converted_height_weight(message)
-            logger.info(f"Extracted data: {extracted_data}")
-            if not extracted_data['height'] and not extracted_data['weight']:
-                return False, None, None
-            return True, extracted_data['height'], extracted_data['weight']
+            return _measurement_result(convert_height_weight(extract_height_weight(message)))
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error in extracting height/weight: {e}")
+        return False, None, None
+
+
+async def ais_measurement_response(message: str) -> tuple[bool, float, float]:
+    """Async variant of is_measurement_response"""
+    parsed = _parse_measurements(message)
+    if parsed:
+        return _measurement_result(convert_height_weight(parsed))
+
+    classification = await aclassify_message_intent(message)
+    if classification == MessageIntent.HEIGHT_WEIGHT:
+        try:
+            return _measurement_result(convert_height_weight(await aextract_height_weight(message)))
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error in extracting height/weight: {e}")
         return False, None, None
 
 
+def _parse_measurements(message: str) -> dict:
+    """Parse the reply locally; a hit skips both the classifier and the extraction LLM"""
+    parsed = parse_height_weight(message)
+    if parsed:
+        record_classification(message, MessageIntent.HEIGHT_WEIGHT, SOURCE_RULES)
+    return parsed
+
+
+def _measurement_result(extracted_data: dict) -> tuple[bool, float, float]:
+    logger.info(f"Extracted data: {extracted_data}")
+    if not extracted_data['height'] and not extracted_data['weight']:
+        return False, None, None
+    return True, extracted_data['height'], extracted_data['weight']
+
+
 def is_gym_log(message: str) -> bool:
     """
     Determine if the message is a gym log.
@@ -57,6 +111,12 @@ def is_gym_log(message: str) -> bool:
     else:
         return False
 
+
+async def ais_gym_log(message: str) -> bool:
+    """Async variant of is_gym_log"""
+    return await aclassify_message_intent(message) == MessageIntent.EXERCISE
+
+
 def get_converted_height_weight(message: str) -> tuple[float, float]:
     """
     Get height and weight from message and convert to cm and kg respectively
@@ -67,7 +127,19 @@ def get_converted_height_weight(message: str) -> tuple[float, float]:
     Raises:
         ValueError: If both height and weight are missing or if units are missing
     """
-    extracted_data = extract_height_weight(message)
+    return convert_height_weight(parse_height_weight(message) or extract_height_weight(message))
+
+
+def convert_height_weight(extracted_data: dict) -> dict:
+    """
+    Convert extracted height and weight values to cm and kg respectively
+    Args:
+        extracted_data: dict with 'height' and 'weight' entries of {'value', 'unit'}
+    Returns:
+        dict with 'height' in cm and 'weight' in kg, None for missing/invalid values
+    Raises:
+        ValueError: If both height and weight are missing or if units are missing
+    """
     height_data = extracted_data.get('height', {})
     weight_data = extracted_data.get('weight', {})
     
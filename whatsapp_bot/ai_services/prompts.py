@@ -1,4 +1,4 @@
-import pandas as pd
+import csv
 import json
 import os
 
@@ -6,8 +6,9 @@ import os
 current_dir = os.path.dirname(os.path.abspath(__file__))
 csv_path = os.path.join(current_dir, "exercise_list.csv")
 
-df = pd.read_csv(csv_path)
-exercise_names = df['Exercise Name'].to_list()
+# csv rather than pandas: this module is imported by every web worker and cron run
+with open(csv_path, newline='', encoding='utf-8') as f:
+    exercise_names = [row['Exercise Name'] for row in csv.DictReader(f)]
 exercise_names_dict = {"exercises": exercise_names}
 
 GEMINI_MATCH_EXERCISE_SYSTEM_PROMPT = '''You are an AI assistant specialized in mapping user-provided exercise names to a standardized exercise database. Your task is to match input exercise names with the closest matching exercise from the authorized list, even when the input contains variations, misspellings, or colloquial terms.
@@ -355,6 +356,21 @@ Extract the name of the person from the given text. If the name is not present,
 
 '''
 
+GEMINI_BATCH_EXERCISE_INSTRUCTIONS = '''
+
+Batch input:
+The input is a JSON list of workout logs from different users, each with a "session_id" and its "messages".
+Parse every log separately with the rules above and return one entry per session_id with the exercises of that log only.
+Never move exercises between logs. Return an empty exercises list for a log without exercises.
+'''
+
+LOCAL_EXTRACTION_INSTRUCTIONS = '''
+
+Answer format:
+Answer with a single JSON object and nothing else. Put every exercise in the "exercises" list, with "weight" as an object of "value" and "unit".
+The JSON schema of the answer is:
+'''
+
 GEMINI_MEASUREMENTS_SYSTEM_PROMPT = '''
 Extract height and weight measurements from the given text. Return them in a structured JSON format.
 
@@ -0,0 +1,221 @@
+import csv
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Parses workout logs written in regular gym notation ("Squat 4x8 100kg, bench 3x10 60")
+# into the GEMINI_EXERCISE_RESPONSE_SCHEMA shape. Lines it can't read completely are
+# returned as leftovers for the LLM, so a partial guess never replaces a real parse.
+
+_current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Same default as GEMINI_EXERCISE_SYSTEM_PROMPT
+DEFAULT_UNIT = 'lbs'
+MAX_SETS = 20
+MAX_REPS = 100
+
+ABBREVIATIONS = {
+    'db': 'dumbbell', 'dbs': 'dumbbell', 'bb': 'barbell', 'kb': 'kettlebell',
+    'bp': 'bench press', 'dl': 'deadlift', 'ohp': 'overhead press', 'rdl': 'romanian deadlift',
+    'sldl': 'stiff-legged deadlift', 'bss': 'bulgarian split squat',
+}
+
+# Common names that aren't in exercise_list.csv, by name key
+ALIASES = {
+    'bench': 'Bench Press',
+    'flatbench': 'Bench Press',
+    'inclinebench': 'Incline Bench Press',
+    'backsquat': 'Squat',
+    'militarypress': 'Overhead Press',
+    'shoulderpress': 'Overhead Press',
+    'standingpress': 'Overhead Press',
+    'pullup': 'Pull-Up',
+    'chinup': 'Chin-Up',
+    'pushup': 'Push-Up',
+    'dip': 'Bar Dip',
+    'latpulldown': 'Lat Pulldown',
+    'pulldown': 'Lat Pulldown',
+    'bentoverrow': 'Barbell Row',
+    'dumbbellpress': 'Dumbbell Chest Press',
+    'dumbbellbenchpress': 'Dumbbell Chest Press',
+    'bicepcurl': 'Dumbbell Curl',
+    'curl': 'Dumbbell Curl',
+    'lateralraise': 'Dumbbell Lateral Raise',
+    'sidelateralraise': 'Dumbbell Lateral Raise',
+    'tricepspushdown': 'Tricep Pushdown',
+    'hipthruster': 'Hip Thrust',
+    'calfraise': 'Standing Calf Raise',
+    'legcurl': 'Lying Leg Curl',
+    'legextension': 'Leg Extension',
+    'situp': 'Sit-Up',
+}
+
+# Words people put around an exercise name: "deadlift heavy today"
+NAME_FILLER = {'today', 'heavy', 'light', 'some', 'the', 'a', 'did', 'then', 'also', 'my', 'set', 'sets'}
+
+BODY_WEIGHT_MARKERS = ('push-up', 'pull-up', 'chin-up', 'dip', 'sit-up', 'crunch', 'plank', 'muscle-up',
+                       'air squat', 'pistol squat', 'bodyweight', 'body weight', 'leg raise', 'knee raise')
+BARBELL_LIFTS = {'Bench Press', 'Squat', 'Deadlift', 'Overhead Press', 'Front Squat', 'Incline Bench Press',
+                 'Close-Grip Bench Press', 'Romanian Deadlift', 'Sumo Deadlift', 'Hip Thrust', 'Pendlay Row'}
+MACHINE_MARKERS = ('machine', 'cable', 'pulldown', 'pushdown', 'leg press', 'leg extension', 'leg curl', 'pec deck')
+
+_UNITS = {
+    'kg': 'kg', 'kgs': 'kg', 'kilo': 'kg', 'kilos': 'kg',
+    'lb': 'lbs', 'lbs': 'lbs', 'pound': 'lbs', 'pounds': 'lbs',
+}
+
+_WEIGHT = r"(?P<weight>\d+(?:\.\d+)?)\s*(?P<unit>kgs?|kilos?|lbs?|pounds?)?"
+_SETS_REPS = (
+    r"(?:(?P<sets>\d+)\s*[x×*]\s*(?P<reps>\d+)\s*(?:reps?)?"
+    r"|(?P<sets2>\d+)\s*sets?\s*(?:of\s*|x\s*)?(?P<reps2>\d+)\s*(?:reps?)?"
+    r"|(?P<reps3>\d+)\s*reps?\s*(?:x\s*)?(?P<sets3>\d+)\s*sets?)"
+)
+_LOAD_SEPARATOR = r"\s*(?:@|at|with|w/|for|,|-)?\s*"
+
+# Tried in order: "405x5x3" (weight x reps x sets) must win over "405x5" as sets x reps
+_PATTERNS = [
+    re.compile(r"(?P<weight>\d+(?:\.\d+)?)\s*(?P<unit>kgs?|kilos?|lbs?|pounds?)?\s*[x×*]\s*(?P<reps>\d+)\s*[x×*]\s*(?P<sets>\d+)"),
+    re.compile(rf"{_SETS_REPS}(?:{_LOAD_SEPARATOR}{_WEIGHT})?"),
+    re.compile(rf"{_WEIGHT}{_LOAD_SEPARATOR}{_SETS_REPS}"),
+]
+
+_NAME = re.compile(r"^(?P<name>[a-z][a-z\s\-'/]*?)\s*(?=[\d@])")
+_LEADING_FILLER = re.compile(r"^(?:(?:i|also|then|and|did|do|done|today|some|my|of|few)\b\s*)+")
+_TRAILING_FILLER = re.compile(r"(?:\s*\b(?:today|done|each|each side|total)\b)+$|[\s.!]+$")
+_SEGMENT_SPLIT = re.compile(r"\s*(?:[,;+]|\band then\b|\bthen\b|\bfollowed by\b)\s*(?=[a-z])")
+
+
+def _name_key(name: str) -> str:
+    """Key for matching exercise names: singular words, no spaces, punctuation or filler"""
+    words = []
+    for word in re.split(r"[\s\-/]+", name.lower()):
+        if word in NAME_FILLER:
+            continue
+        word = ABBREVIATIONS.get(word, word)
+        if len(word) > 2 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return re.sub(r"[^a-z]", '', ''.join(words))
+
+
+def _load_exercise_names() -> Dict[str, str]:
+    names = {}
+    with open(os.path.join(_current_dir, 'exercise_list.csv'), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            names.setdefault(_name_key(row['Exercise Name']), row['Exercise Name'])
+    for key, name in ALIASES.items():
+        names.setdefault(key, name)
+    return names
+
+
+EXERCISE_NAMES = _load_exercise_names()
+
+
+def match_exercise_name(name: str) -> Optional[str]:
+    """Standard exercise name for a user-typed name, or None if it isn't a known exercise"""
+    return EXERCISE_NAMES.get(_name_key(name))
+
+
+def _weight_type(name: str, has_weight: bool) -> str:
+    lowered = name.lower()
+    if not has_weight and any(marker in lowered for marker in BODY_WEIGHT_MARKERS):
+        return 'body weight'
+    if 'dumbbell' in lowered:
+        return 'dumbbell'
+    if 'barbell' in lowered or name in BARBELL_LIFTS:
+        return 'barbell'
+    if any(marker in lowered for marker in MACHINE_MARKERS):
+        return 'machine'
+    return 'not specified'
+
+
+def _group(match: re.Match, *names: str) -> Optional[str]:
+    for name in names:
+        if match.groupdict().get(name):
+            return match.group(name)
+    return None
+
+
+def parse_segment(segment: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one exercise written as "<name> <sets/reps> [weight]" or "<name> <weight> <sets/reps>"
+    Returns:
+        Exercise dict in the GEMINI_EXERCISE_RESPONSE_SCHEMA shape, or None if the
+        segment isn't fully understood
+    """
+    text = _TRAILING_FILLER.sub('', _LEADING_FILLER.sub('', segment.strip().lower()))
+    named = _NAME.match(text)
+    if not named:
+        return None
+    exercise_name = match_exercise_name(named.group('name').strip(" -'/"))
+    if not exercise_name:
+        return None
+
+    rest = text[named.end():].strip()
+    for pattern in _PATTERNS:
+        match = pattern.fullmatch(rest)
+        if match:
+            break
+    else:
+        return None
+
+    sets = int(_group(match, 'sets', 'sets2', 'sets3'))
+    reps = int(_group(match, 'reps', 'reps2', 'reps3'))
+    if not (1 <= sets <= MAX_SETS and 1 <= reps <= MAX_REPS):
+        return None
+
+    weight = match.groupdict().get('weight')
+    weight_type = _weight_type(exercise_name, weight is not None)
+    if weight is not None:
+        unit = _UNITS.get(match.group('unit') or '', DEFAULT_UNIT)
+        value = float(weight)
+    elif weight_type == 'body weight':
+        unit, value = 'body weight', 0
+    else:
+        unit, value = 'not specified', 0
+
+    return {
+        'exercise_name': exercise_name,
+        'sets': sets,
+        'reps': str(reps),
+        'weight': {
+            'value': int(value) if value == int(value) else value,
+            'unit': unit,
+            'type': weight_type,
+        },
+    }
+
+
+def parse_workout_log(text: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Parse every line of a workout log that is written in regular notation
+    Args:
+        text: One or more workout messages, newline separated
+    Returns:
+        (exercises, leftover_lines). A line is parsed completely or returned whole
+        in leftover_lines, never half-used.
+    """
+    exercises = []
+    leftover = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        segments = [s for s in _SEGMENT_SPLIT.split(line.strip().lower()) if s.strip()]
+        parsed = [parse_segment(segment) for segment in segments]
+        if parsed and all(parsed):
+            exercises.extend(parsed)
+        else:
+            leftover.append(line)
+    return exercises, leftover
+
+
+def parse_workout_details(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a workout log into the same structure extract_workout_details returns
+    Returns:
+        The parsed workout, or None (abstain) unless every line was understood
+    """
+    exercises, leftover = parse_workout_log(text)
+    if leftover or not exercises:
+        return None
+    return {'exercises': exercises, 'parsed_from': text, 'confidence': 1.0}
@@ -4,9 +4,14 @@ from django_cron.backends.lock.file import FileLock
 from django.conf import settings
 import os
 from .services.logger_service import get_logger
+from .dao.raw_message_dao import RawMessageDAO
+from .dao.llm_cache_dao import LLMCacheDAO
 from .cron_services.process_pending_workout_messages import process_pending_workout_messages
 from .cron_services.eod_user_message import send_eod_workout_summaries
 from .cron_services.eow_user_message import send_eow_workout_summaries
+from .services.outbox_dispatcher import run_dispatcher
+from .utils.config import OUTBOX_BATCH_SIZE, OUTBOX_CONCURRENCY, LLM_CACHE_MAX_ROWS
+import asyncio
 
 
 import traceback
@@ -60,7 +65,8 @@ class BaseCronJob(CronJobBase):
             start_time = timezone.now()
             
             try:
-                result = self.do()
+                with RawMessageDAO.buffer_outgoing():
+                    result = self.do()
                 execution_time = (timezone.now() - start_time).total_seconds()
                 logger.info(f"Job {self.code} completed successfully in {execution_time} seconds")
                 return result
@@ -88,7 +94,39 @@ class ProcessPendingWorkoutMessagesCronJob(BaseCronJob):
     ALLOW_PARALLEL_RUNS = False
     
     def do(self):
-        process_pending_workout_messages()
+        process_pending_workout_messages(timeout_seconds=self.TIMEOUT_SECONDS)
+
+class DispatchOutboxCronJob(BaseCronJob):
+    """
+    Backstop for the dispatch_outbox daemon (started by start.sh), which does the
+    actual sending: drains anything left due in the outbox if the daemon is down.
+    Runs with every runcrons, i.e. every 15 minutes, after the workout job
+    """
+    RUN_EVERY_MINS = 1
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'whatsapp_bot.dispatch_outbox'
+
+    TIMEOUT_SECONDS = 300  # 5 minutes timeout
+    ALLOW_PARALLEL_RUNS = False
+
+    def do(self):
+        asyncio.run(run_dispatcher(OUTBOX_BATCH_SIZE, OUTBOX_CONCURRENCY, poll_interval=0, once=True))
+
+class PurgeLLMCacheCronJob(BaseCronJob):
+    """
+    Cron job to delete expired LLM cache entries and keep the table under LLM_CACHE_MAX_ROWS
+    Runs daily at 03:00 AM
+    """
+    RUN_AT_TIMES = ['03:00']
+    schedule = Schedule(run_at_times=RUN_AT_TIMES)
+    code = 'whatsapp_bot.purge_llm_cache'
+
+    TIMEOUT_SECONDS = 300  # 5 minutes timeout
+    ALLOW_PARALLEL_RUNS = False
+
+    def do(self):
+        deleted = LLMCacheDAO.purge(LLM_CACHE_MAX_ROWS)
+        logger.info(f"Purged {deleted} LLM cache entries")
 
 class SendEODWorkoutSummariesCronJob(BaseCronJob):
     """
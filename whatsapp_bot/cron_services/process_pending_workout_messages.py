@@ -1,17 +1,48 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
 from django.utils import timezone
 from django.db.models import Count, Q, F
 from ..models import WorkoutSession, Exercise
 from ..services.logger_service import get_logger
-from ..ai_services.nlp_processor import extract_workout_details
-from django.db import transaction
+from ..ai_services.nlp_processor import extract_workout_details, extract_workout_details_batch, workout_backend
+from ..ai_services.workout_parser import parse_workout_log
+from ..utils.config import WORKOUT_PARSER_ENABLED, INCREMENTAL_SESSION_PARSING
+from ..utils.config import WORKOUT_BATCH_EXTRACTION, WORKOUT_BATCH_MAX_TOKENS, WORKOUT_BATCH_MAX_SESSIONS
+from ..utils.config import WORKOUT_EXTRACTION_WORKERS, WORKOUT_EXTRACTION_PROCESSES
+from django.db import transaction, close_old_connections
 from ..dao.exercise_dao import ExerciseDAO, WorkoutSessionDAO
 
 logger = get_logger(__name__)
 
-def process_pending_workout_messages():
+# New messages that change what was already logged ("actually it was 80kg") need the
+# whole session re-parsed instead of only the new messages
+CORRECTION = re.compile(
+    r"\b(?:actually|correction|sorry|i meant|meant|instead|not|wrong|typo|mistake|change|edit|fix|undo|remove|delete|scratch that)\b",
+    re.IGNORECASE
+)
+
+# Rough characters per token, for packing batches under WORKOUT_BATCH_MAX_TOKENS
+CHARS_PER_TOKEN = 4
+
+# Seconds of a run's time budget kept for saving the extracted sessions
+SAVE_RESERVE_SECONDS = 30
+
+def process_pending_workout_messages(timeout_seconds: Optional[float] = None):
     """
     Find workout sessions with pending messages to process using optimized database queries
+    Args:
+        timeout_seconds: Time budget of the run. Extractions still running when it is
+                         nearly spent are abandoned and their sessions retried next run.
     """
+    started = time.monotonic()
+    deadline = None
+    if timeout_seconds:
+        # Keep part of the budget for saving the sessions that were extracted
+        deadline = started + timeout_seconds - min(SAVE_RESERVE_SECONDS, timeout_seconds / 5)
+    stats = {'saved': 0, 'failed': 0, 'timed_out': 0}
+
     try:
         # Calculate the timestamp for 8 hours ago
         eight_hours_ago = timezone.now() - timezone.timedelta(hours=8)
@@ -30,18 +61,44 @@ def process_pending_workout_messages():
         
         if session_count > 0:
             logger.info(f"Found {session_count} sessions with pending messages to process")
-            # Process each session
-            for session_data in pending_sessions:
+            sessions = WorkoutSession.objects.filter(id__in=[session_data['id'] for session_data in pending_sessions])
+
+            # Parse locally first, then send what's left of every session to the LLM
+            pending = []
+            for session in sessions:
+                try:
+                    prepared = prepare_session(session)
+                    if prepared:
+                        pending.append(prepared)
+                except Exception as e:
+                    logger.error(f"Failed to process session {session.id}: {str(e)}")
+                    stats['failed'] += 1
+
+            extract_concurrently(pending, deadline)
+
+            # Saved one at a time on this thread, each in its own transaction
+            for prepared in pending:
+                if 'error' in prepared:
+                    stats['failed'] += 1
+                    continue
+                if 'llm_exercises' not in prepared:
+                    stats['timed_out'] += 1
+                    continue
                 try:
-                    session = WorkoutSession.objects.get(id=session_data['id'])
-                    process_session(session)
+                    save_session(prepared)
+                    stats['saved'] += 1
                 except Exception as e:
-                    logger.error(f"Failed to process session {session_data['id']}: {str(e)}")
+                    logger.error(f"Failed to process session {prepared['session'].id}: {str(e)}")
+                    stats['failed'] += 1
                     continue
+
+            elapsed = time.monotonic() - started
+            logger.info(f"Processed pending workout sessions in {elapsed:.1f}s "
+                        f"({stats['saved'] / elapsed:.2f} sessions/s): {stats}")
         else:
             logger.info("No sessions found with pending messages")
-        
-        return f"Found {session_count} sessions with pending messages"
+
+        return f"Found {session_count} sessions with pending messages: {stats}"
         
     except Exception as e:
         logger.error(f"Failed to process pending workout messages: {str(e)}")
@@ -50,67 +107,207 @@ def process_pending_workout_messages():
 def process_session(session: WorkoutSession):
     """
     Process a single workout session by:
-    1. Concatenating ALL raw messages
-    2. Extracting workout details using NLP
-    3. Creating Exercise records from the extracted data
+    1. Collecting the raw messages that haven't been parsed yet
+    2. Extracting workout details from them using NLP (from all of the session's
+       messages on the first parse, or when the new ones correct earlier ones)
+    3. Adding the new Exercise records, or reconciling them all on a full parse
     """
     try:
-        # Get all raw messages for this session
-        raw_messages = session.raw_messages.all()
-        
-        # Concatenate messages with newlines
-        message_blob = '\n'.join(msg.message for msg in raw_messages)
-        
-        if not message_blob.strip():
-            logger.warning(f"No message content found for session {session.id}")
-            return
-        
-        # Extract workout details using NLP
-        logger.info(f"Processing message blob for session {session.id}")
-        logger.info(f"Input message blob: {message_blob}")
-        
-        workout_details = extract_workout_details(message_blob)
-        logger.info(f"Extracted workout details: {workout_details}")
-        
-        # Process exercises from the workout details
-        if 'exercises' in workout_details:
-            try:
-                # Transform the NLP output to match Exercise model fields
-                exercise_records = []
-                for exercise in workout_details['exercises']:
-                    try:
-                        exercise_record = {
-                            'name': exercise['exercise_name'],
-                            'weights': exercise['weight']['value'],
-                            'weight_unit': exercise['weight']['unit'],
-                            'sets': exercise['sets'],
-                            'reps': int(exercise['reps'])
-                        }
-                        exercise_records.append(exercise_record)
-                    except (KeyError, ValueError) as e:
-                        logger.error(f"Failed to transform exercise data: {str(e)}")
-                        continue
-                
-                # Replace exercises using ExerciseDAO
-                created_exercises = ExerciseDAO.replace_session_exercises(
-                    session=session,
-                    exercises_data=exercise_records
-                )
-                
-                # If exercises were created successfully, mark messages as processed
-                if created_exercises:
-                    WorkoutSessionDAO.mark_messages_as_processed(
-                        session=session,
-                        raw_messages=raw_messages
-                    )
-                
-                logger.info(f"Successfully processed {len(created_exercises)} exercises for session {session.id}")
-            except Exception as e:
-                logger.error(f"Failed to process exercises for session {session.id}: {str(e)}")
-                raise
-        else:
-            logger.warning(f"No exercises found in workout details for session {session.id}")
-            
+        prepared = prepare_session(session)
+        if prepared:
+            extract_leftover(prepared)
+            save_session(prepared)
     except Exception as e:
         logger.error(f"Error processing session {session.id}: {str(e)}")
         raise
+
+
+def prepare_session(session: WorkoutSession) -> Optional[Dict[str, Any]]:
+    """
+    Collect a session's messages to parse and parse what can be parsed locally
+    Args:
+        session: WorkoutSession instance
+    Returns:
+        dict with the session, its new messages, whether the parse is incremental,
+        the message blob, the locally parsed exercises and the leftover text for
+        the LLM; None when there is nothing to parse
+    """
+    raw_messages = list(session.raw_messages.order_by('created_at', 'id'))
+    processed_ids = WorkoutSessionDAO.get_processed_message_ids(session)
+    new_messages = [msg for msg in raw_messages if msg.id not in processed_ids]
+    if not new_messages:
+        return None
+
+    incremental = (
+        INCREMENTAL_SESSION_PARSING and bool(processed_ids)
+        and not any(CORRECTION.search(msg.message) for msg in new_messages)
+    )
+
+    # Concatenate messages with newlines
+    message_blob = '\n'.join(msg.message for msg in (new_messages if incremental else raw_messages))
+
+    if not message_blob.strip():
+        logger.warning(f"No message content found for session {session.id}")
+        return None
+
+    logger.info(f"Processing {'new' if incremental else 'all'} messages for session {session.id}")
+    logger.info(f"Input message blob: {message_blob}")
+
+    # Lines in regular notation are parsed locally; only the rest is sent to Gemini
+    if WORKOUT_PARSER_ENABLED:
+        exercises, leftover = parse_workout_log(message_blob)
+        logger.info(f"Parsed {len(exercises)} exercises locally, {len(leftover)} lines left for the LLM")
+    else:
+        exercises, leftover = [], [message_blob]
+
+    return {
+        'session': session,
+        'new_messages': new_messages,
+        'incremental': incremental,
+        'message_blob': message_blob,
+        'exercises': exercises,
+        'leftover': '\n'.join(leftover),
+    }
+
+
+def _local_extraction() -> bool:
+    # The workout route's first healthy backend, so a failover to llama_cpp stops the batching
+    return workout_backend() == 'llama_cpp'
+
+
+def extract_leftover(prepared: Dict[str, Any]) -> None:
+    """Extract the exercises in a prepared session's leftover text with one LLM call"""
+    exercises = []
+    if prepared['leftover']:
+        exercises = extract_workout_details(prepared['leftover']).get('exercises', [])
+    # Set only once done: a session without 'llm_exercises' hasn't been extracted
+    prepared['llm_exercises'] = exercises
+
+
+def plan_batches(pending: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Group the sessions that need the LLM into extraction requests, packed up to
+    WORKOUT_BATCH_MAX_TOKENS and WORKOUT_BATCH_MAX_SESSIONS per request (one
+    session per request when WORKOUT_BATCH_EXTRACTION is off, or with the local
+    backend, whose short context is better spent on one log at a time)
+    Args:
+        pending: Sessions from prepare_session; those fully parsed locally get no LLM call
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for prepared in pending:
+        if not prepared['leftover']:
+            prepared['llm_exercises'] = []
+            continue
+        tokens = len(prepared['leftover']) // CHARS_PER_TOKEN + 1
+        max_sessions = WORKOUT_BATCH_MAX_SESSIONS if WORKOUT_BATCH_EXTRACTION and not _local_extraction() else 1
+        if batch and (batch_tokens + tokens > WORKOUT_BATCH_MAX_TOKENS or len(batch) >= max_sessions):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(prepared)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def extract_batch(batch: List[Dict[str, Any]]) -> None:
+    """
+    Extract one request's sessions, setting 'llm_exercises' on each, or 'error' when
+    its extraction failed. Sessions missing from a batch's answer, or in a batch that
+    failed, are extracted one by one. Runs on an extraction worker thread.
+    """
+    close_old_connections()
+    try:
+        if len(batch) > 1:
+            try:
+                results = extract_workout_details_batch({prepared['session'].id: prepared['leftover'] for prepared in batch})
+                for prepared in batch:
+                    result = results.get(prepared['session'].id)
+                    if result is not None:
+                        prepared['llm_exercises'] = result.get('exercises', [])
+                logger.info(f"Extracted {len(results)} of {len(batch)} sessions in one batch")
+            except Exception as e:
+                logger.error(f"Batched extraction of {len(batch)} sessions failed, extracting one by one: {str(e)}")
+
+        # A lone session goes through the regular (cached) single extraction
+        for prepared in batch:
+            if 'llm_exercises' in prepared:
+                continue
+            try:
+                extract_leftover(prepared)
+            except Exception as e:
+                logger.error(f"Failed to extract session {prepared['session'].id}: {str(e)}")
+                prepared['error'] = str(e)
+    finally:
+        # The LLM cache uses this thread's connection
+        close_old_connections()
+
+
+def extract_concurrently(pending: List[Dict[str, Any]], deadline: Optional[float] = None) -> None:
+    """
+    Run the LLM extractions of the pending sessions on WORKOUT_EXTRACTION_WORKERS threads
+    (one per WORKOUT_EXTRACTION_PROCESSES pool process with the local backend, where the
+    threads only wait on the pool). Only the LLM calls run in parallel; sessions are
+    saved afterwards on the calling thread.
+    Args:
+        pending: Sessions from prepare_session
+        deadline: time.monotonic() value to stop waiting at; sessions not extracted
+                  by then are left without 'llm_exercises' for the next run
+    """
+    batches = plan_batches(pending)
+    if not batches:
+        return
+
+    workers = WORKOUT_EXTRACTION_PROCESSES if _local_extraction() else WORKOUT_EXTRACTION_WORKERS
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='workout-extraction')
+    try:
+        futures = [executor.submit(extract_batch, batch) for batch in batches]
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            logger.warning(f"{len(not_done)} of {len(futures)} extraction requests didn't finish before the deadline")
+    finally:
+        # Requests still queued are dropped; running ones finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def save_session(prepared: Dict[str, Any]) -> None:
+    """Write a prepared session's exercises and mark its new messages as processed"""
+    session = prepared['session']
+    workout_details = {
+        'exercises': prepared['exercises'] + prepared['llm_exercises'],
+        'parsed_from': prepared['message_blob'],
+    }
+    logger.info(f"Extracted workout details: {workout_details}")
+
+    # Transform the NLP output to match Exercise model fields
+    exercise_records = []
+    for exercise in workout_details['exercises']:
+        try:
+            exercise_record = {
+                'name': exercise['exercise_name'],
+                'weights': exercise['weight']['value'],
+                'weight_unit': exercise['weight']['unit'],
+                'sets': exercise['sets'],
+                'reps': int(exercise['reps'])
+            }
+            exercise_records.append(exercise_record)
+        except (KeyError, ValueError) as e:
+            logger.error(f"Failed to transform exercise data: {str(e)}")
+            continue
+
+    if not exercise_records:
+        logger.warning(f"No exercises found in workout details for session {session.id}")
+
+    # Exercises and processed messages are saved together, so a failure can't
+    # leave messages unmarked whose exercises were already added
+    with transaction.atomic():
+        if prepared['incremental']:
+            created_exercises = ExerciseDAO.add_session_exercises(session=session, exercises_data=exercise_records)
+            logger.info(f"Successfully added {len(created_exercises)} exercises for session {session.id}")
+        else:
+            # Only rows that changed are written, the rest keep their ids
+            changes = ExerciseDAO.reconcile_session_exercises(session=session, exercises_data=exercise_records)
+            logger.info(f"Successfully reconciled exercises for session {session.id}: {changes}")
+        WorkoutSessionDAO.add_processed_messages(session=session, raw_messages=prepared['new_messages'])
@@ -23,15 +23,28 @@ class BodyHistoryDAO:
         ('bulk', 'Bulk (Large and Powerful)'),
     ])
 
+    @staticmethod
+    def get_snapshot(user: WhatsAppUser) -> 'ProfileSnapshot':
+        """
+        Get the profile snapshot of a user. The snapshot lives on the user
+        instance, so it is scoped to the request that fetched the user.
+        """
+        snapshot = getattr(user, '_profile_snapshot', None)
+        if snapshot is None:
+            snapshot = ProfileSnapshot(user)
+            user._profile_snapshot = snapshot
+        return snapshot
+
     @staticmethod
     def get_latest_entry(user: WhatsAppUser) -> Optional[BodyHistory]:
         """Get user's most recent body history entry"""
-        return BodyHistory.objects.filter(user=user).order_by('-created_at').first()
+        return BodyHistoryDAO.get_snapshot(user).latest
 
     @staticmethod
     def create_entry(user: WhatsAppUser, **kwargs) -> BodyHistory:
         """Create a new body history entry, copying values from the latest entry"""
-        latest = BodyHistoryDAO.get_latest_entry(user)
+        snapshot = BodyHistoryDAO.get_snapshot(user)
+        latest = snapshot.latest
         
         # If there's a latest entry, copy its values
         if latest:
@@ -47,22 +60,23 @@ class BodyHistoryDAO:
             }
             # Update with any new values passed in
             new_data.update(kwargs)
-            return BodyHistory.objects.create(user=user, **new_data)
-        
-        # If no previous entry, just create with provided kwargs
-        return BodyHistory.objects.create(user=user, **kwargs)
+            entry = BodyHistory.objects.create(user=user, **new_data)
+        else:
+            # If no previous entry, just create with provided kwargs
+            entry = BodyHistory.objects.create(user=user, **kwargs)
+
+        snapshot.refresh(entry)
+        return entry
 
     @staticmethod
     def has_activity(user: WhatsAppUser) -> bool:
         """Check if user has activity level set"""
-        latest = BodyHistoryDAO.get_latest_entry(user)
-        return bool(latest and latest.activity)
+        return BodyHistoryDAO.get_snapshot(user).has_activity()
 
     @staticmethod
     def has_measurements(user: WhatsAppUser) -> bool:
         """Check if user has height and weight set"""
-        latest = BodyHistoryDAO.get_latest_entry(user)
-        return bool(latest and latest.height and latest.weight)
+        return BodyHistoryDAO.get_snapshot(user).has_measurements()
 
     @staticmethod
     def get_latest_metrics(user: WhatsAppUser):
@@ -72,11 +86,42 @@ class BodyHistoryDAO:
         Returns:
             BodyHistory object or None if no entries exist
         """
-        latest = BodyHistoryDAO.get_latest_entry(user)
-        return latest
+        return BodyHistoryDAO.get_snapshot(user).latest
 
     @staticmethod
     def has_goal(user: WhatsAppUser) -> bool:
         """Check if user has set their goal"""
-        latest = BodyHistory.objects.filter(user=user).order_by('-created_at').first()
-        return latest is not None and latest.goal is not None 
\ No newline at end of file
+        return BodyHistoryDAO.get_snapshot(user).has_goal()
+
+
+class ProfileSnapshot:
+    """
+    The latest BodyHistory row of a user, loaded once and used to answer all
+    profile predicates of a request. BodyHistoryDAO.create_entry refreshes it
+    when it writes a new row.
+    """
+    def __init__(self, user: WhatsAppUser):
+        self.user = user
+        self._latest = None
+        self._loaded = False
+
+    @property
+    def latest(self) -> Optional[BodyHistory]:
+        if not self._loaded:
+            self._latest = BodyHistory.objects.filter(user=self.user).order_by('-created_at').first()
+            self._loaded = True
+        return self._latest
+
+    def refresh(self, entry: BodyHistory) -> None:
+        """Replace the snapshot with a newly written entry"""
+        self._latest = entry
+        self._loaded = True
+
+    def has_activity(self) -> bool:
+        return bool(self.latest and self.latest.activity)
+
+    def has_measurements(self) -> bool:
+        return bool(self.latest and self.latest.height and self.latest.weight)
+
+    def has_goal(self) -> bool:
+        return self.latest is not None and self.latest.goal is not None
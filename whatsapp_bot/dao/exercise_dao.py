@@ -2,10 +2,13 @@ from django.db import transaction
 from django.db.models import QuerySet
 from ..models import Exercise, WorkoutSession, RawMessage
 from ..services.logger_service import get_logger
-from typing import List, Dict
+from typing import List, Dict, Set
 
 logger = get_logger(__name__)
 
+# Exercise fields compared and written when reconciling a session
+EXERCISE_FIELDS = ['weights', 'weight_unit', 'sets', 'reps', 'workout_machine']
+
 class ExerciseDAO:
     @staticmethod
     def replace_session_exercises(session: WorkoutSession, exercises_data: List[Dict]) -> List[Exercise]:
@@ -19,19 +22,7 @@ class ExerciseDAO:
         Returns:
             List of created Exercise instances
         """
-        # Prepare exercise objects outside transaction (in-memory operation)
-        exercise_objects = []
-        for exercise_data in exercises_data:
-            try:
-                exercise = Exercise(
-                    workout_session=session,
-                    **exercise_data  # Data should exactly match Exercise model fields
-                )
-                exercise_objects.append(exercise)
-            except Exception as e:
-                logger.error(f"Failed to prepare exercise record: {str(e)}")
-                continue
-        
+        exercise_objects = ExerciseDAO._build_exercises(session, exercises_data)
         if not exercise_objects:
             logger.warning("No valid exercise records to create")
             return []
@@ -51,6 +42,98 @@ class ExerciseDAO:
             logger.error(f"Failed to replace exercises for session {session.id}: {str(e)}")
             raise
 
+    @staticmethod
+    def reconcile_session_exercises(session: WorkoutSession, exercises_data: List[Dict]) -> Dict[str, int]:
+        """
+        Make a session's exercises match a new extraction with the fewest writes.
+        Rows are matched by (name, position among the rows with that name): matched
+        rows that changed are updated in place, new ones created and missing ones deleted.
+        Args:
+            session: WorkoutSession instance
+            exercises_data: List of dicts containing Exercise model fields, in log order
+        Returns:
+            dict with the number of rows 'inserted', 'updated', 'deleted' and 'unchanged'
+        """
+        exercise_objects = ExerciseDAO._build_exercises(session, exercises_data)
+        counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        if not exercise_objects:
+            logger.warning("No valid exercise records to reconcile")
+            return counts
+
+        try:
+            with transaction.atomic():
+                existing = {}
+                for row in Exercise.objects.filter(workout_session=session).order_by('id'):
+                    existing.setdefault(row.name, []).append(row)
+
+                to_update, to_create = [], []
+                positions = {}
+                for exercise in exercise_objects:
+                    position = positions.get(exercise.name, 0)
+                    positions[exercise.name] = position + 1
+                    rows = existing.get(exercise.name, [])
+                    if position >= len(rows):
+                        to_create.append(exercise)
+                        continue
+                    row = rows[position]
+                    changed = [field for field in EXERCISE_FIELDS if getattr(row, field) != getattr(exercise, field)]
+                    if changed:
+                        for field in changed:
+                            setattr(row, field, getattr(exercise, field))
+                        to_update.append(row)
+                    else:
+                        counts['unchanged'] += 1
+
+                to_delete = [row.id for name, rows in existing.items() for row in rows[positions.get(name, 0):]]
+
+                if to_update:
+                    Exercise.objects.bulk_update(to_update, EXERCISE_FIELDS)
+                if to_create:
+                    Exercise.objects.bulk_create(to_create)
+                if to_delete:
+                    Exercise.objects.filter(id__in=to_delete).delete()
+
+            counts.update(inserted=len(to_create), updated=len(to_update), deleted=len(to_delete))
+            logger.info(f"Reconciled exercises for session {session.id}: {counts}")
+            return counts
+
+        except Exception as e:
+            logger.error(f"Failed to reconcile exercises for session {session.id}: {str(e)}")
+            raise
+
+    @staticmethod
+    def add_session_exercises(session: WorkoutSession, exercises_data: List[Dict]) -> List[Exercise]:
+        """
+        Add exercises parsed from a session's new messages, keeping the existing ones
+        Args:
+            session: WorkoutSession instance
+            exercises_data: List of dicts containing Exercise model fields
+        Returns:
+            List of created Exercise instances
+        """
+        exercise_objects = ExerciseDAO._build_exercises(session, exercises_data)
+        if not exercise_objects:
+            return []
+        created_exercises = Exercise.objects.bulk_create(exercise_objects)
+        logger.info(f"Bulk created {len(created_exercises)} exercise records for session {session.id}")
+        return created_exercises
+
+    @staticmethod
+    def _build_exercises(session: WorkoutSession, exercises_data: List[Dict]) -> List[Exercise]:
+        # Prepare exercise objects outside transaction (in-memory operation)
+        exercise_objects = []
+        for exercise_data in exercises_data:
+            try:
+                exercise = Exercise(
+                    workout_session=session,
+                    **exercise_data  # Data should exactly match Exercise model fields
+                )
+                exercise_objects.append(exercise)
+            except Exception as e:
+                logger.error(f"Failed to prepare exercise record: {str(e)}")
+                continue
+        return exercise_objects
+
 
 class WorkoutSessionDAO:
     @staticmethod
@@ -66,4 +149,20 @@ class WorkoutSessionDAO:
             logger.info(f"Updated processed messages for session {session.id}")
         except Exception as e:
             logger.error(f"Failed to update processed messages for session {session.id}: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    @staticmethod
+    def get_processed_message_ids(session: WorkoutSession) -> Set[int]:
+        """IDs of the session's raw messages that have already been parsed"""
+        return set(session.processed_messages.values_list('id', flat=True))
+
+    @staticmethod
+    def add_processed_messages(session: WorkoutSession, raw_messages: List[RawMessage]) -> None:
+        """
+        Mark raw messages as parsed, keeping the ones marked before
+        Args:
+            session: WorkoutSession instance
+            raw_messages: RawMessage instances that were processed
+        """
+        session.processed_messages.add(*raw_messages)
+        logger.info(f"Marked {len(raw_messages)} messages as processed for session {session.id}")
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from typing import Dict, Optional
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from ..models import LLMCacheEntry
+
+
+class LLMCacheDAO:
+    @staticmethod
+    def get(key: str) -> Optional[str]:
+        """
+        Get a cached result and count the hit
+        Args:
+            key: Cache key built by ai_services.llm_cache
+        Returns:
+            str: The JSON encoded result, or None when missing or expired
+        """
+        value = LLMCacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).values_list('value', flat=True).first()
+        if value is not None:
+            LLMCacheEntry.objects.filter(key=key).update(hits=F('hits') + 1)
+        return value
+
+    @staticmethod
+    def set(key: str, namespace: str, value: str, ttl_seconds: int) -> None:
+        """Store a result, replacing an expired entry with the same key"""
+        now = timezone.now()
+        LLMCacheEntry.objects.bulk_create(
+            [LLMCacheEntry(key=key, namespace=namespace, value=value, created_at=now,
+                           expires_at=now + timedelta(seconds=ttl_seconds))],
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['value', 'created_at', 'expires_at'],
+        )
+
+    @staticmethod
+    def purge(max_rows: int) -> int:
+        """
+        Delete expired entries, then the oldest entries beyond max_rows
+        Returns:
+            int: Number of entries deleted
+        """
+        deleted, _ = LLMCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        cutoff = (
+            LLMCacheEntry.objects.order_by('-created_at')
+            .values_list('created_at', flat=True)[max_rows:max_rows + 1]
+            .first()
+        )
+        if cutoff is not None:
+            trimmed, _ = LLMCacheEntry.objects.filter(created_at__lte=cutoff).delete()
+            deleted += trimmed
+        return deleted
+
+    @staticmethod
+    def get_stats() -> Dict[str, Dict[str, int]]:
+        """Entries and hits per namespace"""
+        return {
+            row['namespace']: {'entries': row['entries'], 'hits': row['hits'] or 0}
+            for row in LLMCacheEntry.objects.values('namespace').annotate(entries=Count('key'), hits=Sum('hits'))
+        }
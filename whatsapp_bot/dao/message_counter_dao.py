@@ -0,0 +1,57 @@
+from datetime import date
+import pytz
+from django.db import connection
+from django.utils import timezone
+from ..models import DailyMessageCount, WhatsAppUser
+
+IST_TIMEZONE = pytz.timezone('Asia/Kolkata')
+
+
+class MessageCounterDAO:
+    @staticmethod
+    def today() -> date:
+        """Current calendar day in IST, the day the free message limit resets on"""
+        return timezone.now().astimezone(IST_TIMEZONE).date()
+
+    @staticmethod
+    def increment(user: WhatsAppUser, day: date = None) -> int:
+        """
+        Count one more incoming message for a user, creating the day's row on
+        the first message. A single upsert, so concurrent messages can't lose updates.
+        Args:
+            user: The WhatsAppUser object
+            day: IST day to count the message on, defaults to today
+        Returns:
+            int: The user's message count for the day, including this message
+        """
+        day = day or MessageCounterDAO.today()
+        table = connection.ops.quote_name(DailyMessageCount._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, day, count) VALUES (%s, %s, 1) "
+                f"ON CONFLICT (user_id, day) DO UPDATE SET count = {table}.count + 1 "
+                f"RETURNING count",
+                [user.id, day]
+            )
+            count = cursor.fetchone()[0]
+        # Remember the count so the subscription check in this request needs no query
+        user._message_count = (day, count)
+        return count
+
+    @staticmethod
+    def get_count(user: WhatsAppUser, day: date = None) -> int:
+        """
+        Get the number of messages a user sent on a day
+        Args:
+            user: The WhatsAppUser object
+            day: IST day to read, defaults to today
+        Returns:
+            int: Number of messages, 0 when the user hasn't written that day
+        """
+        day = day or MessageCounterDAO.today()
+        cached = getattr(user, '_message_count', None)
+        if cached and cached[0] == day:
+            return cached[1]
+        count = DailyMessageCount.objects.filter(user=user, day=day).values_list('count', flat=True).first() or 0
+        user._message_count = (day, count)
+        return count
@@ -0,0 +1,103 @@
+from typing import List
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q, F, Exists, OuterRef
+from django.utils import timezone
+from ..models import MessageJob, RawMessage
+from ..utils.config import MESSAGE_QUEUE_MAX_ATTEMPTS, MESSAGE_QUEUE_STALE_LOCK_SECONDS
+
+class MessageJobDAO:
+    @staticmethod
+    def enqueue(raw_message: RawMessage, payload: dict) -> MessageJob:
+        """Queue an inbound message for background handling"""
+        return MessageJob.objects.create(raw_message=raw_message, payload=payload)
+
+    @staticmethod
+    def claim_batch(limit: int) -> List[MessageJob]:
+        """
+        Claim up to `limit` pending jobs for processing.
+        Only the oldest pending job of each user is claimed, and users with a job
+        already in progress are skipped, so one user's messages are handled in order.
+        Jobs whose lock is older than MESSAGE_QUEUE_STALE_LOCK_SECONDS are reclaimed.
+        Args:
+            limit: Maximum number of jobs to claim
+        Returns:
+            List of claimed MessageJob instances with raw_message and user loaded
+        """
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=MESSAGE_QUEUE_STALE_LOCK_SECONDS)
+        runnable = Q(status='pending') | Q(status='processing', locked_at__lt=stale_before)
+        earlier_pending = MessageJob.objects.filter(
+            status='pending',
+            raw_message__user=OuterRef('raw_message__user'),
+            created_at__lt=OuterRef('created_at')
+        )
+        in_progress = MessageJob.objects.filter(
+            status='processing',
+            locked_at__gte=stale_before,
+            raw_message__user=OuterRef('raw_message__user')
+        )
+
+        with transaction.atomic():
+            candidates = list(
+                MessageJob.objects.select_for_update(skip_locked=True, of=('self',))
+                .annotate(user_id=F('raw_message__user_id'))
+                .filter(runnable)
+                .filter(~Exists(earlier_pending), ~Exists(in_progress))
+                .order_by('created_at')[:limit * 2]
+            )
+            seen_users = set()
+            claimed = []
+            for job in candidates:
+                if job.user_id in seen_users:
+                    continue
+                seen_users.add(job.user_id)
+                claimed.append(job)
+                if len(claimed) >= limit:
+                    break
+
+            if not claimed:
+                return []
+
+            for job in claimed:
+                job.status = 'processing'
+                job.locked_at = now
+                job.attempts += 1
+            MessageJob.objects.bulk_update(claimed, ['status', 'locked_at', 'attempts'])
+
+        return list(
+            MessageJob.objects.filter(id__in=[job.id for job in claimed])
+            .select_related('raw_message__user')
+            .order_by('created_at')
+        )
+
+    @staticmethod
+    def save_progress(job: MessageJob, messages_sent: int) -> None:
+        """Record how many replies of the job have been delivered"""
+        job.messages_sent = messages_sent
+        MessageJob.objects.filter(id=job.id).update(messages_sent=messages_sent)
+
+    @staticmethod
+    def mark_done(job: MessageJob) -> None:
+        """Mark a job as successfully processed"""
+        MessageJob.objects.filter(id=job.id).update(
+            status='done',
+            locked_at=None,
+            last_error=None,
+            processed_at=timezone.now()
+        )
+
+    @staticmethod
+    def mark_failed(job: MessageJob, error: str) -> None:
+        """
+        Record a failed attempt. The job goes back to pending until it has used
+        MESSAGE_QUEUE_MAX_ATTEMPTS attempts, after which it is marked failed.
+        A retry doesn't handle the message again if its response was stored; it
+        only delivers the replies that weren't sent yet.
+        """
+        status = 'failed' if job.attempts >= MESSAGE_QUEUE_MAX_ATTEMPTS else 'pending'
+        MessageJob.objects.filter(id=job.id).update(
+            status=status,
+            locked_at=None,
+            last_error=error
+        )
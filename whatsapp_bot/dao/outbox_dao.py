@@ -0,0 +1,82 @@
+from typing import List
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import OutboundMessage, WhatsAppUser
+from ..utils.config import OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS, OUTBOX_STALE_LOCK_SECONDS
+
+class OutboxDAO:
+    @staticmethod
+    def enqueue_template(user: WhatsAppUser, content_sid: str, content_variables: str = None) -> OutboundMessage:
+        """
+        Queue a template message. Call this inside the transaction that makes the
+        state change the message is about, so both commit or neither does.
+        """
+        return OutboundMessage.objects.create(user=user, content_sid=content_sid, content_variables=content_variables)
+
+    @staticmethod
+    def enqueue_message(user: WhatsAppUser, body: str) -> OutboundMessage:
+        """Queue a free-form text message"""
+        return OutboundMessage.objects.create(user=user, body=body)
+
+    @staticmethod
+    def claim_batch(limit: int) -> List[OutboundMessage]:
+        """
+        Claim due messages for sending. Messages left in 'sending' by a dispatcher
+        that died are reclaimed after OUTBOX_STALE_LOCK_SECONDS.
+        Args:
+            limit: Maximum number of messages to claim
+        Returns:
+            List of claimed OutboundMessage instances with their user loaded
+        """
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=OUTBOX_STALE_LOCK_SECONDS)
+        due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', locked_at__lt=stale_before)
+
+        with transaction.atomic():
+            claimed = list(
+                OutboundMessage.objects.select_for_update(skip_locked=True)
+                .filter(due)
+                .order_by('next_attempt_at')[:limit]
+            )
+            if not claimed:
+                return []
+            for message in claimed:
+                message.status = 'sending'
+                message.locked_at = now
+                message.attempts += 1
+            OutboundMessage.objects.bulk_update(claimed, ['status', 'locked_at', 'attempts'])
+
+        return list(
+            OutboundMessage.objects.filter(id__in=[message.id for message in claimed])
+            .select_related('user')
+            .order_by('created_at')
+        )
+
+    @staticmethod
+    def mark_sent(message: OutboundMessage, twilio_sid: str = None) -> None:
+        OutboundMessage.objects.filter(id=message.id).update(
+            status='sent',
+            locked_at=None,
+            last_error=None,
+            twilio_sid=twilio_sid,
+            sent_at=timezone.now()
+        )
+
+    @staticmethod
+    def mark_failed(message: OutboundMessage, error: str) -> None:
+        """
+        Record a failed send. The message is retried with exponential backoff
+        until it has used OUTBOX_MAX_ATTEMPTS attempts, then marked failed.
+        """
+        if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            OutboundMessage.objects.filter(id=message.id).update(status='failed', locked_at=None, last_error=error)
+            return
+        delay = OUTBOX_RETRY_BASE_SECONDS * (2 ** (message.attempts - 1))
+        OutboundMessage.objects.filter(id=message.id).update(
+            status='pending',
+            locked_at=None,
+            last_error=error,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay)
+        )
@@ -1,11 +1,158 @@
-from ..models import RawMessage, WhatsAppUser
+import contextvars
+from typing import Optional, List, Tuple
+from asgiref.sync import sync_to_async
+from django.db.models import Exists, OuterRef, Q
+from ..models import RawMessage, WhatsAppUser, MessageJob
+from .message_counter_dao import MessageCounterDAO
+from ..services import logger_service
 from django.utils import timezone
 from datetime import datetime
 
+logger = logger_service.get_logger()
+
+_outgoing_buffer = contextvars.ContextVar('outgoing_message_buffer', default=None)
+
+
+class OutgoingMessageBuffer:
+    """
+    Collects outgoing message logs for the duration of a request or cron run
+    and writes them with a single bulk_create on exit, including error exits.
+    Works as a sync and async context manager; nested buffers defer to the outer one.
+    """
+    def __init__(self):
+        self.messages: List[RawMessage] = []
+        self._token = None
+
+    def __enter__(self):
+        if _outgoing_buffer.get() is None:
+            self._token = _outgoing_buffer.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _outgoing_buffer.reset(self._token)
+            self._token = None
+            self.flush()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _outgoing_buffer.reset(self._token)
+            self._token = None
+            await sync_to_async(self.flush)()
+        return False
+
+    def flush(self) -> None:
+        if not self.messages:
+            return
+        messages, self.messages = self.messages, []
+        try:
+            RawMessage.objects.bulk_create(messages)
+        except Exception as e:
+            logger.error(f"Failed to write {len(messages)} buffered outgoing messages: {str(e)}")
+
+
 class RawMessageDAO:
     @staticmethod
-    def create_raw_message(user: WhatsAppUser, message: str, incoming: bool) -> RawMessage:
-        return RawMessage.objects.create(user=user, message=message, incoming=incoming)
+    def create_raw_message(user: WhatsAppUser, message: str, incoming: bool, message_sid: str = None,
+                           handling: bool = False) -> RawMessage:
+        """
+        Store a message and count it towards the user's daily limit if it is incoming.
+        Called once per Twilio message: retries reuse the stored row (see claim_for_retry).
+        Args:
+            handling: Mark the message as being handled by the current request
+        """
+        raw_message = RawMessage.objects.create(user=user, message=message, incoming=incoming, message_sid=message_sid,
+                                                handling_started_at=timezone.now() if handling else None)
+        if incoming:
+            MessageCounterDAO.increment(user)
+        return raw_message
+
+    @staticmethod
+    def log_outgoing(user: WhatsAppUser, message: str) -> None:
+        """
+        Log a message sent to the user. Inside an OutgoingMessageBuffer the row is
+        written when the buffer exits, otherwise it is written immediately.
+        """
+        buffer = _outgoing_buffer.get()
+        if buffer is None:
+            RawMessage.objects.create(user=user, message=message, incoming=False)
+        else:
+            buffer.messages.append(RawMessage(user=user, message=message, incoming=False))
+
+    @staticmethod
+    def buffer_outgoing() -> OutgoingMessageBuffer:
+        """Context manager that batches outgoing message logs into one INSERT"""
+        return OutgoingMessageBuffer()
+
+    @staticmethod
+    def get_by_message_sid(message_sid: str) -> Optional[RawMessage]:
+        """Get the inbound message stored for a Twilio MessageSid, annotated with whether it was queued"""
+        return (
+            RawMessage.objects.filter(message_sid=message_sid)
+            .annotate(queued=Exists(MessageJob.objects.filter(raw_message=OuterRef('pk'))))
+            .select_related('user')
+            .first()
+        )
+
+    @staticmethod
+    def claim_for_retry(raw_message: RawMessage, stale_before: datetime) -> bool:
+        """
+        Take over handling of an unanswered inbound message for a Twilio retry. Possible
+        when its handling failed, or started before `stale_before` (the worker died).
+        The same row is handled again, so the message isn't stored or counted twice.
+        Args:
+            raw_message: The inbound message
+            stale_before: Handling started before this time was abandoned
+        Returns:
+            True if the caller now handles the message
+        """
+        return RawMessage.objects.filter(
+            Q(handling_started_at__isnull=True) | Q(handling_started_at__lt=stale_before),
+            id=raw_message.id, response__isnull=True,
+        ).update(handling_started_at=timezone.now()) == 1
+
+    @staticmethod
+    def mark_handling_failed(raw_message: RawMessage) -> None:
+        """Let Twilio's retry of an inbound message whose handling failed claim it right away"""
+        RawMessage.objects.filter(id=raw_message.id, response__isnull=True).update(handling_started_at=None)
+
+    @staticmethod
+    def save_response(raw_message: RawMessage, response: str) -> None:
+        """Store the TwiML rendered for an inbound message so retries can replay it"""
+        RawMessage.objects.filter(id=raw_message.id).update(response=response)
+
+    @staticmethod
+    def save_intent(raw_message: RawMessage, intent: str, source: str) -> None:
+        """Store how an inbound message was classified, for retraining the intent model"""
+        RawMessage.objects.filter(id=raw_message.id).update(intent=intent, intent_source=source)
+
+    @staticmethod
+    def get_labelled_messages(sources: List[str]) -> List[Tuple[str, str, str]]:
+        """
+        Get inbound messages with an intent label
+        Args:
+            sources: Intent sources to include. Labels from other sources are left out,
+                so the intent model isn't trained on its own (or the rules') answers.
+        Returns:
+            List of (message, intent, source). Messages that were added to a workout
+            session without a label from `sources` are labelled exercise with source 'session'.
+        """
+        labelled = list(
+            RawMessage.objects.filter(incoming=True, intent_source__in=sources)
+            .values_list('message', 'intent', 'intent_source')
+        )
+        logged_workouts = (
+            RawMessage.objects.filter(incoming=True, raw_workout_sessions__isnull=False)
+            .exclude(intent_source__in=sources)
+            .values_list('message', flat=True)
+            .distinct()
+        )
+        labelled.extend((message, 'exercise', 'session') for message in logged_workouts)
+        return labelled
 
     @staticmethod
     def count_messages_since(user: WhatsAppUser, since_datetime: datetime) -> int:
@@ -122,3 +122,10 @@ class UserDAO:
         user.paid = paid
         user.save()
         return user
+
+    @staticmethod
+    def update_onboarding_state(user: WhatsAppUser, state: str) -> WhatsAppUser:
+        """Update user's onboarding state"""
+        WhatsAppUser.objects.filter(pk=user.pk).update(onboarding_state=state)
+        user.onboarding_state = state
+        return user
@@ -0,0 +1,94 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter per measurement, so nothing is imported yet
+PROBE = '''
+import importlib, json, sys, time
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+result = {'interpreter_mb': rss_mb()}
+started = time.perf_counter()
+import django
+django.setup()
+result['django_ms'] = (time.perf_counter() - started) * 1000
+result['django_mb'] = rss_mb()
+
+started = time.perf_counter()
+for module in MODULES:
+    importlib.import_module(module)
+result['app_ms'] = (time.perf_counter() - started) * 1000
+result['app_mb'] = rss_mb()
+
+from whatsapp_bot.ai_services import backends
+result['loaded_at_startup'] = backends.loaded()
+errors = {}
+started = time.perf_counter()
+for name in list(backends._factories):
+    try:
+        backends.get(name)
+    except Exception as e:
+        errors[name] = repr(e)
+result['backends_ms'] = (time.perf_counter() - started) * 1000
+result['backends_mb'] = rss_mb()
+result['backend_errors'] = errors
+print('RESULT ' + json.dumps(result))
+'''
+
+# What a web worker and the workout cron import at startup
+STARTUP_MODULES = ['whatsapp_bot.urls', 'whatsapp_bot.cron_services.process_pending_workout_messages']
+
+
+class Command(BaseCommand):
+    help = 'Measure the import time and memory of a worker starting up, with LLM backends lazy and loaded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Fresh interpreters to measure; medians are reported')
+        parser.add_argument('--module', action='append', dest='modules',
+                            help=f"Module imported at startup (default: {', '.join(STARTUP_MODULES)})")
+
+    def handle(self, *args, **options):
+        modules = options['modules'] or STARTUP_MODULES
+        probe = f"MODULES = {modules!r}\n{PROBE}"
+        results = []
+        for run in range(options['runs']):
+            completed = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, env=os.environ.copy())
+            lines = [line for line in completed.stdout.splitlines() if line.startswith('RESULT ')]
+            if completed.returncode != 0 or not lines:
+                raise CommandError(f"Startup probe failed:\n{completed.stderr[-2000:]}")
+            results.append(json.loads(lines[-1][len('RESULT '):]))
+
+        median = lambda key: statistics.median(result[key] for result in results)
+        last = results[-1]
+        lazy_ms = median('django_ms') + median('app_ms')
+        eager_ms = lazy_ms + median('backends_ms')
+
+        self.stdout.write(f"Startup of {', '.join(modules)}, median of {len(results)} runs:")
+        self.stdout.write(f"  django.setup()          {median('django_ms'):8.0f} ms  {median('django_mb'):7.1f} MB RSS")
+        self.stdout.write(f"  app modules             {median('app_ms'):8.0f} ms  {median('app_mb'):7.1f} MB RSS")
+        self.stdout.write(f"  LLM backends on first use {median('backends_ms'):6.0f} ms  "
+                          f"{median('backends_mb') - median('app_mb'):+7.1f} MB RSS")
+        self.stdout.write(f"Lazy backends (now):      {lazy_ms:8.0f} ms  {median('app_mb'):7.1f} MB RSS")
+        self.stdout.write(f"Eager backends (before):  {eager_ms:8.0f} ms  {median('backends_mb'):7.1f} MB RSS")
+
+        if last['loaded_at_startup']:
+            self.stdout.write(self.style.WARNING(f"Backends loaded during startup: {', '.join(last['loaded_at_startup'])}"))
+        for name, error in last['backend_errors'].items():
+            self.stdout.write(self.style.WARNING(f"Backend {name} failed to load, not counted: {error}"))
+        if options['verbosity'] > 1:
+            self.stdout.write(json.dumps({'runs': results}, indent=2))
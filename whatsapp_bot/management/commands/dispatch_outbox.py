@@ -0,0 +1,38 @@
+import asyncio
+import signal
+from django.core.management.base import BaseCommand
+from ...services.outbox_dispatcher import run_dispatcher
+from ...utils.config import OUTBOX_BATCH_SIZE, OUTBOX_CONCURRENCY, OUTBOX_POLL_SECONDS
+
+class Command(BaseCommand):
+    help = 'Send queued outbox messages through the Twilio API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE,
+                            help='Messages claimed per batch')
+        parser.add_argument('--concurrency', type=int, default=OUTBOX_CONCURRENCY,
+                            help='Maximum number of Twilio requests in flight')
+        parser.add_argument('--poll-interval', type=float, default=OUTBOX_POLL_SECONDS,
+                            help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Send what is due and exit')
+
+    def handle(self, *args, **options):
+        stopping = {'value': False}
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after the current batch...')
+            stopping['value'] = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write('Starting outbox dispatcher...')
+        totals = asyncio.run(run_dispatcher(
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+            should_stop=lambda: stopping['value']
+        ))
+        self.stdout.write(self.style.SUCCESS(f'Outbox dispatcher stopped. {totals}'))
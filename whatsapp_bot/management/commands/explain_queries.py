@@ -0,0 +1,223 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q, F
+from django.utils import timezone
+from ...models import (
+    WhatsAppUser, RawMessage, DailyMessageCount, MessageJob, OutboundMessage,
+    BodyHistory, WorkoutSession, PaymentHistory
+)
+from ...dao.raw_message_dao import RawMessageDAO
+from ...dao.message_counter_dao import MessageCounterDAO
+from ...dao.message_job_dao import MessageJobDAO
+from ...dao.outbox_dao import OutboxDAO
+from ...dao.body_history_dao import BodyHistoryDAO
+from ...dao.user_dao import UserDAO
+from ...dao.workout_session_dao import WorkoutSessionDAO
+from ...dao.payment_dao import PaymentDAO
+
+# Tables seeded large enough that a sequential scan means a missing index
+LARGE_TABLES = [model._meta.db_table for model in (
+    RawMessage, DailyMessageCount, MessageJob, OutboundMessage,
+    BodyHistory, WorkoutSession, PaymentHistory, WorkoutSession.raw_messages.through
+)]
+
+
+class Rollback(Exception):
+    """Raised to roll back the seeded data once the plans are checked"""
+
+
+@contextmanager
+def seeded_timestamps(*models):
+    """Let bulk_create keep the created_at values we set instead of auto_now_add"""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot DAO queries on a seeded dataset and fail on sequential scans (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500,
+                            help='Number of users to seed')
+        parser.add_argument('--messages-per-user', type=int, default=200,
+                            help='Raw messages seeded per user')
+        parser.add_argument('--sessions-per-user', type=int, default=100,
+                            help='Workout sessions seeded per user')
+        parser.add_argument('--days', type=int, default=90,
+                            help='Days of history the seeded rows are spread over')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('explain_queries needs a PostgreSQL database')
+
+        failures = []
+        try:
+            with transaction.atomic():
+                users = self.seed(options)
+                for label, queries in self.capture(users):
+                    for sql, params in queries:
+                        plan = self.explain(sql, params)
+                        seq_scans = [line.strip() for line in plan if self.is_large_seq_scan(line)]
+                        if seq_scans:
+                            failures.append(label)
+                            self.stdout.write(self.style.ERROR(f"{label}: {'; '.join(seq_scans)}"))
+                        else:
+                            self.stdout.write(self.style.SUCCESS(f"{label}: index scan"))
+                        if options['verbose_plans'] or seq_scans:
+                            self.stdout.write('\n'.join(f"    {line}" for line in plan))
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"Sequential scans in: {', '.join(sorted(set(failures)))}")
+        self.stdout.write(self.style.SUCCESS('All queries use indexes'))
+
+    def seed(self, options) -> list:
+        """Insert a large, time-ordered dataset inside the current transaction"""
+        now = timezone.now()
+        span = timedelta(days=options['days'])
+        rng = random.Random(42)
+        self.stdout.write(f"Seeding {options['users']} users...")
+
+        users = WhatsAppUser.objects.bulk_create([
+            WhatsAppUser(phone_number=f"+1555{i:07d}", name=f"User {i}", onboarding_state='completed')
+            for i in range(options['users'])
+        ])
+
+        def spread(count):
+            # Ascending timestamps, like the append-only production tables
+            step = span / max(count, 1)
+            return [now - span + step * i for i in range(count)]
+
+        with seeded_timestamps(RawMessage, WorkoutSession, BodyHistory, PaymentHistory, MessageJob, OutboundMessage):
+            total = options['users'] * options['messages_per_user']
+            raw_messages = RawMessage.objects.bulk_create([
+                RawMessage(user=rng.choice(users), message='bench 3x10 60kg', incoming=i % 2 == 0,
+                           message_sid=f"SM{i:032d}", created_at=created_at)
+                for i, created_at in enumerate(spread(total))
+            ], batch_size=5000)
+
+            total = options['users'] * options['sessions_per_user']
+            sessions = WorkoutSession.objects.bulk_create([
+                WorkoutSession(user=rng.choice(users), activity_type='gym', created_at=created_at,
+                               eod_summary_sent=True)
+                for created_at in spread(total)
+            ], batch_size=5000)
+            Through = WorkoutSession.raw_messages.through
+            Through.objects.bulk_create([
+                Through(workoutsession_id=session.id, rawmessage_id=raw_message.id)
+                for session, raw_message in zip(sessions, raw_messages)
+            ], batch_size=5000)
+
+            # BodyHistory.save() copies the previous entry, bulk_create skips it
+            BodyHistory.objects.bulk_create([
+                BodyHistory(user=user, height=175, weight=70 + i, activity='moderate', goal='lean',
+                            created_at=now - span + span * i / 20)
+                for user in users for i in range(20)
+            ], batch_size=5000)
+
+            PaymentHistory.objects.bulk_create([
+                PaymentHistory(user=user, subscription_id=f"sub_{user.id}_{i}", type='subscription',
+                               amount=100, status='active', created_at=now - timedelta(days=30 * i))
+                for user in users for i in range(4)
+            ], batch_size=5000)
+
+            # Nearly every job and outbox row is finished, as in production
+            MessageJob.objects.bulk_create([
+                MessageJob(raw_message=raw_message, payload={}, status='pending' if i % 1000 == 0 else 'done',
+                           created_at=raw_message.created_at)
+                for i, raw_message in enumerate(raw_messages) if raw_message.incoming
+            ], batch_size=5000)
+            OutboundMessage.objects.bulk_create([
+                OutboundMessage(user=raw_message.user, content_sid='HX0', status='pending' if i % 1000 == 0 else 'sent',
+                                next_attempt_at=raw_message.created_at, created_at=raw_message.created_at)
+                for i, raw_message in enumerate(raw_messages) if not raw_message.incoming
+            ], batch_size=5000)
+
+        today = MessageCounterDAO.today()
+        DailyMessageCount.objects.bulk_create([
+            DailyMessageCount(user=user, day=today - timedelta(days=d), count=3)
+            for user in users for d in range(options['days'])
+        ], batch_size=5000)
+
+        with connection.cursor() as cursor:
+            for table in LARGE_TABLES + [WhatsAppUser._meta.db_table]:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+        return users
+
+    def capture(self, users: list):
+        """
+        Run each hot query and record the SQL it executes
+        Yields:
+            (label, [(sql, params), ...]) for every query that was run
+        """
+        now = timezone.now()
+        # Fresh instances, so per-request caches on the user don't hide queries
+        user = WhatsAppUser.objects.get(id=users[len(users) // 2].id)
+        payment = PaymentHistory.objects.filter(user=user).first()
+        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        week_ago = now - timedelta(days=7)
+
+        checks = [
+            ('RawMessageDAO.count_messages_since', lambda: RawMessageDAO.count_messages_since(user, start_of_day)),
+            ('RawMessageDAO.get_by_message_sid', lambda: RawMessageDAO.get_by_message_sid('SM' + '0' * 32)),
+            ('MessageCounterDAO.get_count', lambda: MessageCounterDAO.get_count(user)),
+            ('BodyHistoryDAO.get_latest_entry', lambda: BodyHistoryDAO.get_latest_entry(user)),
+            ('UserDAO.get_body_history', lambda: UserDAO.get_body_history(user)),
+            ('WorkoutSessionDAO.get_active_session', lambda: WorkoutSessionDAO.get_active_session(user)),
+            ('PaymentDAO.get_user_payments', lambda: PaymentDAO.get_user_payments(user)),
+            ('PaymentDAO.get_payment_by_subscription_id',
+             lambda: PaymentDAO.get_payment_by_subscription_id(payment.subscription_id)),
+            ('MessageJobDAO.claim_batch', lambda: MessageJobDAO.claim_batch(10)),
+            ('OutboxDAO.claim_batch', lambda: OutboxDAO.claim_batch(10)),
+            # Query shapes of the summary and pending-message crons
+            ('EOD sessions', lambda: list(
+                WorkoutSession.objects.filter(created_at__range=(start_of_day, now)).order_by('user_id', 'created_at')
+            )),
+            ('EOW users', lambda: list(
+                WhatsAppUser.objects.filter(workouts__created_at__range=(week_ago, now)).distinct()
+            )),
+            ('EOW user sessions', lambda: list(
+                WorkoutSession.objects.filter(user=user, created_at__range=(week_ago, now)).order_by('created_at')
+            )),
+            ('Pending workout sessions', lambda: list(
+                WorkoutSession.objects.filter(created_at__gte=now - timedelta(hours=8)).annotate(
+                    raw_count=Count('raw_messages', distinct=True),
+                    processed_count=Count('processed_messages', distinct=True)
+                ).filter(Q(raw_count__gt=0) & Q(raw_count__gt=F('processed_count'))).values('id')
+            )),
+        ]
+
+        for label, run in checks:
+            queries = []
+
+            def record(execute, sql, params, many, context):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    queries.append((sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(record):
+                run()
+            yield label, queries
+
+    def explain(self, sql: str, params) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def is_large_seq_scan(self, line: str) -> bool:
+        return 'Seq Scan on' in line and any(
+            f"Seq Scan on {table}" in line or f'Seq Scan on "{table}"' in line for table in LARGE_TABLES
+        )
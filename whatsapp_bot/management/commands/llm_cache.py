@@ -0,0 +1,19 @@
+import json
+from django.core.management.base import BaseCommand
+from ...dao.llm_cache_dao import LLMCacheDAO
+from ...utils.config import LLM_CACHE_MAX_ROWS
+
+class Command(BaseCommand):
+    help = 'Show LLM cache entries and hits per task, optionally evicting expired and excess entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete expired entries and the oldest beyond --max-rows')
+        parser.add_argument('--max-rows', type=int, default=LLM_CACHE_MAX_ROWS,
+                            help='Entries to keep when purging')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            deleted = LLMCacheDAO.purge(options['max_rows'])
+            self.stdout.write(f"Deleted {deleted} entries")
+        self.stdout.write(json.dumps(LLMCacheDAO.get_stats(), indent=2))
@@ -0,0 +1,34 @@
+import signal
+from django.core.management.base import BaseCommand
+from ...services.message_queue import run_workers
+from ...utils.config import MESSAGE_QUEUE_WORKERS, MESSAGE_QUEUE_POLL_SECONDS
+
+class Command(BaseCommand):
+    help = 'Run the worker pool that handles queued WhatsApp messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=MESSAGE_QUEUE_WORKERS,
+                            help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=MESSAGE_QUEUE_POLL_SECONDS,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        stopping = {'value': False}
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after the current batch...')
+            stopping['value'] = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(f"Starting message queue with {options['workers']} workers...")
+        stats = run_workers(
+            workers=options['workers'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+            should_stop=lambda: stopping['value']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Message queue stopped. {stats}"))
@@ -0,0 +1,83 @@
+import csv
+import json
+import zlib
+from collections import Counter, defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from ...ai_services.intents import SOURCE_LLM
+from ...ai_services.intent_model import train, evaluate, normalize, reload_model, LABELS, DEFAULT_BUCKETS
+from ...dao.raw_message_dao import RawMessageDAO
+from ...utils.config import INTENT_MODEL_PATH, INTENT_MODEL_MIN_CONFIDENCE
+
+class Command(BaseCommand):
+    help = 'Train the local intent classifier on labelled inbound messages and report its accuracy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=INTENT_MODEL_PATH,
+                            help='Where to write the model artifact')
+        parser.add_argument('--export', metavar='CSV',
+                            help='Also write the labelled messages to this CSV file')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Share of messages held out for the accuracy report')
+        parser.add_argument('--epochs', type=int, default=20)
+        parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS,
+                            help='Number of hashed n-gram features')
+        parser.add_argument('--threshold', type=float, default=INTENT_MODEL_MIN_CONFIDENCE,
+                            help='Confidence above which the model answers instead of the LLM')
+        parser.add_argument('--min-messages', type=int, default=200,
+                            help='Refuse to train on fewer distinct messages than this')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report accuracy without writing the artifact')
+
+    def handle(self, *args, **options):
+        # Rule and model labels would train the model to repeat its own mistakes
+        labelled = RawMessageDAO.get_labelled_messages(sources=[SOURCE_LLM])
+        self.stdout.write(f"Found {len(labelled)} labelled messages")
+
+        if options['export']:
+            with open(options['export'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['message', 'intent', 'source'])
+                writer.writerows(labelled)
+            self.stdout.write(f"Exported labelled messages to {options['export']}")
+
+        # One example per distinct text, labelled by majority vote
+        votes = defaultdict(Counter)
+        llm_labelled = set()
+        for message, intent, source in labelled:
+            if intent not in LABELS or not normalize(message):
+                continue
+            key = normalize(message)
+            votes[key][intent] += 1
+            if source == SOURCE_LLM:
+                llm_labelled.add(key)
+        examples = [(text, counts.most_common(1)[0][0]) for text, counts in votes.items()]
+
+        if len(examples) < options['min_messages']:
+            raise CommandError(f"Only {len(examples)} distinct labelled messages, need {options['min_messages']}")
+
+        # Stable split, so a message stays on the same side across retrains
+        cutoff = int(options['holdout'] * 100)
+        held_out = lambda text: zlib.crc32(text.encode()) % 100 < cutoff
+        train_set = [(text, label) for text, label in examples if not held_out(text)]
+        test_set = [(text, label) for text, label in examples if held_out(text)]
+        llm_test_set = [(text, label) for text, label in test_set if text in llm_labelled]
+
+        self.stdout.write(f"Training on {len(train_set)} messages, {len(test_set)} held out: "
+                          f"{dict(Counter(label for _, label in train_set))}")
+        model = train(
+            [text for text, _ in train_set], [label for _, label in train_set],
+            buckets=options['buckets'], epochs=options['epochs']
+        )
+
+        for name, subset in (('held-out', test_set), ('held-out, LLM labels', llm_test_set)):
+            if subset:
+                report = evaluate(model, [t for t, _ in subset], [l for _, l in subset], options['threshold'])
+                self.stdout.write(f"Accuracy report ({name}):\n{json.dumps(report, indent=2)}")
+
+        if options['dry_run']:
+            self.stdout.write('Dry run, model not saved')
+            return
+        model.save(options['output'])
+        if options['output'] == INTENT_MODEL_PATH:
+            reload_model()
+        self.stdout.write(self.style.SUCCESS(f"Saved intent model to {options['output']}"))
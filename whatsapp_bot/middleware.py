@@ -0,0 +1,66 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from .services import request_metrics
+from .services.logger_service import get_logger
+from .utils.config import REQUEST_METRICS_ENABLED, REQUEST_BUDGETS, DEFAULT_REQUEST_BUDGET
+
+logger = get_logger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records query count, SQL time, LLM time and Twilio time for every request,
+    logs requests that go over their view's budget and reports the numbers in a
+    Server-Timing header. Works under WSGI and ASGI. Disabled unless
+    REQUEST_METRICS_ENABLED is set, in which case it is removed from the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        request_metrics.install_query_recorder()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics, token = request_metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics.stop(token)
+        self.report(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = request_metrics.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics.stop(token)
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics: request_metrics.RequestMetrics) -> None:
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match else None
+        stats = metrics.as_dict()
+
+        response['Server-Timing'] = ', '.join([
+            f"total;dur={stats['total_ms']}",
+            f"db;dur={stats['sql_ms']};desc=\"{stats['queries']} queries\"",
+            f"llm;dur={stats['llm_ms']}",
+            f"twilio;dur={stats['twilio_ms']}",
+        ])
+
+        budget = REQUEST_BUDGETS.get(view, DEFAULT_REQUEST_BUDGET)
+        over = [key for key, limit in budget.items() if stats.get(key, 0) > limit]
+        if over:
+            logger.warning(f"{request.method} {request.path} ({view}) over budget on {', '.join(over)}: {stats}")
+        else:
+            logger.debug(f"{request.method} {request.path} ({view}): {stats}")
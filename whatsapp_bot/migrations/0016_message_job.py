@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-17 21:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0015_alter_exercise_weight_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutsession',
+            name='eod_summary_sent',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='MessageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('raw_message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='whatsapp_bot.rawmessage')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-17 21:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0016_message_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawmessage',
+            name='message_sid',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='rawmessage',
+            name='response',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
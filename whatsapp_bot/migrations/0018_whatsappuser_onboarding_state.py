@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-17 21:26
+
+from django.db import migrations, models
+
+def populate_onboarding_state(apps, schema_editor):
+    WhatsAppUser = apps.get_model('whatsapp_bot', 'WhatsAppUser')
+    BodyHistory = apps.get_model('whatsapp_bot', 'BodyHistory')
+
+    # Derive the state from the same cascade the message handler used to walk
+    users = []
+    for user in WhatsAppUser.objects.all().iterator():
+        latest = BodyHistory.objects.filter(user=user).order_by('-created_at').first()
+        if not user.name:
+            state = 'awaiting_name'
+        elif not (latest and latest.activity):
+            state = 'awaiting_activity'
+        elif not (latest and latest.height and latest.weight):
+            state = 'awaiting_measurements'
+        elif latest.goal is None:
+            state = 'awaiting_goal'
+        else:
+            state = 'completed'
+        user.onboarding_state = state
+        users.append(user)
+    WhatsAppUser.objects.bulk_update(users, ['onboarding_state'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0017_rawmessage_message_sid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whatsappuser',
+            name='onboarding_state',
+            field=models.CharField(choices=[('awaiting_name', 'Awaiting Name'), ('awaiting_activity', 'Awaiting Activity'), ('awaiting_measurements', 'Awaiting Measurements'), ('awaiting_goal', 'Awaiting Goal'), ('completed', 'Completed')], default='awaiting_name', max_length=30),
+        ),
+        migrations.RunPython(populate_onboarding_state, migrations.RunPython.noop),
+    ]
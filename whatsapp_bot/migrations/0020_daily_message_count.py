@@ -0,0 +1,47 @@
+# Generated by Django 5.0 on 2026-10-17 21:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+import pytz
+
+def populate_todays_counts(apps, schema_editor):
+    RawMessage = apps.get_model('whatsapp_bot', 'RawMessage')
+    DailyMessageCount = apps.get_model('whatsapp_bot', 'DailyMessageCount')
+
+    # Seed the current IST day so users don't get a fresh quota on deploy
+    ist_now = timezone.now().astimezone(pytz.timezone('Asia/Kolkata'))
+    start_of_day = ist_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = (
+        RawMessage.objects.filter(incoming=True, created_at__gte=start_of_day, user__isnull=False)
+        .values('user_id')
+        .annotate(total=Count('id'))
+    )
+    DailyMessageCount.objects.bulk_create([
+        DailyMessageCount(user_id=row['user_id'], day=ist_now.date(), count=row['total'])
+        for row in counts
+    ], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0019_outbound_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMessageCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_message_counts', to='whatsapp_bot.whatsappuser')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailymessagecount',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_message_count'),
+        ),
+        migrations.RunPython(populate_todays_counts, migrations.RunPython.noop),
+    ]
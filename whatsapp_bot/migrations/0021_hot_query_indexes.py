@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-17 21:33
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build indexes without locking the message tables against writes
+    atomic = False
+
+    dependencies = [
+        ('whatsapp_bot', '0020_daily_message_count'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='bodyhistory',
+            index=models.Index(fields=['user', '-created_at'], name='bodyhist_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='messagejob',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'processing'])), fields=['created_at'], name='msgjob_open_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='outboundmessage',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'sending'])), fields=['next_attempt_at'], name='outbox_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='paymenthistory',
+            index=models.Index(fields=['user', '-created_at'], name='payment_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='paymenthistory',
+            index=models.Index(fields=['subscription_id'], name='payment_subscription_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='rawmessage',
+            index=models.Index(condition=models.Q(('incoming', True)), fields=['user', 'created_at'], name='rawmsg_user_incoming_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='rawmessage',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='rawmsg_created_brin'),
+        ),
+        AddIndexConcurrently(
+            model_name='workoutsession',
+            index=models.Index(fields=['user', '-created_at'], name='session_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='workoutsession',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='session_created_brin'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-17 21:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0021_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawmessage',
+            name='intent',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='rawmessage',
+            name='intent_source',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-17 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0022_rawmessage_intent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('namespace', models.CharField(max_length=40)),
+                ('value', models.TextField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='llmcache_expires_idx')],
+            },
+        ),
+    ]
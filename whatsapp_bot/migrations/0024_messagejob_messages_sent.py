@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-17 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0023_llm_cache_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagejob',
+            name='messages_sent',
+            field=models.IntegerField(default=0),
+        ),
+    ]
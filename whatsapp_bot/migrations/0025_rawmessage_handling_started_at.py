@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-17 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0024_messagejob_messages_sent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawmessage',
+            name='handling_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
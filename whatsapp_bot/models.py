@@ -1,9 +1,20 @@
 from django.db import models
+from django.contrib.postgres.indexes import BrinIndex
+from django.utils import timezone
 
 class WhatsAppUser(models.Model):
+    ONBOARDING_STATE_CHOICES = [
+        ('awaiting_name', 'Awaiting Name'),
+        ('awaiting_activity', 'Awaiting Activity'),
+        ('awaiting_measurements', 'Awaiting Measurements'),
+        ('awaiting_goal', 'Awaiting Goal'),
+        ('completed', 'Completed'),
+    ]
+
     phone_number = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=50, null=True, blank=True)
     paid = models.BooleanField(default=False)
+    onboarding_state = models.CharField(max_length=30, choices=ONBOARDING_STATE_CHOICES, default='awaiting_name')
 
     # metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -17,11 +28,110 @@ class RawMessage(models.Model):
     message = models.TextField()
     incoming = models.BooleanField(default=True)
     processed = models.BooleanField(default=False)
+    message_sid = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Twilio's MessageSid
+    response = models.TextField(null=True, blank=True)  # TwiML returned for this message
+    handling_started_at = models.DateTimeField(null=True, blank=True)  # set while a webhook handles it, cleared if that fails
+    intent = models.CharField(max_length=20, null=True, blank=True)  # MessageIntent the bot classified it as
+    intent_source = models.CharField(max_length=10, null=True, blank=True)  # rules, model or llm
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Incoming messages of a user in a time window
+            models.Index(fields=['user', 'created_at'], condition=models.Q(incoming=True), name='rawmsg_user_incoming_idx'),
+            BrinIndex(fields=['created_at'], name='rawmsg_created_brin'),
+        ]
+
     def __str__(self):
         return f"{self.user.phone_number}: {self.message[:50]}..."
 
+class DailyMessageCount(models.Model):
+    """Number of messages a user sent on one IST calendar day, used for the free tier limit"""
+    user = models.ForeignKey(WhatsAppUser, on_delete=models.CASCADE, related_name='daily_message_counts')
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_message_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.phone_number} on {self.day}: {self.count}"
+
+class LLMCacheEntry(models.Model):
+    """Cached LLM result, keyed by a hash of the task, model, prompt and normalized input"""
+    key = models.CharField(max_length=64, primary_key=True)
+    namespace = models.CharField(max_length=40)
+    value = models.TextField()  # JSON encoded result
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='llmcache_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.namespace} {self.key[:12]} ({self.hits} hits)"
+
+class MessageJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    raw_message = models.OneToOneField(RawMessage, on_delete=models.CASCADE, related_name='job')
+    payload = models.JSONField()  # webhook form data
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    messages_sent = models.IntegerField(default=0)  # replies delivered, so a retry doesn't send them again
+    last_error = models.TextField(null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(status__in=['pending', 'processing']), name='msgjob_open_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} for message {self.raw_message_id} ({self.status})"
+
+class OutboundMessage(models.Model):
+    """Outbox of WhatsApp messages sent out of band by the dispatch_outbox command"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(WhatsAppUser, on_delete=models.CASCADE, related_name='outbound_messages')
+    body = models.TextField(null=True, blank=True)
+    content_sid = models.CharField(max_length=64, null=True, blank=True)  # Twilio content template
+    content_variables = models.TextField(null=True, blank=True)  # JSON string passed to Twilio
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    twilio_sid = models.CharField(max_length=64, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status__in=['pending', 'sending']), name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.phone_number}: {self.content_sid or self.body[:50]} ({self.status})"
+
 class BodyHistory(models.Model):
     ACTIVITY_CHOICES = [
         ('sedentary', 'Sedentary (little or no exercise)'),
@@ -73,6 +183,11 @@ class BodyHistory(models.Model):
         
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='bodyhist_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user}'s body history at {self.created_at}"
 
@@ -85,6 +200,13 @@ class WorkoutSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     eod_summary_sent = models.BooleanField(default=False)  # New field
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='session_user_created_idx'),
+            # EOD/EOW summaries and the pending message cron scan sessions by date
+            BrinIndex(fields=['created_at'], name='session_created_brin'),
+        ]
+
     def __str__(self):
         return f"{self.user.phone_number} - {self.activity_type} ({self.created_at})"
 
@@ -166,6 +288,10 @@ class PaymentHistory(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Payment histories"
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='payment_user_created_idx'),
+            models.Index(fields=['subscription_id'], name='payment_subscription_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.phone_number} - {self.subscription_id} ({self.status})"
@@ -0,0 +1,98 @@
+import contextlib
+import contextvars
+import time
+from typing import Optional
+from django.db import connection
+from . import logger_service
+
+logger = logger_service.get_logger()
+
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before it was handled"""
+
+
+class Deadline:
+    """
+    Time budget of one request. Made current with activate(), so LLM and Twilio
+    calls deep in the handlers, including ones made through sync_to_async and
+    threads started with a copied context, can size their timeouts to what is left.
+    """
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self) -> None:
+        """
+        Raises:
+            DeadlineExceeded: If the budget is spent
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds}s exceeded")
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """
+        Seconds a call may take: what is left of the budget, at most `cap`
+        Raises:
+            DeadlineExceeded: If the budget is spent
+        """
+        self.check()
+        remaining = self.remaining()
+        return min(cap, remaining) if cap is not None else remaining
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this the current deadline for the duration of the block"""
+        token = _current_deadline.set(self)
+        try:
+            yield self
+        finally:
+            _current_deadline.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    """Deadline of the request being handled, or None outside one"""
+    return _current_deadline.get()
+
+
+def timeout_for(default: float) -> float:
+    """
+    Timeout for a downstream call: `default`, cut to the current deadline's remaining budget
+    Raises:
+        DeadlineExceeded: If the current deadline is spent
+    """
+    deadline = _current_deadline.get()
+    return deadline.timeout(default) if deadline is not None else default
+
+
+def set_statement_timeout(deadline: Deadline) -> None:
+    """
+    Cap the statements of this thread's connection at the deadline's remaining budget
+    (Postgres only). Set per request rather than in the connection options, so
+    migrations, crons and management commands stay unbounded; reset_statement_timeout()
+    must follow, as the connection is reused by later requests.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('statement_timeout', %s, false)", [str(max(1, int(deadline.remaining() * 1000)))])
+
+
+def reset_statement_timeout() -> None:
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("RESET statement_timeout")
+    except Exception as e:
+        # A connection that can't run RESET is unusable and gets replaced anyway
+        logger.error(f"Error resetting statement_timeout: {str(e)}")
+        connection.close_if_unusable_or_obsolete()
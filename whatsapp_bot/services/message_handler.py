@@ -1,4 +1,7 @@
-from typing import Dict, Any
+import contextlib
+from typing import Dict, Any, Optional
+from asgiref.sync import sync_to_async
+from django.db import transaction
 from twilio.twiml.messaging_response import MessagingResponse
 from ..models import WhatsAppUser
 from ..dao.raw_message_dao import RawMessageDAO
@@ -6,16 +9,36 @@ from ..dao.user_dao import UserDAO
 from ..dao.body_history_dao import BodyHistoryDAO
 from .message_flow import is_hello_message
 from ..ai_services.nlp_services import is_name_response, is_measurement_response, is_gym_log
+from ..ai_services.nlp_services import ais_name_response, ais_measurement_response, ais_gym_log
+from ..ai_services.intents import pop_classification
 from .message_types import *
 from .twilio_services import twilio_client
 from ..services import logger_service
 from ..dao.workout_session_dao import WorkoutSessionDAO
 from ..models import RawMessage
 from .subscription_check import SubscriptionCheck
+from . import onboarding
+from .deadline import Deadline, DeadlineExceeded
 
 logger = logger_service.get_logger()
 
-###############################################1
+###############################################
+# Onboarding Prompts
+###############################################
+
+ONBOARDING_PROMPTS = {
+    onboarding.AWAITING_NAME: add_name_message,
+    onboarding.AWAITING_ACTIVITY: add_body_activity_message,
+    onboarding.AWAITING_MEASUREMENTS: add_height_weight_message,
+    onboarding.AWAITING_GOAL: add_goal_message,
+    onboarding.COMPLETED: add_start_track_message,
+}
+
+def add_next_onboarding_message(response: MessagingResponse, user: WhatsAppUser) -> MessagingResponse:
+    """Ask for whatever the user's onboarding state is waiting on"""
+    return ONBOARDING_PROMPTS[user.onboarding_state](response, user)
+
+###############################################
 # Success Response Messages
 ###############################################
 
@@ -23,13 +46,7 @@ def handle_name_success(user: WhatsAppUser) -> MessagingResponse:
     response = MessagingResponse()
     message = f"Thanks {user.name}!!"
     add_message_to_response(response, message, user)
-    
-    if not BodyHistoryDAO.has_activity(user):
-        add_body_activity_message(response, user)
-    elif not BodyHistoryDAO.has_measurements(user):
-        add_height_weight_message(response, user)
-    else:
-        add_start_track_message(response, user)
+    add_next_onboarding_message(response, user)
     return response
 
 def handle_activity_success(user: WhatsAppUser) -> MessagingResponse:
@@ -40,27 +57,14 @@ def handle_activity_success(user: WhatsAppUser) -> MessagingResponse:
     else:
         message = f"Thanks! Your activity level has been set to {BodyHistoryDAO.ACTIVITY_CHOICES[latest_metrics.activity]}"
     add_message_to_response(response, message, user)
-    
-    if not user.name:
-        add_name_message(response, user)
-    elif not BodyHistoryDAO.has_measurements(user):
-        add_height_weight_message(response, user)
-    else:
-        add_start_track_message(response, user)
+    add_next_onboarding_message(response, user)
     return response
 
 def handle_height_weight_success(user: WhatsAppUser) -> MessagingResponse:
     response = MessagingResponse()
     message = "Thanks! Your measurements has been recorded."
     add_message_to_response(response, message, user)
-    if not user.name:
-        add_name_message(response, user)
-    elif not BodyHistoryDAO.has_activity(user):
-        add_body_activity_message(response, user)
-    elif not BodyHistoryDAO.has_goal(user):
-        add_goal_message(response, user)
-    else:
-        add_start_track_message(response, user)
+    add_next_onboarding_message(response, user)
     return response
 
 def handle_goal_success(user: WhatsAppUser) -> MessagingResponse:
@@ -74,15 +78,7 @@ def handle_goal_success(user: WhatsAppUser) -> MessagingResponse:
     else:
         message = f"Thanks! Your fitness goal has been set to {goal_description}"
     add_message_to_response(response, message, user)
-    
-    if not user.name:
-        add_name_message(response, user)
-    elif not BodyHistoryDAO.has_activity(user):
-        add_body_activity_message(response, user)
-    elif not BodyHistoryDAO.has_measurements(user):
-        add_height_weight_message(response, user)
-    else:
-        add_start_track_message(response, user)
+    add_next_onboarding_message(response, user)
     return response
 
 
@@ -136,25 +132,27 @@ def handle_welcome_and_details(user: WhatsAppUser) -> MessagingResponse:
 Track your workouts in natural language, monitor progress, and achieve your fitness goals."""
     add_message_to_response(response, message, user)
     # Second message - Based on user state
-    if not user.name:
-        add_name_message(response, user)
-    elif not BodyHistoryDAO.has_activity(user):
-        add_body_activity_message(response, user)
-    elif not BodyHistoryDAO.has_measurements(user):
-        add_height_weight_message(response, user)
-    elif not BodyHistoryDAO.has_goal(user):
-        add_goal_message(response, user)
+    if user.onboarding_state != onboarding.COMPLETED:
+        add_next_onboarding_message(response, user)
 
     return response
 
 def handle_name_message(user: WhatsAppUser, message_body: str) -> MessagingResponse:
     is_name, extracted_name = is_name_response(message_body)
+    return handle_name_result(user, is_name, extracted_name)
+
+def handle_name_result(user: WhatsAppUser, is_name: bool, extracted_name: str) -> MessagingResponse:
     if is_name and extracted_name:
-        user = UserDAO.update_user_details(user.phone_number, name=extracted_name)
-        if user:
-            return handle_name_success(user)
-        else:
-            return handle_name_retry(user)
+        # State change and the follow-up template are queued together
+        with transaction.atomic():
+            updated_user = UserDAO.update_user_details(
+                user.phone_number,
+                name=extracted_name,
+                onboarding_state=onboarding.next_state(user.onboarding_state, onboarding.NAME_SET)
+            )
+            if updated_user:
+                return handle_name_success(updated_user)
+        return handle_name_retry(user)
     else:
         return handle_name_retry(user)
 
@@ -163,22 +161,29 @@ def handle_activity_message(user: WhatsAppUser, message_body: str) -> MessagingR
     activity_map = {key.strip().lower(): value for key, value in BodyHistoryDAO.ACTIVITY_CHOICES.items()}
     logger.info(f"Activity map: {activity_map}, selected activity: {selected_activity}, message body: {message_body}")
     if selected_activity in activity_map:
-        BodyHistoryDAO.create_entry(user, activity=selected_activity)
-        return handle_activity_success(user)
+        with transaction.atomic():
+            BodyHistoryDAO.create_entry(user, activity=selected_activity)
+            onboarding.advance(user, onboarding.ACTIVITY_SET)
+            return handle_activity_success(user)
     else:
         return handle_activity_retry(user)
 
 def handle_measurement_message(user: WhatsAppUser, message_body: str) -> MessagingResponse:
         result = is_measurement_response(message_body)
+        return handle_measurement_result(user, result)
+
+def handle_measurement_result(user: WhatsAppUser, result: tuple) -> MessagingResponse:
         bodyHistory = None
         if result:
             is_measurement, height, weight = result
 
             if is_measurement:
                 if weight and height and 80 <= height <= 250 and 30 <= weight <= 200:
-                    bodyHistory = BodyHistoryDAO.create_entry(user, height=height, weight=weight)
-                    logger.debug(f"Measurement success: {height}, {weight}")
-                    return handle_height_weight_success(user)
+                    with transaction.atomic():
+                        bodyHistory = BodyHistoryDAO.create_entry(user, height=height, weight=weight)
+                        logger.debug(f"Measurement success: {height}, {weight}")
+                        onboarding.advance(user, onboarding.MEASUREMENTS_SET)
+                        return handle_height_weight_success(user)
                 elif height and 80 <= height <= 250:
                     bodyHistory = BodyHistoryDAO.create_entry(user, height=height)
                     logger.debug(f"Measurement success: height: {weight}")
@@ -199,7 +204,9 @@ def handle_measurement_message(user: WhatsAppUser, message_body: str) -> Messagi
         elif not weight:
             return handle_weight_retry(user)
         else:
-            return handle_height_weight_success(user)
+            with transaction.atomic():
+                onboarding.advance(user, onboarding.MEASUREMENTS_SET)
+                return handle_height_weight_success(user)
 
 def handle_gym_log_message(user: WhatsAppUser, raw_message: RawMessage) -> MessagingResponse:
     session = WorkoutSessionDAO.get_active_session(user)
@@ -219,8 +226,10 @@ def handle_goal_message(user: WhatsAppUser, message_body: str) -> MessagingRespo
     logger.info(f"Goal map: {goal_map}, selected goal: {selected_goal}")
     if selected_goal in goal_map.keys():
         logger.info(f"present in goal map")
-        BodyHistoryDAO.create_entry(user, goal=selected_goal)
-        return handle_goal_success(user)
+        with transaction.atomic():
+            BodyHistoryDAO.create_entry(user, goal=selected_goal)
+            onboarding.advance(user, onboarding.GOAL_SET)
+            return handle_goal_success(user)
     else:
         return handle_goal_retry(user)
 
@@ -230,66 +239,150 @@ def handle_message_limit_exceeded(user: WhatsAppUser) -> MessagingResponse:
     add_message_to_response(response, message, user)
     return response
 
+def handle_deadline_exceeded(user: WhatsAppUser) -> MessagingResponse:
+    response = MessagingResponse()
+    message = "Sorry, that took longer than expected. Please send your message again."
+    add_message_to_response(response, message, user)
+    return response
+
+def handle_chat_result(user: WhatsAppUser, raw_message: RawMessage, is_log: bool) -> MessagingResponse:
+    if is_log:
+        return handle_gym_log_message(user, raw_message)
+
+    # Default response
+    response = MessagingResponse()
+    message = "I didn't understand that. Try sending a workout log or type 'help' for options."
+    add_message_to_response(response, message, user)
+    return response
+
 
 
 ###############################################
 # Main Message Handler
 ###############################################
 
-def handle_message(form_data: Dict[str, Any], user: WhatsAppUser) -> MessagingResponse:
+ROUTE_WELCOME = 'welcome'
+ROUTE_NAME = 'name'
+ROUTE_ACTIVITY = 'activity'
+ROUTE_MEASUREMENT = 'measurement'
+ROUTE_GOAL = 'goal'
+ROUTE_LIMIT_EXCEEDED = 'limit_exceeded'
+ROUTE_CHAT = 'chat'
+
+ONBOARDING_ROUTES = {
+    onboarding.AWAITING_NAME: ROUTE_NAME,
+    onboarding.AWAITING_ACTIVITY: ROUTE_ACTIVITY,
+    onboarding.AWAITING_MEASUREMENTS: ROUTE_MEASUREMENT,
+    onboarding.AWAITING_GOAL: ROUTE_GOAL,
+}
+
+def resolve_route(user: WhatsAppUser, message_body: str) -> str:
     """
-    Main message handler using Twilio's format
+    Decide which handler an inbound message goes to, based on the user's state
     """
-    message_body = form_data.get('body', '')
-
-    # Store raw message
-    raw_message = RawMessageDAO.create_raw_message(user=user, message=message_body, incoming=True)
-
     # If hello message, handle welcome flow
-    if not user.name and is_hello_message(message_body):
-        return handle_welcome_and_details(user)
+    if user.onboarding_state == onboarding.AWAITING_NAME and is_hello_message(message_body):
+        return ROUTE_WELCOME
 
-    # If no name, check if this is a name response
-    if not user.name:
-        return handle_name_message(user, message_body)
-    else:
-        logger.debug(f"User already has name: {user.name}")
-
-    # If no activity, check if this is an activity selection
-    if not BodyHistoryDAO.has_activity(user):
-        return handle_activity_message(user, message_body)
-    else:
-        latest_metrics = BodyHistoryDAO.get_latest_metrics(user)
-        logger.debug(f"User already has activity: {latest_metrics.activity if latest_metrics else None}")
-
-    # If no measurements, check if this is height/weight input
-    if not BodyHistoryDAO.has_measurements(user):
-        return handle_measurement_message(user, message_body)
-    else:
-        latest_metrics = BodyHistoryDAO.get_latest_metrics(user)
-        logger.debug(f"User already has measurements: {latest_metrics.height if latest_metrics else None} {latest_metrics.weight if latest_metrics else None}")
-
-    # If no goal, check if this is a goal selection
-    if not BodyHistoryDAO.has_goal(user):
-        return handle_goal_message(user, message_body)
-    else:
-        latest_metrics = BodyHistoryDAO.get_latest_metrics(user)
-        logger.debug(f"User already has goal: {latest_metrics.goal if latest_metrics else None}")
+    # Users still onboarding go to the step their state is waiting on
+    route = ONBOARDING_ROUTES.get(user.onboarding_state)
+    if route:
+        return route
 
     # Check if user can send more messages
     if not user.paid and not SubscriptionCheck.can_send_message(user):
-        return handle_message_limit_exceeded(user)
+        return ROUTE_LIMIT_EXCEEDED
 
     if is_hello_message(message_body):
-        return handle_welcome_and_details(user)
+        return ROUTE_WELCOME
 
     # Handle other message types
-    if is_gym_log(message_body):
-        return handle_gym_log_message(user, raw_message)
+    return ROUTE_CHAT
 
-    # Default response
-    response = MessagingResponse()
-    message = "I didn't understand that. Try sending a workout log or type 'help' for options."
-    add_message_to_response(response, message, user)
+def handle_route(user: WhatsAppUser, route: str, message_body: str, raw_message: RawMessage) -> MessagingResponse:
+    if route == ROUTE_WELCOME:
+        return handle_welcome_and_details(user)
+    if route == ROUTE_NAME:
+        return handle_name_message(user, message_body)
+    if route == ROUTE_ACTIVITY:
+        return handle_activity_message(user, message_body)
+    if route == ROUTE_MEASUREMENT:
+        return handle_measurement_message(user, message_body)
+    if route == ROUTE_GOAL:
+        return handle_goal_message(user, message_body)
+    if route == ROUTE_LIMIT_EXCEEDED:
+        return handle_message_limit_exceeded(user)
+    return handle_chat_result(user, raw_message, is_gym_log(message_body))
+
+def handle_message(form_data: Dict[str, Any], user: WhatsAppUser, raw_message: RawMessage = None,
+                   deadline: Optional[Deadline] = None) -> MessagingResponse:
+    """
+    Main message handler using Twilio's format
+    Args:
+        form_data: Parsed webhook form data
+        user: WhatsAppUser object
+        raw_message: Already stored inbound message, e.g. when handled from the message queue
+        deadline: Time budget of the request. LLM calls get what is left of it, and
+                  the user gets a canned reply when it runs out.
+    """
+    message_body = form_data.get('body') or ''
+
+    # Store raw message
+    if raw_message is None:
+        raw_message = RawMessageDAO.create_raw_message(user=user, message=message_body, incoming=True)
+
+    with deadline.activate() if deadline else contextlib.nullcontext():
+        try:
+            route = resolve_route(user, message_body)
+            response = handle_route(user, route, message_body, raw_message)
+        except DeadlineExceeded as e:
+            logger.warning(f"Replying to message {raw_message.id} with a retry request: {str(e)}")
+            response = handle_deadline_exceeded(user)
+    save_message_intent(raw_message)
     return response
 
+async def ahandle_message(form_data: Dict[str, Any], user: WhatsAppUser, raw_message: RawMessage = None,
+                          deadline: Optional[Deadline] = None) -> MessagingResponse:
+    """
+    Async variant of handle_message for the ASGI webhook.
+    LLM calls are awaited on the event loop; database work runs through sync_to_async.
+    """
+    message_body = form_data.get('body') or ''
+
+    if raw_message is None:
+        raw_message = await sync_to_async(RawMessageDAO.create_raw_message)(user=user, message=message_body, incoming=True)
+
+    with deadline.activate() if deadline else contextlib.nullcontext():
+        try:
+            return await ahandle_route(user, message_body, raw_message)
+        except DeadlineExceeded as e:
+            logger.warning(f"Replying to message {raw_message.id} with a retry request: {str(e)}")
+            await asave_message_intent(raw_message)
+            return await sync_to_async(handle_deadline_exceeded)(user)
+
+async def ahandle_route(user: WhatsAppUser, message_body: str, raw_message: RawMessage) -> MessagingResponse:
+    route = await sync_to_async(resolve_route)(user, message_body)
+    if route == ROUTE_NAME:
+        is_name, extracted_name = await ais_name_response(message_body)
+        await asave_message_intent(raw_message)
+        return await sync_to_async(handle_name_result)(user, is_name, extracted_name)
+    if route == ROUTE_MEASUREMENT:
+        result = await ais_measurement_response(message_body)
+        await asave_message_intent(raw_message)
+        return await sync_to_async(handle_measurement_result)(user, result)
+    if route == ROUTE_CHAT:
+        is_log = await ais_gym_log(message_body)
+        await asave_message_intent(raw_message)
+        return await sync_to_async(handle_chat_result)(user, raw_message, is_log)
+    return await sync_to_async(handle_route)(user, route, message_body, raw_message)
+
+def save_message_intent(raw_message: RawMessage) -> None:
+    """Store the intent the message was classified as, if it went through the classifier"""
+    classification = pop_classification(raw_message.message)
+    if classification:
+        RawMessageDAO.save_intent(raw_message, classification[0].value, classification[1])
+
+async def asave_message_intent(raw_message: RawMessage) -> None:
+    classification = pop_classification(raw_message.message)
+    if classification:
+        await sync_to_async(RawMessageDAO.save_intent)(raw_message, classification[0].value, classification[1])
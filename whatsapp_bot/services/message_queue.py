@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
+from ..models import MessageJob
+from ..dao.message_job_dao import MessageJobDAO
+from ..dao.raw_message_dao import RawMessageDAO
+from .message_handler import handle_message
+from .twilio_services import twilio_client
+from . import logger_service
+
+logger = logger_service.get_logger()
+
+
+def process_job(job: MessageJob) -> bool:
+    """
+    Handle a queued inbound message and send the replies through the REST API
+    Args:
+        job: Claimed MessageJob instance
+    Returns:
+        True if the job was processed, False if it failed
+    """
+    close_old_connections()
+    try:
+        user = job.raw_message.user
+        response = job.raw_message.response
+        if response is None:
+            with RawMessageDAO.buffer_outgoing():
+                # No deadline: nothing waits on the reply, so a slow job finishes rather than
+                # getting the deadline apology; each LLM call is still bounded by LLM_TIMEOUT_SECONDS
+                response = str(handle_message(job.payload, user, raw_message=job.raw_message))
+            # Handling isn't idempotent (history, onboarding, message count), so a retry
+            # after this point only delivers the stored replies
+            RawMessageDAO.save_response(job.raw_message, response)
+        else:
+            logger.info(f"Message job {job.id} was already handled, delivering its stored response")
+        twilio_client.send_response(user, response, skip=job.messages_sent,
+                                    on_sent=lambda sent: MessageJobDAO.save_progress(job, sent))
+        MessageJobDAO.mark_done(job)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to process message job {job.id} (attempt {job.attempts}): {str(e)}")
+        logger.exception("Full traceback:")
+        MessageJobDAO.mark_failed(job, str(e))
+        return False
+    finally:
+        close_old_connections()
+
+
+def run_workers(workers: int, poll_interval: float, once: bool = False, should_stop=lambda: False) -> dict:
+    """
+    Poll the job queue and process jobs on a pool of worker threads
+    Args:
+        workers: Number of worker threads
+        poll_interval: Seconds to sleep when the queue is empty
+        once: Drain the queue once and return instead of polling forever
+        should_stop: Callable checked between batches to allow a graceful shutdown
+    Returns:
+        dict with processed and failed job counts
+    """
+    stats = {'processed': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='message-worker') as executor:
+        while not should_stop():
+            jobs = MessageJobDAO.claim_batch(workers)
+            if not jobs:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            for ok in executor.map(process_job, jobs):
+                stats['processed' if ok else 'failed'] += 1
+            logger.info(f"Message queue batch done: {len(jobs)} jobs, totals {stats}")
+
+    return stats
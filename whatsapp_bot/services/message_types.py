@@ -1,12 +1,12 @@
 from twilio.twiml.messaging_response import MessagingResponse
 from ..dao.body_history_dao import BodyHistoryDAO
 from ..models import WhatsAppUser
-from .twilio_services import twilio_client
 from ..dao.raw_message_dao import RawMessageDAO
+from ..dao.outbox_dao import OutboxDAO
 from ..utils.config import WHATSAPP_GOAL_TEMPLATE_SID, WHATSAPP_ACTIVITY_TEMPLATE_SID
 
 def add_message_to_response(response: MessagingResponse, message: str, user: WhatsAppUser):
-    RawMessageDAO.create_raw_message(user=user, message=message, incoming=False)
+    RawMessageDAO.log_outgoing(user=user, message=message)
     msg = response.message()
     msg.body(message)
     return response
@@ -16,7 +16,7 @@ def add_name_message(response: MessagingResponse, user: WhatsAppUser):
     return response
 
 def add_body_activity_message(response: MessagingResponse, user: WhatsAppUser):
-    twilio_client.send_template_message(user, content_sid=WHATSAPP_ACTIVITY_TEMPLATE_SID)
+    OutboxDAO.enqueue_template(user, content_sid=WHATSAPP_ACTIVITY_TEMPLATE_SID)
     return response
 
 def add_height_weight_message(response: MessagingResponse, user: WhatsAppUser):
@@ -48,7 +48,7 @@ Format: "weight: 70"
     return response
 
 def add_body_composition_message(response: MessagingResponse, user: WhatsAppUser, **kwargs):
-    twilio_client.send_template_message(user, content_sid="HX924f53aed72555c48b8f5f402a615098")
+    OutboxDAO.enqueue_template(user, content_sid="HX924f53aed72555c48b8f5f402a615098")
     return response
 
 def add_start_track_message(response: MessagingResponse, user: WhatsAppUser, **kwargs):
@@ -61,5 +61,5 @@ def add_start_track_message(response: MessagingResponse, user: WhatsAppUser, **k
 
 
 def add_goal_message(response: MessagingResponse, user: WhatsAppUser) -> None:
-    twilio_client.send_template_message(user, content_sid=WHATSAPP_GOAL_TEMPLATE_SID)
+    OutboxDAO.enqueue_template(user, content_sid=WHATSAPP_GOAL_TEMPLATE_SID)
     return response
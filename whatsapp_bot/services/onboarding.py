@@ -0,0 +1,46 @@
+from ..models import WhatsAppUser
+from ..dao.user_dao import UserDAO
+
+# Onboarding states, stored on WhatsAppUser.onboarding_state
+AWAITING_NAME = 'awaiting_name'
+AWAITING_ACTIVITY = 'awaiting_activity'
+AWAITING_MEASUREMENTS = 'awaiting_measurements'
+AWAITING_GOAL = 'awaiting_goal'
+COMPLETED = 'completed'
+
+# Events fired when an onboarding detail has been recorded
+NAME_SET = 'name_set'
+ACTIVITY_SET = 'activity_set'
+MEASUREMENTS_SET = 'measurements_set'
+GOAL_SET = 'goal_set'
+
+TRANSITIONS = {
+    (AWAITING_NAME, NAME_SET): AWAITING_ACTIVITY,
+    (AWAITING_ACTIVITY, ACTIVITY_SET): AWAITING_MEASUREMENTS,
+    (AWAITING_MEASUREMENTS, MEASUREMENTS_SET): AWAITING_GOAL,
+    (AWAITING_GOAL, GOAL_SET): COMPLETED,
+}
+
+
+def next_state(state: str, event: str) -> str:
+    """
+    Look up the state that follows `event` in `state`.
+    Events that don't apply to the current state leave it unchanged.
+    """
+    return TRANSITIONS.get((state, event), state)
+
+
+def advance(user: WhatsAppUser, event: str) -> str:
+    """
+    Apply an onboarding event to a user and persist the new state
+    Args:
+        user: WhatsAppUser object, updated in place
+        event: One of the *_SET events
+    Returns:
+        The user's onboarding state after the event
+    """
+    state = next_state(user.onboarding_state, event)
+    if state != user.onboarding_state:
+        UserDAO.update_onboarding_state(user, state)
+    return state
+
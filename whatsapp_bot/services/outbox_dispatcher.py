@@ -0,0 +1,77 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from ..models import OutboundMessage
+from ..dao.outbox_dao import OutboxDAO
+from ..dao.raw_message_dao import RawMessageDAO
+from .twilio_services import twilio_client
+from . import logger_service
+
+logger = logger_service.get_logger()
+
+
+async def _send(message: OutboundMessage, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        try:
+            if message.content_sid:
+                sent = await twilio_client.send_template_message_async(
+                    message.user, message.content_sid, message.content_variables
+                )
+            else:
+                sent = await twilio_client.send_message_async(message.user, message.body)
+            await sync_to_async(OutboxDAO.mark_sent)(message, getattr(sent, 'sid', None))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send outbound message {message.id} (attempt {message.attempts}): {str(e)}")
+            await sync_to_async(OutboxDAO.mark_failed)(message, str(e))
+            return False
+
+
+async def dispatch_batch(batch_size: int, concurrency: int) -> dict:
+    """
+    Claim a batch of due outbox messages and send them concurrently
+    Args:
+        batch_size: Maximum number of messages to claim
+        concurrency: Maximum number of Twilio requests in flight
+    Returns:
+        dict with sent and failed counts
+    """
+    messages = await sync_to_async(OutboxDAO.claim_batch)(batch_size)
+    stats = {'sent': 0, 'failed': 0}
+    if not messages:
+        return stats
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async with RawMessageDAO.buffer_outgoing():
+        results = await asyncio.gather(*(_send(message, semaphore) for message in messages))
+    for ok in results:
+        stats['sent' if ok else 'failed'] += 1
+    logger.info(f"Outbox batch done: {stats}")
+    return stats
+
+
+async def run_dispatcher(batch_size: int, concurrency: int, poll_interval: float,
+                         once: bool = False, should_stop=lambda: False) -> dict:
+    """
+    Drain the outbox until stopped, reusing one pooled Twilio HTTP session
+    Args:
+        batch_size: Messages claimed per batch
+        concurrency: Maximum number of Twilio requests in flight
+        poll_interval: Seconds to sleep when nothing is due
+        once: Drain what is due and return instead of polling forever
+        should_stop: Callable checked between batches to allow a graceful shutdown
+    Returns:
+        dict with total sent and failed counts
+    """
+    totals = {'sent': 0, 'failed': 0}
+    try:
+        while not should_stop():
+            stats = await dispatch_batch(batch_size, concurrency)
+            totals['sent'] += stats['sent']
+            totals['failed'] += stats['failed']
+            if not stats['sent'] and not stats['failed']:
+                if once:
+                    break
+                await asyncio.sleep(poll_interval)
+    finally:
+        await twilio_client.close_async_client()
+    return totals
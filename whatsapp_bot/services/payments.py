@@ -10,7 +10,8 @@ from ..utils.formatUtils import format_phone_number
 from standardwebhooks import Webhook
 from ..utils.config import DODO_WEBHOOK_SECRET
 from ..dao.payment_dao import PaymentDAO
-from .twilio_services import twilio_client
+from ..dao.outbox_dao import OutboxDAO
+from django.db import transaction
 import json
 
 logger = logger_service.get_logger()
@@ -110,33 +111,36 @@ def handle_dodo_webhook(request):
         # Get or create user
         user, _ = UserDAO.get_or_create_user(phone_number)
 
-        # Create payment history record using DAO
-        payment_record = PaymentDAO.create_payment_record(user, payment_data)
-
-        # Update user paid status if payment successful
-        if type == 'subscription.active' and status == 'active':
-            UserDAO.update_paid_status(user, True)
-            logger.info(f"Updated paid status for user {phone_number}")
-            template_data = {
-                "1": DODO_SUBSCRIPTION_NAMES.get(amount_in_dollars, "Subscription"),
-                "2": subscription_id
-            }
-            twilio_client.send_template_message(
-                user, 
-                WHATSAPP_PAYMENT_SUCCESS_TEMPLATE_SID, 
-                json.dumps(template_data)
-            )
-        elif type == 'subscription.inactive' and status == 'inactive':
-            UserDAO.update_paid_status(user, False)
-            template_data = {
-                "1": DODO_SUBSCRIPTION_NAMES.get(amount_in_dollars, "Subscription"),
-                "2": subscription_id
-            }
-            twilio_client.send_template_message(
-                user, 
-                WHATSAPP_PAYMENT_FAILED_TEMPLATE_SID, 
-                json.dumps(template_data)
-            )
+        # Record the payment, update the paid status and queue the notification
+        # in one transaction; the outbox dispatcher sends the template
+        with transaction.atomic():
+            # Create payment history record using DAO
+            payment_record = PaymentDAO.create_payment_record(user, payment_data)
+
+            # Update user paid status if payment successful
+            if type == 'subscription.active' and status == 'active':
+                UserDAO.update_paid_status(user, True)
+                logger.info(f"Updated paid status for user {phone_number}")
+                template_data = {
+                    "1": DODO_SUBSCRIPTION_NAMES.get(amount_in_dollars, "Subscription"),
+                    "2": subscription_id
+                }
+                OutboxDAO.enqueue_template(
+                    user, 
+                    WHATSAPP_PAYMENT_SUCCESS_TEMPLATE_SID, 
+                    json.dumps(template_data)
+                )
+            elif type == 'subscription.inactive' and status == 'inactive':
+                UserDAO.update_paid_status(user, False)
+                template_data = {
+                    "1": DODO_SUBSCRIPTION_NAMES.get(amount_in_dollars, "Subscription"),
+                    "2": subscription_id
+                }
+                OutboxDAO.enqueue_template(
+                    user, 
+                    WHATSAPP_PAYMENT_FAILED_TEMPLATE_SID, 
+                    json.dumps(template_data)
+                )
 
         return JsonResponse({'status': '200'})
 
@@ -0,0 +1,113 @@
+import contextvars
+import functools
+import time
+from asgiref.sync import iscoroutinefunction
+from django.db.backends.signals import connection_created
+
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Counters for one request: SQL queries and time, and time spent waiting on
+    the LLMs and Twilio. Kept in a contextvar, so ORM calls made through
+    sync_to_async and threads started with a copied context are counted too.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.llm_ms = 0.0
+        self.llm_calls = 0
+        self.twilio_ms = 0.0
+        self.twilio_calls = 0
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def add(self, kind: str, elapsed_ms: float) -> None:
+        setattr(self, f"{kind}_ms", getattr(self, f"{kind}_ms") + elapsed_ms)
+        setattr(self, f"{kind}_calls", getattr(self, f"{kind}_calls") + 1)
+
+    def as_dict(self) -> dict:
+        return {
+            'total_ms': round(self.total_ms, 1),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_ms, 1),
+            'llm_calls': self.llm_calls,
+            'llm_ms': round(self.llm_ms, 1),
+            'twilio_calls': self.twilio_calls,
+            'twilio_ms': round(self.twilio_ms, 1),
+        }
+
+
+def start() -> tuple:
+    """Begin collecting metrics in the current context. Returns (metrics, token for stop())"""
+    metrics = RequestMetrics()
+    return metrics, _current_metrics.set(metrics)
+
+
+def stop(token) -> None:
+    _current_metrics.reset(token)
+
+
+def current():
+    """Metrics of the request being handled, or None outside a measured request"""
+    return _current_metrics.get()
+
+
+def timed(kind: str):
+    """
+    Decorator adding the wall time of a sync or async call to the current
+    request's `kind` counter ('llm' or 'twilio'). Free outside a measured request.
+    """
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                metrics = _current_metrics.get()
+                if metrics is None:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metrics.add(kind, (time.perf_counter() - started) * 1000)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _current_metrics.get()
+            if metrics is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.add(kind, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_ms += (time.perf_counter() - started) * 1000
+
+
+def install_query_recorder() -> None:
+    """Count queries on every database connection, including ones opened by worker threads"""
+    connection_created.connect(_on_connection_created, dispatch_uid='request_metrics_query_recorder')
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    # The wrapper list outlives reconnects of the same connection object
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
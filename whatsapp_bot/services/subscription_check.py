@@ -1,13 +1,8 @@
-from django.utils import timezone
-from datetime import datetime
-import pytz
 from ..models import WhatsAppUser
-from ..dao.raw_message_dao import RawMessageDAO
+from ..dao.message_counter_dao import MessageCounterDAO
 from ..utils.config import MAX_FREE_MESSAGES_PER_DAY
 
 class SubscriptionCheck:
-    IST_TIMEZONE = pytz.timezone('Asia/Kolkata')
-
     @staticmethod
     def can_send_message(user: WhatsAppUser) -> bool:
         """
@@ -22,10 +17,8 @@ class SubscriptionCheck:
         if user.paid:
             return True
         # For non-paid users, check message count for current day in IST
-        ist_now = timezone.now().astimezone(SubscriptionCheck.IST_TIMEZONE)
-        start_of_day = ist_now.replace(hour=0, minute=0, second=0, microsecond=0)
-        messages_today = RawMessageDAO.count_messages_since(user, start_of_day)
-        
+        messages_today = MessageCounterDAO.get_count(user)
+
         return messages_today < MAX_FREE_MESSAGES_PER_DAY
 
     @staticmethod
@@ -39,7 +32,5 @@ class SubscriptionCheck:
         """
         if user.paid:
             return -1  # Unlimited messages
-        ist_now = timezone.now().astimezone(SubscriptionCheck.IST_TIMEZONE)
-        start_of_day = ist_now.replace(hour=0, minute=0, second=0, microsecond=0)
-        messages_today = RawMessageDAO.count_messages_since(user, start_of_day)
+        messages_today = MessageCounterDAO.get_count(user)
         return max(0, MAX_FREE_MESSAGES_PER_DAY - messages_today)
@@ -1,30 +1,80 @@
 import os
+from xml.etree import ElementTree
 from dotenv import load_dotenv
+from asgiref.sync import sync_to_async
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from ..dao.raw_message_dao import RawMessageDAO
 from ..models import WhatsAppUser
-from ..utils.config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER
+from .request_metrics import timed
+from ..utils.config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER, TWILIO_TIMEOUT_SECONDS
 load_dotenv()
 
 
 
 class TwilioClient:
     def __init__(self):
-        self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=TwilioHttpClient(timeout=TWILIO_TIMEOUT_SECONDS))
+        self._async_client = None
 
     def get_client(self):
         return self.client
 
+    def get_async_client(self):
+        """Client backed by aiohttp, created on first use inside the running event loop"""
+        if self._async_client is None:
+            self._async_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=AsyncTwilioHttpClient(timeout=TWILIO_TIMEOUT_SECONDS))
+        return self._async_client
+
     def get_templates(self):
         return self.client.conversations
 
+    @timed('twilio')
     def send_message(self, user: WhatsAppUser, message: str):
-        RawMessageDAO.create_raw_message(user=user, message=message, incoming=False)
+        RawMessageDAO.log_outgoing(user=user, message=message)
         self.client.messages.create(to=user.phone_number, from_=TWILIO_WHATSAPP_NUMBER, body=message)
 
+    @timed('twilio')
     def send_template_message(self, user: WhatsAppUser, content_sid: str, content_variables: dict = None):
-        RawMessageDAO.create_raw_message(user=user, message=f"template:{content_sid}", incoming=False)
+        RawMessageDAO.log_outgoing(user=user, message=f"template:{content_sid}")
         self.client.messages.create(to=user.phone_number, from_=TWILIO_WHATSAPP_NUMBER, content_sid=content_sid, content_variables=content_variables)
 
-twilio_client = TwilioClient()
+    @timed('twilio')
+    def send_response(self, user: WhatsAppUser, response, skip: int = 0, on_sent=None):
+        """
+        Deliver the messages of a TwiML response through the REST API.
+        Used when the webhook has already been acknowledged; the messages were
+        logged when they were added to the response, so they are not logged again.
+        Args:
+            user: Recipient
+            response: MessagingResponse or its TwiML
+            skip: Number of leading messages already delivered by an earlier attempt
+            on_sent: Called with the number of messages delivered so far after each send
+        """
+        bodies = [body.text for body in ElementTree.fromstring(str(response)).iter('Body') if body.text]
+        for sent, text in enumerate(bodies[skip:], start=skip + 1):
+            self.client.messages.create(to=user.phone_number, from_=TWILIO_WHATSAPP_NUMBER, body=text)
+            if on_sent:
+                on_sent(sent)
+
+    @timed('twilio')
+    async def send_message_async(self, user: WhatsAppUser, message: str):
+        sent = await self.get_async_client().messages.create_async(to=user.phone_number, from_=TWILIO_WHATSAPP_NUMBER, body=message)
+        await sync_to_async(RawMessageDAO.log_outgoing)(user=user, message=message)
+        return sent
 
+    @timed('twilio')
+    async def send_template_message_async(self, user: WhatsAppUser, content_sid: str, content_variables: dict = None):
+        sent = await self.get_async_client().messages.create_async(to=user.phone_number, from_=TWILIO_WHATSAPP_NUMBER, content_sid=content_sid, content_variables=content_variables)
+        # Logged after the send so outbox retries don't log the message twice
+        await sync_to_async(RawMessageDAO.log_outgoing)(user=user, message=f"template:{content_sid}")
+        return sent
+
+    async def close_async_client(self):
+        """Close the pooled aiohttp session of the async client"""
+        if self._async_client is not None:
+            await self._async_client.http_client.close()
+            self._async_client = None
+
+twilio_client = TwilioClient()
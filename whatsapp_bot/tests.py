@@ -1,3 +1,683 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, TestCase, RequestFactory
+from django.utils import timezone
+from twilio.twiml.messaging_response import MessagingResponse
+from . import views
+from .ai_services import intent_model, llm_router
+from .ai_services.intent_rules import classify_by_rules
+from .ai_services.intents import MessageIntent, SOURCE_LLM, SOURCE_MODEL, SOURCE_RULES
+from .ai_services.measurement_parser import parse_height_weight
+from .ai_services.workout_parser import parse_segment, parse_workout_log, parse_workout_details
+from .dao.exercise_dao import ExerciseDAO
+from .dao.message_counter_dao import MessageCounterDAO
+from .dao.message_job_dao import MessageJobDAO
+from .dao.raw_message_dao import RawMessageDAO
+from .dao.workout_session_dao import WorkoutSessionDAO
+from .services import message_queue
+from .services.deadline import Deadline, DeadlineExceeded
+from .models import WhatsAppUser, RawMessage, WorkoutSession, DailyMessageCount, Exercise, MessageJob
+from .utils.config import INTENT_RULES_MIN_CONFIDENCE, MESSAGE_QUEUE_STALE_LOCK_SECONDS
 
-# Create your tests here.
+
+class ClassifyByRulesTest(SimpleTestCase):
+    # (message, intent the rules answer with, or None when they must leave it to the model/LLM)
+    CASES = [
+        ('bench 3x10 60kg', MessageIntent.EXERCISE),
+        ('Squat 4 X 8 @ 100', MessageIntent.EXERCISE),
+        ('3 sets of 12 curls', MessageIntent.EXERCISE),
+        ('ran 5k', MessageIntent.EXERCISE),
+        ('cycled 20 km', MessageIntent.EXERCISE),
+        ('jogged for 45 minutes', MessageIntent.EXERCISE),
+        ('did 30 min on the treadmill', MessageIntent.EXERCISE),
+        ('170cm 70kg', MessageIntent.HEIGHT_WEIGHT),
+        ("5'11\" 165 lbs", MessageIntent.HEIGHT_WEIGHT),
+        ('I weigh 72 kg', MessageIntent.HEIGHT_WEIGHT),
+        ('my name is john', MessageIntent.NAME),
+        ("I'm Priya", MessageIntent.NAME),
+        ('Hi I am Rahul Sharma', MessageIntent.NAME),
+        ('hello', MessageIntent.UNKNOWN),
+        ('thank you!', MessageIntent.UNKNOWN),
+        # False positives: an activity word with a duration, and a place after "I am"
+        ('running late, there in 5 min', None),
+        ('be there in 10 mins, just finished my run', None),
+        ('walking 30 mins', None),
+        ('I am From Delhi', None),
+        ("I'm In Mumbai", None),
+        ("I'm good", None),
+        ('what should I eat after training?', None),
+        ('', None),
+    ]
+
+    def test_classification(self):
+        for message, expected in self.CASES:
+            with self.subTest(message=message):
+                ruled = classify_by_rules(message)
+                # Answers below the threshold are ignored by the classifier
+                intent = ruled[0] if ruled and ruled[1] >= INTENT_RULES_MIN_CONFIDENCE else None
+                self.assertEqual(intent, expected)
+
+    def test_bare_weight_is_not_confident(self):
+        intent, confidence = classify_by_rules('60kg')
+        self.assertEqual(intent, MessageIntent.HEIGHT_WEIGHT)
+        self.assertLess(confidence, INTENT_RULES_MIN_CONFIDENCE)
+
+
+class IntentModelTest(SimpleTestCase):
+    TRAINING = {
+        'exercise': [
+            'bench 3x10 60kg', 'squat 5x5 100kg', 'deadlift 1x5 140', 'ohp 3x8 40kg', 'curls 3 sets of 12',
+            'ran 5k in 30 min', 'lat pulldown 4x12 50kg', 'leg press 3x15 120kg', 'did 20 pushups',
+            'rows 4x10 60', 'incline db press 3x10 22.5kg', 'pull ups 3x8',
+        ],
+        'height_weight': [
+            '170cm 70kg', "5'11 165 lbs", 'height 180 weight 82', '1.75m 68kg', 'i weigh 90kg and am 6ft',
+            '160 cm, 55 kg', 'ht 172 wt 75', '6 feet 80 kilos', '182cm and 90kg', 'my weight is 64 kg',
+        ],
+        'name': [
+            'my name is john', "i'm priya", 'call me sam', 'rahul', 'this is anita', 'name: vikram',
+            'i am karan', 'people call me jo', 'its meera', 'hey, arjun here',
+        ],
+        'unknown': [
+            'hello', 'thanks', 'what should i eat today', 'how does this work', 'ok', 'good morning',
+            'can you help me', 'help', 'bye', 'what is my plan',
+        ],
+    }
+    # (message, expected intent) for messages the model hasn't seen
+    CASES = [
+        ('squat 4x8 110kg', MessageIntent.EXERCISE),
+        ('bench 5x5 80kg', MessageIntent.EXERCISE),
+        ('175cm 72kg', MessageIntent.HEIGHT_WEIGHT),
+        ('my name is maria', MessageIntent.NAME),
+        ('good evening', MessageIntent.UNKNOWN),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        texts = [text for texts in cls.TRAINING.values() for text in texts]
+        labels = [label for label, texts in cls.TRAINING.items() for _ in texts]
+        cls.model = intent_model.train(texts, labels, buckets=1 << 12, epochs=30)
+
+    def test_normalize(self):
+        for text, expected in [('Bench  3x10 60KG', 'bench 0x0 0kg'), ('  4x8\n', '0x0'), (None, '')]:
+            with self.subTest(text=text):
+                self.assertEqual(intent_model.normalize(text), expected)
+
+    def test_featurize_is_normalised(self):
+        indices, values = intent_model.featurize('bench 3x10', 1 << 12)
+        self.assertEqual(len(indices), len(set(indices)))
+        self.assertAlmostEqual(float(np.dot(values, values)), 1.0, places=5)
+        self.assertEqual(indices.tolist(), intent_model.featurize('bench 4x8', 1 << 12)[0].tolist())
+
+    def test_predict(self):
+        for message, expected in self.CASES:
+            with self.subTest(message=message):
+                intent, confidence = self.model.predict(message)
+                self.assertEqual(intent, expected)
+                self.assertTrue(0 < confidence <= 1)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'intent.npz')
+            self.model.save(path)
+            loaded = intent_model.IntentModel.load(path)
+        self.assertEqual(loaded.trained_on, self.model.trained_on)
+        for message, _ in self.CASES:
+            with self.subTest(message=message):
+                self.assertEqual(loaded.predict(message), self.model.predict(message))
+
+    def test_evaluate(self):
+        texts = [message for message, _ in self.CASES]
+        labels = [intent.value for _, intent in self.CASES]
+        report = intent_model.evaluate(self.model, texts, labels, threshold=0.0)
+        self.assertEqual(report['messages'], len(texts))
+        self.assertEqual(report['accuracy'], 1.0)
+        self.assertEqual(report['coverage'], 1.0)
+        self.assertEqual(report['per_class']['name']['support'], 1)
+
+
+class LabelledMessagesTest(TestCase):
+    def test_only_requested_sources_and_sessions(self):
+        user = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000001')
+        for message, intent, source in [
+            ('bench 3x10', 'exercise', SOURCE_LLM),
+            ('i am karan', 'name', SOURCE_MODEL),
+            ('hello', 'unknown', SOURCE_RULES),
+        ]:
+            RawMessage.objects.create(user=user, message=message, incoming=True, intent=intent, intent_source=source)
+        logged = RawMessage.objects.create(user=user, message='squat 5x5', incoming=True,
+                                           intent='exercise', intent_source=SOURCE_MODEL)
+        session = WorkoutSession.objects.create(user=user)
+        session.raw_messages.add(logged)
+
+        labelled = RawMessageDAO.get_labelled_messages(sources=[SOURCE_LLM])
+
+        self.assertCountEqual(labelled, [
+            ('bench 3x10', 'exercise', SOURCE_LLM),
+            ('squat 5x5', 'exercise', 'session'),
+        ])
+
+
+class WorkoutParserTest(SimpleTestCase):
+    # (segment, (exercise_name, sets, reps, weight value, unit, weight type)), None when the parser abstains
+    CASES = [
+        ('squat 405x5x3', ('Squat', 3, '5', 405, 'lbs', 'barbell')),
+        ('bench 3x10 60kg', ('Bench Press', 3, '10', 60, 'kg', 'barbell')),
+        ('Squat 4x8 100kg', ('Squat', 4, '8', 100, 'kg', 'barbell')),
+        ('deadlift 140kg 1x5', ('Deadlift', 1, '5', 140, 'kg', 'barbell')),
+        ('ohp 3 sets of 8 @ 40 kg', ('Overhead Press', 3, '8', 40, 'kg', 'barbell')),
+        ('incline bench 4x10 at 135 lbs', ('Incline Bench Press', 4, '10', 135, 'lbs', 'barbell')),
+        ('db curls 3x12 15', ('Dumbbell Curl', 3, '12', 15, 'lbs', 'dumbbell')),
+        ('lat pulldown 3x12 50kg', ('Lat Pulldown', 3, '12', 50, 'kg', 'machine')),
+        ('pull ups 3x8', ('Pull-Up', 3, '8', 0, 'body weight', 'body weight')),
+        # Out of range set/rep counts, unknown exercises and free text go to the LLM
+        ('squat 30x5', None),
+        ('bench 3x200', None),
+        ('zorbing 3x10', None),
+        ('did some stuff', None),
+    ]
+
+    def test_parse_segment(self):
+        for segment, expected in self.CASES:
+            with self.subTest(segment=segment):
+                parsed = parse_segment(segment)
+                if expected is None:
+                    self.assertIsNone(parsed)
+                    continue
+                name, sets, reps, value, unit, weight_type = expected
+                self.assertEqual(parsed, {
+                    'exercise_name': name,
+                    'sets': sets,
+                    'reps': reps,
+                    'weight': {'value': value, 'unit': unit, 'type': weight_type},
+                })
+
+    def test_parse_workout_log_returns_unread_lines(self):
+        exercises, leftover = parse_workout_log("bench 3x10 60kg, squat 5x5 100kg\nfelt great today\n\ndl 1x5 180")
+        self.assertEqual([e['exercise_name'] for e in exercises], ['Bench Press', 'Squat', 'Deadlift'])
+        self.assertEqual(leftover, ['felt great today'])
+
+    def test_line_is_never_half_parsed(self):
+        exercises, leftover = parse_workout_log('bench 3x10 60kg, then some stretching')
+        self.assertEqual(exercises, [])
+        self.assertEqual(leftover, ['bench 3x10 60kg, then some stretching'])
+
+    def test_parse_workout_details(self):
+        parsed = parse_workout_details('bench 3x10 60kg\nsquat 405x5x3')
+        self.assertEqual(parsed['parsed_from'], 'bench 3x10 60kg\nsquat 405x5x3')
+        self.assertEqual(len(parsed['exercises']), 2)
+        # Abstains unless every line was understood
+        self.assertIsNone(parse_workout_details('bench 3x10 60kg\nfelt great'))
+        self.assertIsNone(parse_workout_details(''))
+
+
+class HeightWeightParserTest(SimpleTestCase):
+    # (message, (height value, height unit), (weight value, weight unit)), None when the parser abstains
+    CASES = [
+        ('5\'11" 165 lbs', (71, 'in'), (165, 'lbs')),
+        ('170cm 70kg', (170, 'cm'), (70, 'kg')),
+        ('1.8m 80kg', (1.8, 'm'), (80, 'kg')),
+        ('5 feet 8 inches and 70 kgs', (68, 'in'), (70, 'kg')),
+        ('6 ft 90 kg', (72, 'in'), (90, 'kg')),
+        ('height: 170, weight: 70', (170, 'cm'), (70, 'kg')),
+        ('170, 70', (170, 'cm'), (70, 'kg')),
+        ('180cm', (180, 'cm'), (None, None)),
+        ('I weigh 70', (None, None), (70, 'kg')),
+        # A number the parser can't place, or two heights, goes to the LLM
+        ('I am 25, 180cm', None, None),
+        ('5\'13" 150lbs', None, None),
+        ('170cm 180cm', None, None),
+        ('bench 3x10 60kg', None, None),
+        ('hello', None, None),
+    ]
+
+    def test_parse_height_weight(self):
+        for message, height, weight in self.CASES:
+            with self.subTest(message=message):
+                parsed = parse_height_weight(message)
+                if height is None:
+                    self.assertIsNone(parsed)
+                    continue
+                self.assertEqual((parsed['height']['value'], parsed['height']['unit']), height)
+                self.assertEqual((parsed['weight']['value'], parsed['weight']['unit']), weight)
+
+
+class MessageCounterTest(TestCase):
+    def setUp(self):
+        self.user = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000002')
+        self.other = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000003')
+
+    def test_increment(self):
+        day, next_day = date(2026, 1, 1), date(2026, 1, 2)
+        # (user, day, count returned by increment)
+        steps = [
+            (self.user, day, 1),
+            (self.user, day, 2),
+            (self.other, day, 1),
+            (self.user, next_day, 1),
+            (self.user, day, 3),
+        ]
+        for user, on, expected in steps:
+            with self.subTest(user=user.phone_number, day=on, expected=expected):
+                self.assertEqual(MessageCounterDAO.increment(user, on), expected)
+
+        self.assertEqual(DailyMessageCount.objects.get(user=self.user, day=day).count, 3)
+        self.assertEqual(DailyMessageCount.objects.filter(user=self.user).count(), 2)
+
+    def test_get_count_uses_the_incremented_value(self):
+        day = MessageCounterDAO.today()
+        self.assertEqual(MessageCounterDAO.get_count(self.user, day), 0)
+        MessageCounterDAO.increment(self.user)
+        MessageCounterDAO.increment(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(MessageCounterDAO.get_count(self.user, day), 2)
+        # A fresh instance reads the row
+        fresh = WhatsAppUser.objects.get(id=self.user.id)
+        self.assertEqual(MessageCounterDAO.get_count(fresh, day), 2)
+
+    def test_incoming_messages_are_counted(self):
+        RawMessageDAO.create_raw_message(self.user, 'hi', incoming=True)
+        RawMessageDAO.create_raw_message(self.user, 'hello!', incoming=False)
+        self.assertEqual(MessageCounterDAO.get_count(WhatsAppUser.objects.get(id=self.user.id)), 1)
+
+
+def _exercise(name, weights, sets, reps, unit='kg'):
+    return {'name': name, 'weights': weights, 'weight_unit': unit, 'sets': sets, 'reps': reps}
+
+
+class ReconcileSessionExercisesTest(TestCase):
+    BENCH = _exercise('Bench Press', 60, 3, 10)
+    SQUAT = _exercise('Squat', 100, 5, 5)
+    ROW = _exercise('Barbell Row', 50, 3, 8)
+
+    # (name, existing rows, new extraction, expected counts)
+    CASES = [
+        ('unchanged', [BENCH, SQUAT], [BENCH, SQUAT],
+         {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 2}),
+        ('one set changed', [BENCH, SQUAT], [BENCH, _exercise('Squat', 100, 4, 5)],
+         {'inserted': 0, 'updated': 1, 'deleted': 0, 'unchanged': 1}),
+        ('exercise added', [BENCH], [BENCH, SQUAT],
+         {'inserted': 1, 'updated': 0, 'deleted': 0, 'unchanged': 1}),
+        ('exercise removed', [BENCH, SQUAT, ROW], [BENCH, ROW],
+         {'inserted': 0, 'updated': 0, 'deleted': 1, 'unchanged': 2}),
+        ('repeated exercise matched by position', [BENCH, _exercise('Bench Press', 70, 3, 8)],
+         [BENCH, _exercise('Bench Press', 75, 3, 8), _exercise('Bench Press', 80, 1, 3)],
+         {'inserted': 1, 'updated': 1, 'deleted': 0, 'unchanged': 1}),
+        ('empty session', [], [BENCH, SQUAT],
+         {'inserted': 2, 'updated': 0, 'deleted': 0, 'unchanged': 0}),
+    ]
+
+    def setUp(self):
+        self.user = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000004')
+
+    def test_reconcile(self):
+        for name, existing, extraction, counts in self.CASES:
+            with self.subTest(name):
+                session = WorkoutSession.objects.create(user=self.user)
+                Exercise.objects.bulk_create([Exercise(workout_session=session, **data) for data in existing])
+                kept_ids = set(Exercise.objects.filter(workout_session=session).values_list('id', flat=True))
+
+                self.assertEqual(ExerciseDAO.reconcile_session_exercises(session, extraction), counts)
+
+                rows = list(Exercise.objects.filter(workout_session=session).order_by('id'))
+                self.assertEqual(
+                    sorted((row.name, row.weights, row.sets, row.reps) for row in rows),
+                    sorted((e['name'], e['weights'], e['sets'], e['reps']) for e in extraction),
+                )
+                # Matched rows are updated in place rather than recreated
+                surviving = {row.id for row in rows} & kept_ids
+                self.assertEqual(len(surviving), counts['updated'] + counts['unchanged'])
+
+    def test_empty_extraction_keeps_rows(self):
+        session = WorkoutSession.objects.create(user=self.user)
+        Exercise.objects.create(workout_session=session, **self.BENCH)
+        counts = ExerciseDAO.reconcile_session_exercises(session, [])
+        self.assertEqual(counts, {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(Exercise.objects.filter(workout_session=session).count(), 1)
+
+
+class WebhookRetryTest(TestCase):
+    SID = 'SM00000000000000000000000000000001'
+
+    def setUp(self):
+        self.user = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000005', onboarding_state='completed')
+        self.session = WorkoutSession.objects.create(user=self.user)
+
+    def post(self, handler):
+        request = RequestFactory().post('/webhook/', {'Body': 'bench 3x10 60kg', 'From': self.user.phone_number,
+                                                      'MessageSid': self.SID})
+        with mock.patch.object(views, 'handle_message', handler):
+            return views.webhook(request)
+
+    def log_to_session(self, form_data, user, raw_message=None, deadline=None):
+        WorkoutSessionDAO.add_raw_message(self.session, raw_message)
+        response = MessagingResponse()
+        response.message().body('Logged')
+        return response
+
+    def fail_after_logging(self, *args, **kwargs):
+        self.log_to_session(*args, **kwargs)
+        raise RuntimeError('handling failed')
+
+    def test_failed_message_is_handled_again_on_the_same_row(self):
+        with self.assertRaises(RuntimeError):
+            self.post(self.fail_after_logging)
+        response = self.post(self.log_to_session)
+
+        self.assertIn(b'Logged', response.content)
+        messages = RawMessage.objects.filter(user=self.user, incoming=True)
+        self.assertEqual(messages.count(), 1)
+        self.assertEqual(messages.get().message_sid, self.SID)
+        self.assertEqual(self.session.raw_messages.count(), 1)
+
+    def test_retry_is_not_counted_again(self):
+        with self.assertRaises(RuntimeError):
+            self.post(self.fail_after_logging)
+        self.post(self.log_to_session)
+        fresh = WhatsAppUser.objects.get(id=self.user.id)
+        self.assertEqual(MessageCounterDAO.get_count(fresh), 1)
+
+    def test_answered_message_is_replayed(self):
+        first = self.post(self.log_to_session)
+        handler = mock.Mock()
+        self.assertEqual(self.post(handler).content, first.content)
+        handler.assert_not_called()
+
+    def test_message_in_flight_is_not_handled_twice(self):
+        RawMessageDAO.create_raw_message(self.user, 'bench 3x10 60kg', incoming=True, message_sid=self.SID, handling=True)
+        handler = mock.Mock()
+        self.assertEqual(self.post(handler).content, str(MessagingResponse()).encode())
+        handler.assert_not_called()
+
+    def test_abandoned_message_is_handled_again(self):
+        RawMessageDAO.create_raw_message(self.user, 'bench 3x10 60kg', incoming=True, message_sid=self.SID, handling=True)
+        RawMessage.objects.filter(message_sid=self.SID).update(
+            handling_started_at=timezone.now() - timedelta(seconds=views.ABANDONED_MESSAGE_SECONDS + 1))
+        self.assertIn(b'Logged', self.post(self.log_to_session).content)
+        self.assertEqual(RawMessage.objects.filter(user=self.user, incoming=True).count(), 1)
+
+
+class FakeBackend:
+    """Backend function that answers `result` after `delay` seconds, or raises `error`"""
+
+    def __init__(self, result=None, delay=0.0, error=None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.started_at = None
+        self.cancelled = False
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.started_at = time.monotonic()
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.result
+
+    async def acall(self, *args):
+        self.calls += 1
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.result
+
+
+@mock.patch.multiple(llm_router, LLM_ROUTER_MIN_CALLS=3, LLM_ROUTER_MAX_ERROR_RATE=0.5, LLM_ROUTER_COOLDOWN_SECONDS=30)
+class LLMRouterTest(SimpleTestCase):
+    def make_route(self, **backends):
+        route = llm_router.Route('test')
+        for name, backend in backends.items():
+            route.add(name, backend, backend.acall)
+        return route.use(list(backends))
+
+    def cool_down(self, backend):
+        backend.opened_at -= llm_router.LLM_ROUTER_COOLDOWN_SECONDS + 1
+
+    def test_failover_to_next_backend(self):
+        primary, fallback = FakeBackend(error=RuntimeError('down')), FakeBackend('fallback')
+        route = self.make_route(primary=primary, fallback=fallback)
+        self.assertEqual(route('message'), 'fallback')
+        self.assertEqual(asyncio.run(route.acall('message')), 'fallback')
+        self.assertEqual((primary.calls, fallback.calls), (2, 2))
+
+    def test_no_backend_available(self):
+        route = self.make_route(primary=FakeBackend(error=RuntimeError('down')), fallback=FakeBackend(error=ValueError('bad')))
+        with self.assertRaises(llm_router.NoBackendAvailable):
+            route('message')
+
+    def test_circuit_opens_after_failures(self):
+        primary, fallback = FakeBackend(error=RuntimeError('down')), FakeBackend('fallback')
+        route = self.make_route(primary=primary, fallback=fallback)
+        for _ in range(3):
+            route('message')
+        self.assertEqual(route.backends['primary'].state, llm_router.OPEN)
+        self.assertEqual(route.preferred(), 'fallback')
+        # Open: calls skip the primary without trying it
+        self.assertEqual(route('message'), 'fallback')
+        self.assertEqual(primary.calls, 3)
+
+    def test_slow_backend_opens_circuit(self):
+        route = llm_router.Route('test', slow_seconds=0.01).add('primary', FakeBackend('slow', delay=0.02)).use(['primary'])
+        for _ in range(3):
+            route('message')
+        self.assertEqual(route.backends['primary'].state, llm_router.OPEN)
+
+    def test_half_open_probe(self):
+        # (probe outcome, circuit state after the probe)
+        cases = [(FakeBackend('ok'), llm_router.CLOSED), (FakeBackend(error=RuntimeError('down')), llm_router.OPEN)]
+        for probe, expected in cases:
+            with self.subTest(expected=expected):
+                fallback = FakeBackend('fallback')
+                route = self.make_route(primary=probe, fallback=fallback)
+                backend = route.backends['primary']
+                backend._open('test')
+                self.assertFalse(backend.acquire())
+                self.cool_down(backend)
+
+                route('message')
+
+                self.assertEqual(probe.calls, 1)
+                self.assertEqual(backend.state, expected)
+                # Only the probe gets through until the circuit closes
+                route('message')
+                self.assertEqual(probe.calls, 2 if expected == llm_router.CLOSED else 1)
+
+    def test_deadline_is_not_counted_against_backend(self):
+        primary, fallback = FakeBackend(error=TimeoutError('timed out'), delay=0.1), FakeBackend('fallback')
+        route = self.make_route(primary=primary, fallback=fallback)
+        with Deadline(0.05).activate():
+            with self.assertRaises(DeadlineExceeded):
+                route('message')
+        time.sleep(0.1)  # let the abandoned call finish on its thread
+        stats = route.backends['primary'].stats()
+        self.assertEqual((stats['state'], stats['error_rate']), (llm_router.CLOSED, 0.0))
+        self.assertEqual(fallback.calls, 0)
+
+    def test_async_deadline_is_not_counted_against_backend(self):
+        primary, fallback = FakeBackend('late', delay=1), FakeBackend('fallback')
+        route = self.make_route(primary=primary, fallback=fallback)
+
+        async def call():
+            with Deadline(0.05).activate():
+                await route.acall('message')
+
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(call())
+        self.assertTrue(primary.cancelled)
+        self.assertEqual(route.backends['primary'].stats()['error_rate'], 0.0)
+        self.assertEqual(fallback.calls, 0)
+
+    def test_expired_deadline_tries_no_backend(self):
+        primary = FakeBackend('ok')
+        route = self.make_route(primary=primary)
+        deadline = Deadline(0)
+        with deadline.activate(), self.assertRaises(DeadlineExceeded):
+            route('message')
+        self.assertEqual(primary.calls, 0)
+
+
+@mock.patch.multiple(llm_router, LLM_HEDGING_ENABLED=True, LLM_ROUTER_MIN_CALLS=3, LLM_HEDGE_MIN_DELAY_SECONDS=0.05)
+class LLMHedgingTest(SimpleTestCase):
+    def make_route(self, primary, alternate):
+        route = llm_router.Route('test', hedge=True)
+        route.add('primary', primary, primary.acall).add('alternate', alternate, alternate.acall).use(['primary', 'alternate'])
+        # Known fast calls, so the primary hedges after the minimum delay
+        route.backends['primary'].calls.extend([(0.01, True)] * 3)
+        return route
+
+    def hedge_counts(self, route):
+        stats = route.hedge_stats()
+        return stats['calls'], stats['hedged'], stats['hedge_wins']
+
+    def test_no_hedge_delay_until_enough_calls(self):
+        backend = llm_router.Backend('test', 'primary', FakeBackend())
+        self.assertIsNone(backend.hedge_delay())
+        backend.calls.extend([(0.01, True)] * 3)
+        self.assertEqual(backend.hedge_delay(), 0.05)
+
+    def test_slow_call_is_hedged(self):
+        primary, alternate = FakeBackend('slow', delay=0.5), FakeBackend('fast')
+        route = self.make_route(primary, alternate)
+        started = time.monotonic()
+        self.assertEqual(route('message'), 'fast')
+        self.assertGreaterEqual(alternate.started_at - started, 0.05)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.hedge_counts(route), (1, 1, 1))
+
+    def test_fast_call_is_not_hedged(self):
+        primary, alternate = FakeBackend('fast'), FakeBackend('alternate')
+        route = self.make_route(primary, alternate)
+        self.assertEqual(route('message'), 'fast')
+        self.assertEqual(alternate.calls, 0)
+        self.assertEqual(self.hedge_counts(route), (1, 0, 0))
+
+    def test_primary_answering_first_after_hedge(self):
+        primary, alternate = FakeBackend('primary', delay=0.1), FakeBackend('alternate', delay=0.5)
+        route = self.make_route(primary, alternate)
+        self.assertEqual(route('message'), 'primary')
+        self.assertEqual(self.hedge_counts(route), (1, 1, 0))
+
+    def test_hedging_disabled(self):
+        primary, alternate = FakeBackend('slow', delay=0.1), FakeBackend('fast')
+        route = self.make_route(primary, alternate)
+        with mock.patch.object(llm_router, 'LLM_HEDGING_ENABLED', False):
+            self.assertEqual(route('message'), 'slow')
+        self.assertEqual(alternate.calls, 0)
+
+    def test_async_hedge_cancels_loser(self):
+        primary, alternate = FakeBackend('slow', delay=1), FakeBackend('fast')
+        route = self.make_route(primary, alternate)
+
+        async def call():
+            started = time.monotonic()
+            result = await route.acall('message')
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(0.01)  # let the cancelled loser run its handler
+            return result, elapsed
+
+        result, elapsed = asyncio.run(call())
+        self.assertEqual(result, 'fast')
+        self.assertLess(elapsed, 1)
+        self.assertTrue(primary.cancelled)
+        self.assertFalse(alternate.cancelled)
+        self.assertEqual(self.hedge_counts(route), (1, 1, 1))
+
+
+class MessageQueueTest(TestCase):
+    def setUp(self):
+        self.user = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000006')
+        self.other_user = WhatsAppUser.objects.create(phone_number='whatsapp:+10000000007')
+        self.created_at = timezone.now() - timedelta(minutes=10)
+
+    def enqueue(self, user, message='bench 3x10 60kg'):
+        raw_message = RawMessage.objects.create(user=user, message=message, incoming=True)
+        job = MessageJobDAO.enqueue(raw_message, {'Body': message, 'From': user.phone_number})
+        # Distinct creation times, so the order of the jobs is well defined
+        self.created_at += timedelta(seconds=1)
+        MessageJob.objects.filter(id=job.id).update(created_at=self.created_at)
+        return job
+
+    def claimed_ids(self, limit=5):
+        return [job.id for job in MessageJobDAO.claim_batch(limit)]
+
+    def test_claims_oldest_job_of_each_user(self):
+        first, second = self.enqueue(self.user), self.enqueue(self.user)
+        other = self.enqueue(self.other_user)
+
+        self.assertEqual(self.claimed_ids(), [first.id, other.id])
+        # The user's next job waits until the one in progress is done
+        self.assertEqual(self.claimed_ids(), [])
+        MessageJobDAO.mark_done(MessageJob.objects.get(id=first.id))
+        self.assertEqual(self.claimed_ids(), [second.id])
+
+    def test_claim_sets_lock_and_attempts(self):
+        job = self.enqueue(self.user)
+        claimed, = MessageJobDAO.claim_batch(5)
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (job.id, 'processing', 1))
+        self.assertIsNotNone(claimed.locked_at)
+        self.assertEqual(claimed.raw_message.user, self.user)
+
+    def test_claim_respects_limit(self):
+        jobs = [self.enqueue(self.user), self.enqueue(self.other_user)]
+        self.assertEqual(self.claimed_ids(limit=1), [jobs[0].id])
+
+    def test_stale_lock_is_reclaimed(self):
+        job = self.enqueue(self.user)
+        self.assertEqual(self.claimed_ids(), [job.id])
+        self.assertEqual(self.claimed_ids(), [])
+
+        MessageJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(seconds=MESSAGE_QUEUE_STALE_LOCK_SECONDS + 1))
+
+        self.assertEqual(self.claimed_ids(), [job.id])
+        self.assertEqual(MessageJob.objects.get(id=job.id).attempts, 2)
+
+    @mock.patch('whatsapp_bot.dao.message_job_dao.MESSAGE_QUEUE_MAX_ATTEMPTS', 2)
+    def test_failed_job_is_retried_until_max_attempts(self):
+        job = self.enqueue(self.user)
+        for expected in ['pending', 'failed']:
+            claimed, = MessageJobDAO.claim_batch(5)
+            MessageJobDAO.mark_failed(claimed, 'twilio down')
+            self.assertEqual(MessageJob.objects.get(id=job.id).status, expected)
+        self.assertEqual(self.claimed_ids(), [])
+
+    def test_retry_only_delivers_unsent_replies(self):
+        job = self.enqueue(self.user)
+        handled, sent, failures = [], [], ['two']
+
+        def handle(payload, user, raw_message=None):
+            handled.append(payload)
+            response = MessagingResponse()
+            for text in ['one', 'two', 'three']:
+                response.message().body(text)
+            return response
+
+        def create(body, **kwargs):
+            if body in failures:
+                failures.remove(body)
+                raise RuntimeError('twilio down')
+            sent.append(body)
+
+        client = mock.Mock(messages=mock.Mock(create=create))
+        with mock.patch.object(message_queue, 'handle_message', handle), \
+                mock.patch.object(message_queue.twilio_client, 'client', client), \
+                mock.patch.object(message_queue, 'close_old_connections'):
+            results = [message_queue.process_job(claimed) for _ in range(2) for claimed in MessageJobDAO.claim_batch(5)]
+
+        self.assertEqual(results, [False, True])
+        self.assertEqual(len(handled), 1)
+        self.assertEqual(sent, ['one', 'two', 'three'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.messages_sent), ('done', 2, 3))
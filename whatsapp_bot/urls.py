@@ -1,10 +1,11 @@
 from django.urls import path
 from . import views
+from .utils.config import ASGI_MODE
 
 app_name = 'whatsapp_bot'
 
 urlpatterns = [
-    path('webhook/', views.webhook, name='webhook'),
+    path('webhook/', views.async_webhook if ASGI_MODE else views.webhook, name='webhook'),
     path('payments/dodo/', views.create_payment, name='create_payment'),
     path('payments/dodo/webhook/', views.dodo_webhook, name='dodo_webhook'),
     path('health/', views.health_check, name='health_check'),
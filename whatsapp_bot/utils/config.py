@@ -45,6 +45,8 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 TWILIO_WHATSAPP_NUMBER = 'whatsapp:+12316255796' #'whatsapp:+14155238886'
+# Connect and read timeout of every Twilio API call
+TWILIO_TIMEOUT_SECONDS = float(os.getenv('TWILIO_TIMEOUT_SECONDS', '10'))
 
 
 ############################
@@ -60,4 +62,161 @@ WHATSAPP_ACTIVITY_TEMPLATE_SID = "HX924f53aed72555c48b8f5f402a615098"
 # Subscription Configuration
 ############################
 
-MAX_FREE_MESSAGES_PER_DAY = int(os.getenv('MAX_FREE_MESSAGES_PER_DAY', '3'))
\ No newline at end of file
+MAX_FREE_MESSAGES_PER_DAY = int(os.getenv('MAX_FREE_MESSAGES_PER_DAY', '3'))
+
+############################
+# Server Configuration
+############################
+
+# Serve the webhook from the async view (requires running under an ASGI worker)
+ASGI_MODE = os.getenv('ASGI_MODE', 'False').lower() == 'true'
+
+# Time budget of a webhook request (Twilio gives up on a webhook after 15s). LLM
+# calls get what is left of it, and a request out of time gets a canned reply.
+WEBHOOK_DEADLINE_SECONDS = float(os.getenv('WEBHOOK_DEADLINE_SECONDS', '12'))
+
+############################
+# Message Queue Configuration
+############################
+
+# When enabled, the webhook only stores the inbound message and acknowledges
+# Twilio immediately; replies are sent by the process_message_queue workers.
+WEBHOOK_QUEUE_MODE = os.getenv('WEBHOOK_QUEUE_MODE', 'False').lower() == 'true'
+MESSAGE_QUEUE_WORKERS = int(os.getenv('MESSAGE_QUEUE_WORKERS', '4'))
+MESSAGE_QUEUE_MAX_ATTEMPTS = int(os.getenv('MESSAGE_QUEUE_MAX_ATTEMPTS', '3'))
+MESSAGE_QUEUE_POLL_SECONDS = float(os.getenv('MESSAGE_QUEUE_POLL_SECONDS', '1'))
+MESSAGE_QUEUE_STALE_LOCK_SECONDS = int(os.getenv('MESSAGE_QUEUE_STALE_LOCK_SECONDS', '300'))
+
+
+############################
+# Outbox Configuration
+############################
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '10'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', '10'))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '0.5'))
+OUTBOX_STALE_LOCK_SECONDS = int(os.getenv('OUTBOX_STALE_LOCK_SECONDS', '120'))
+
+############################
+# Request Metrics Configuration
+############################
+
+# Per-request query count, SQL, LLM and Twilio timings (see whatsapp_bot.middleware)
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'False').lower() == 'true'
+
+# Budgets per URL name; a request over any limit is logged with its numbers
+DEFAULT_REQUEST_BUDGET = {
+    'queries': int(os.getenv('REQUEST_BUDGET_QUERIES', '30')),
+    'total_ms': float(os.getenv('REQUEST_BUDGET_MS', '1000')),
+}
+REQUEST_BUDGETS = {
+    'webhook': {'queries': 25, 'sql_ms': 200, 'total_ms': 8000},
+    'create_payment': {'queries': 10, 'sql_ms': 100, 'total_ms': 3000},
+    'dodo_webhook': {'queries': 10, 'sql_ms': 100, 'total_ms': 1000},
+    'fetch_workout_info': {'queries': 5, 'sql_ms': 200, 'total_ms': 1000},
+    'health_check': {'queries': 2, 'total_ms': 200},
+}
+
+############################
+# Intent Classification Configuration
+############################
+
+# Rule-based intents at or above this confidence skip the LLM classifier
+INTENT_RULES_MIN_CONFIDENCE = float(os.getenv('INTENT_RULES_MIN_CONFIDENCE', '0.9'))
+
+# Local n-gram model trained by `manage.py train_intent_model`; the LLM is only
+# asked when the model is missing or less confident than this
+INTENT_MODEL_PATH = os.getenv('INTENT_MODEL_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_services', 'artifacts', 'intent_model.npz'))
+INTENT_MODEL_MIN_CONFIDENCE = float(os.getenv('INTENT_MODEL_MIN_CONFIDENCE', '0.9'))
+
+############################
+# Workout Parsing Configuration
+############################
+
+# Parse workout logs in regular notation locally and send only the rest to Gemini
+WORKOUT_PARSER_ENABLED = os.getenv('WORKOUT_PARSER_ENABLED', 'True').lower() == 'true'
+
+############################
+# LLM Cache Configuration
+############################
+
+# Cache classification and extraction results by normalized input, model and prompt
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True').lower() == 'true'
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+
+# Entries kept in each process, and rows kept in the llm cache table
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+LLM_CACHE_MAX_ROWS = int(os.getenv('LLM_CACHE_MAX_ROWS', '200000'))
+
+# Parse only a session's new messages and add their exercises, instead of
+# re-parsing every message of the session each time one arrives
+INCREMENTAL_SESSION_PARSING = os.getenv('INCREMENTAL_SESSION_PARSING', 'True').lower() == 'true'
+
+# Send the leftover text of several pending sessions to Gemini in one request,
+# up to this many estimated input tokens and sessions per request
+WORKOUT_BATCH_EXTRACTION = os.getenv('WORKOUT_BATCH_EXTRACTION', 'True').lower() == 'true'
+WORKOUT_BATCH_MAX_TOKENS = int(os.getenv('WORKOUT_BATCH_MAX_TOKENS', '6000'))
+WORKOUT_BATCH_MAX_SESSIONS = int(os.getenv('WORKOUT_BATCH_MAX_SESSIONS', '20'))
+
+# Threads running the pending-workout cron's LLM extractions in parallel
+WORKOUT_EXTRACTION_WORKERS = int(os.getenv('WORKOUT_EXTRACTION_WORKERS', '4'))
+
+############################
+# Local LLM Configuration
+############################
+
+# Backend asked when rules and the local model aren't sure: 'ollama' (HTTP) or
+# 'llama_cpp' (the GGUF at LLAMA_MODEL_PATH, run inside each worker)
+INTENT_CLASSIFIER_BACKEND = os.getenv('INTENT_CLASSIFIER_BACKEND', 'ollama')
+
+LLAMA_MODEL_PATH = os.getenv('LLAMA_MODEL_PATH', '/models/Llama-3.2-1B-Instruct-Q4_K_L.gguf')
+LLAMA_N_CTX = int(os.getenv('LLAMA_N_CTX', '2048'))
+LLAMA_N_THREADS = int(os.getenv('LLAMA_N_THREADS')) if os.getenv('LLAMA_N_THREADS') else None
+# Tokens drafted per step by prompt-lookup speculative decoding
+LLAMA_PROMPT_LOOKUP_TOKENS = int(os.getenv('LLAMA_PROMPT_LOOKUP_TOKENS', '4'))
+LLAMA_CACHE_BYTES = int(os.getenv('LLAMA_CACHE_BYTES', str(256 << 20)))
+
+# Backend extracting workouts in the pending-workout cron: 'gemini', or 'llama_cpp'
+# (a GGUF model constrained to the response schema, in a pool of local processes)
+WORKOUT_EXTRACTION_BACKEND = os.getenv('WORKOUT_EXTRACTION_BACKEND', 'gemini')
+LLAMA_EXTRACTION_MODEL_PATH = os.getenv('LLAMA_EXTRACTION_MODEL_PATH', LLAMA_MODEL_PATH)
+LLAMA_EXTRACTION_N_CTX = int(os.getenv('LLAMA_EXTRACTION_N_CTX', '4096'))
+# Processes in the extraction pool, each with its own copy of the model's context
+WORKOUT_EXTRACTION_PROCESSES = int(os.getenv('WORKOUT_EXTRACTION_PROCESSES', '2'))
+# Threads per process; by default the cores are split between the processes
+LLAMA_EXTRACTION_THREADS = int(os.getenv('LLAMA_EXTRACTION_THREADS', str(max(1, (os.cpu_count() or 1) // WORKOUT_EXTRACTION_PROCESSES))))
+LLAMA_EXTRACTION_MAX_TOKENS = int(os.getenv('LLAMA_EXTRACTION_MAX_TOKENS', '1024'))
+LLAMA_EXTRACTION_TIMEOUT_SECONDS = int(os.getenv('LLAMA_EXTRACTION_TIMEOUT_SECONDS', '120'))
+
+############################
+# LLM Router Configuration
+############################
+
+# Timeout of a single LLM call, cut to the remaining budget during a webhook request
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '30'))
+
+# Backends each task fails over to, in order, when the ones before are failing
+# or slow (comma-separated, e.g. INTENT_CLASSIFIER_FALLBACKS=llama_cpp)
+INTENT_CLASSIFIER_FALLBACKS = [name.strip() for name in os.getenv('INTENT_CLASSIFIER_FALLBACKS', '').split(',') if name.strip()]
+WORKOUT_EXTRACTION_FALLBACKS = [name.strip() for name in os.getenv('WORKOUT_EXTRACTION_FALLBACKS', '').split(',') if name.strip()]
+
+# A backend's circuit opens when, over its last LLM_ROUTER_WINDOW calls (and at
+# least LLM_ROUTER_MIN_CALLS), the error rate or the median latency is over the
+# limit; it is tried again after LLM_ROUTER_COOLDOWN_SECONDS
+LLM_ROUTER_WINDOW = int(os.getenv('LLM_ROUTER_WINDOW', '50'))
+LLM_ROUTER_MIN_CALLS = int(os.getenv('LLM_ROUTER_MIN_CALLS', '5'))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv('LLM_ROUTER_MAX_ERROR_RATE', '0.5'))
+LLM_ROUTER_COOLDOWN_SECONDS = float(os.getenv('LLM_ROUTER_COOLDOWN_SECONDS', '30'))
+# Median latency over which the intent classifier skips a backend for its fallback
+LLM_ROUTER_SLOW_SECONDS = float(os.getenv('LLM_ROUTER_SLOW_SECONDS', '8'))
+
+# Hedge the webhook's LLM calls: when a call hasn't answered by its backend's
+# LLM_HEDGE_PERCENTILE latency (and at least LLM_HEDGE_MIN_DELAY_SECONDS), send a
+# duplicate to the route's next backend, or the same one, and take the first answer
+LLM_HEDGING_ENABLED = os.getenv('LLM_HEDGING_ENABLED', 'False').lower() == 'true'
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95'))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', '0.2'))
+# Threads running hedged calls, and calls bound by a request's deadline, from sync code
+LLM_ROUTER_WORKERS = int(os.getenv('LLM_ROUTER_WORKERS', '16'))
@@ -4,7 +4,7 @@ from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .dao.user_dao import UserDAO
-from .services.message_handler import handle_message
+from .services.message_handler import handle_message, ahandle_message
 from .services.payments import PaymentService
 from .utils.jwt_utils import verify_token
 from .models import PaymentHistory
@@ -14,41 +14,166 @@ from .utils.formatUtils import format_phone_number
 from standardwebhooks import Webhook
 from .utils.config import DODO_WEBHOOK_SECRET
 from .services.payments import handle_dodo_webhook
-from django.db import connection
+from django.db import connection, transaction, IntegrityError
+from django.utils import timezone
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from twilio.twiml.messaging_response import MessagingResponse
+from .dao.raw_message_dao import RawMessageDAO
+from .dao.message_job_dao import MessageJobDAO
+from .utils.config import WEBHOOK_QUEUE_MODE, WEBHOOK_DEADLINE_SECONDS
+from .services.deadline import Deadline, set_statement_timeout, reset_statement_timeout
 
 # Configure logging
 logger = logger_service.get_logger()
 
 
+# A message still without a response this long after its handling started was abandoned
+# by a worker that died while handling it
+ABANDONED_MESSAGE_SECONDS = WEBHOOK_DEADLINE_SECONDS * 2
+
+
+def replay_response(raw_message):
+    """
+    Response for a webhook retry of an already stored message.
+    If the original request is still being handled (or was queued) there is
+    nothing to replay yet, so an empty TwiML response is returned.
+    """
+    logger.info(f"Duplicate webhook for message {raw_message.id}, replaying stored response")
+    resp = raw_message.response or str(MessagingResponse())
+    return HttpResponse(resp, content_type='application/xml')
+
+
+def mark_handling_failed(raw_message) -> None:
+    """Let Twilio's retry of a message whose handling failed handle it again"""
+    try:
+        RawMessageDAO.mark_handling_failed(raw_message)
+    except Exception as e:
+        logger.error(f"Failed to mark message {raw_message.id} as failed: {str(e)}")
+
+
+def parse_webhook_form(request) -> dict:
+    form_data = {
+        "body": request.POST.get('Body'),
+        "from": request.POST.get('From'),
+        "num_media": request.POST.get('NumMedia', "0"),
+        "media_url": request.POST.get('MediaUrl0'),
+        "media_type": request.POST.get('MediaContentType0'),
+        "message_sid": request.POST.get('MessageSid')
+    }
+    logger.debug(f"Received form data: {json.dumps(form_data, indent=2)}")
+    return form_data
+
+
+def store_inbound_message(form_data: dict):
+    """
+    Store the inbound message of a webhook call
+    Returns:
+        (early_response, user, raw_message). early_response is set when the
+        request is already answered: a Twilio retry or a queued message.
+    """
+    # Twilio retries deliver the same MessageSid, replay the original response
+    message_sid = form_data['message_sid']
+    if message_sid:
+        duplicate = RawMessageDAO.get_by_message_sid(message_sid)
+        if duplicate:
+            abandoned_before = timezone.now() - timedelta(seconds=ABANDONED_MESSAGE_SECONDS)
+            if (duplicate.response is not None or duplicate.queued
+                    or not RawMessageDAO.claim_for_retry(duplicate, stale_before=abandoned_before)):
+                return replay_response(duplicate), None, None
+            # The original request failed or died without answering: handle the stored message again
+            logger.info(f"Webhook retry for unanswered message {duplicate.id}, handling it again")
+            return None, duplicate.user, duplicate
+
+    # Get or create user
+    phone_number = form_data['from']
+    user, created = UserDAO.get_or_create_user(phone_number)
+
+    try:
+        with transaction.atomic():
+            raw_message = RawMessageDAO.create_raw_message(
+                user=user,
+                message=form_data['body'] or '',
+                incoming=True,
+                message_sid=message_sid,
+                handling=not WEBHOOK_QUEUE_MODE
+            )
+            if WEBHOOK_QUEUE_MODE:
+                MessageJobDAO.enqueue(raw_message, form_data)
+    except IntegrityError:
+        # A concurrent retry stored this MessageSid first
+        return replay_response(RawMessageDAO.get_by_message_sid(message_sid)), None, None
+
+    if WEBHOOK_QUEUE_MODE:
+        # Acknowledge Twilio right away, replies are sent by the process_message_queue workers
+        return HttpResponse(str(MessagingResponse()), content_type='application/xml'), user, raw_message
+
+    return None, user, raw_message
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def webhook(request):
     logger.info("=== WEBHOOK ENDPOINT HIT ===")
+    deadline = Deadline(WEBHOOK_DEADLINE_SECONDS)
+    raw_message = None
 
     try:
-        # Get form data
-        form_data = {
-            "body": request.POST.get('Body'),
-            "from": request.POST.get('From'),
-            "num_media": request.POST.get('NumMedia', "0"),
-            "media_url": request.POST.get('MediaUrl0'),
-            "media_type": request.POST.get('MediaContentType0'),
-            "message_sid": request.POST.get('MessageSid')
-        }
-        logger.debug(f"Received form data: {json.dumps(form_data, indent=2)}")
-
-        # Get or create user
-        phone_number = form_data['from']
-        user, created = UserDAO.get_or_create_user(phone_number)
-
-        resp = handle_message(form_data, user)
+        form_data = parse_webhook_form(request)
+        early_response, user, raw_message = store_inbound_message(form_data)
+        if early_response:
+            return early_response
 
+        set_statement_timeout(deadline)
+        try:
+            with RawMessageDAO.buffer_outgoing():
+                resp = handle_message(form_data, user, raw_message=raw_message, deadline=deadline)
+        finally:
+            reset_statement_timeout()
+        RawMessageDAO.save_response(raw_message, str(resp))
 
         return HttpResponse(str(resp), content_type='application/xml')
     
     except Exception as e:
         logger.error(f"ERROR in webhook: {str(e)}")
         logger.error(f"Request data: {request.POST}")
+        if raw_message is not None:
+            mark_handling_failed(raw_message)
+        raise
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def async_webhook(request):
+    """
+    Async variant of webhook, served when the app runs under an ASGI worker.
+    LLM round trips are awaited instead of holding a worker thread.
+    """
+    logger.info("=== ASYNC WEBHOOK ENDPOINT HIT ===")
+    deadline = Deadline(WEBHOOK_DEADLINE_SECONDS)
+    raw_message = None
+
+    try:
+        form_data = parse_webhook_form(request)
+        early_response, user, raw_message = await sync_to_async(store_inbound_message)(form_data)
+        if early_response:
+            return early_response
+
+        await sync_to_async(set_statement_timeout)(deadline)
+        try:
+            async with RawMessageDAO.buffer_outgoing():
+                resp = await ahandle_message(form_data, user, raw_message=raw_message, deadline=deadline)
+        finally:
+            await sync_to_async(reset_statement_timeout)()
+        await sync_to_async(RawMessageDAO.save_response)(raw_message, str(resp))
+
+        return HttpResponse(str(resp), content_type='application/xml')
+
+    except Exception as e:
+        logger.error(f"ERROR in async webhook: {str(e)}")
+        logger.error(f"Request data: {request.POST}")
+        if raw_message is not None:
+            await sync_to_async(mark_handling_failed)(raw_message)
         raise
 
 
@@ -116,7 +241,8 @@ def create_payment(request):
 @require_http_methods(["POST"])
 def dodo_webhook(request):
     logger.info("=== DODO WEBHOOK HIT ===")
-    return handle_dodo_webhook(request)
+    with RawMessageDAO.buffer_outgoing():
+        return handle_dodo_webhook(request)
 
 
 @csrf_exempt